@@ -0,0 +1,399 @@
+"""
+Prueba de carga del ciclo de vida de un exhorto
+
+Cada ciclo hace en orden lo que haría un Poder Judicial exhortante:
+
+1. Recibir el exhorto con N archivos
+2. Recibir cada uno de los N archivos, con el último se obtiene el folio de seguimiento
+3. Consultar el exhorto con el folio de seguimiento
+4. Recibir la respuesta y su archivo
+5. Recibir una actualización
+6. Recibir una promoción y su archivo
+
+Los ciclos se inician a una tasa fija (ciclos por segundo) durante un tiempo, cada uno en un hilo,
+así que se traslapan. Si un paso falla el ciclo se interrumpe.
+
+Al terminar se muestra por endpoint la cantidad de peticiones, los errores, la latencia p50, p95 y p99
+y las peticiones por segundo, y se guarda en un archivo JSON en benchmarks/resultados para comparar
+entre versiones.
+
+Se ejecuta contra una API local que use un PostgreSQL local con las tablas y catálogos de Plataforma Web
+y un Google Cloud Storage falso, por ejemplo fake-gcs-server o gcp-storage-emulator, definiendo
+STORAGE_EMULATOR_HOST al arrancar la API. Toma del ambiente o del archivo .env las variables
+
+- API_KEY
+- API_BASE_URL, por defecto http://127.0.0.1:8000/api/v5
+- TIMEOUT, por defecto 10 segundos
+
+Ejemplos
+
+    python3 -m benchmarks.load --tasa 2 --duracion 60 --archivos 3
+    python3 -m benchmarks.load --comparar benchmarks/resultados/A.json benchmarks/resultados/B.json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import subprocess
+import threading
+import time
+import tomllib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import requests
+from dotenv import load_dotenv
+
+DIRECTORIO = Path(__file__).parent
+RESULTADOS_DIRECTORIO = DIRECTORIO / "resultados"
+
+load_dotenv()
+API_KEY = os.getenv("API_KEY", "")
+API_BASE_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:8000/api/v5").rstrip("/")
+TIMEOUT = int(os.getenv("TIMEOUT", "10"))
+
+# Cada hilo tiene su propia sesión para reutilizar las conexiones
+sesiones = threading.local()
+
+# Mediciones por endpoint, (segundos, código de estado o None si no hubo respuesta, éxito)
+mediciones: dict[str, list[tuple[float, int | None, bool]]] = {}
+mediciones_lock = threading.Lock()
+
+
+class MyLoadStepError(Exception):
+    """Un paso del ciclo falló, se interrumpe el ciclo"""
+
+
+def get_sesion() -> requests.Session:
+    """Entregar la sesión del hilo"""
+    if not hasattr(sesiones, "sesion"):
+        sesiones.sesion = requests.Session()
+        sesiones.sesion.headers["X-Api-Key"] = API_KEY
+    return sesiones.sesion
+
+
+def registrar(endpoint: str, segundos: float, codigo: int | None, exito: bool) -> None:
+    """Registrar una medición"""
+    with mediciones_lock:
+        mediciones.setdefault(endpoint, []).append((segundos, codigo, exito))
+
+
+def peticion(endpoint: str, metodo: str, ruta: str, **kwargs) -> dict:
+    """Hacer una petición, registrar su latencia y entregar el data, si falla se eleva MyLoadStepError"""
+    inicio = time.perf_counter()
+    try:
+        respuesta = get_sesion().request(metodo, f"{API_BASE_URL}{ruta}", timeout=TIMEOUT, **kwargs)
+    except requests.exceptions.RequestException as error:
+        registrar(endpoint, time.perf_counter() - inicio, None, False)
+        raise MyLoadStepError(f"{endpoint}: {error}") from error
+    segundos = time.perf_counter() - inicio
+
+    # Es éxito si el código es 200 y el contenido tiene success verdadero
+    try:
+        contenido = respuesta.json()
+    except ValueError:
+        contenido = {}
+    exito = respuesta.status_code == 200 and contenido.get("success") is True
+    registrar(endpoint, segundos, respuesta.status_code, exito)
+    if not exito:
+        raise MyLoadStepError(f"{endpoint}: {respuesta.status_code} {contenido.get('message', '')}")
+    return contenido.get("data") or {}
+
+
+def crear_persona(tipo_parte: int) -> dict:
+    """Crear una parte o promovente"""
+    return {
+        "nombre": "MARÍA JOSÉ",
+        "apellidoPaterno": "NÚÑEZ",
+        "apellidoMaterno": "PEÑA",
+        "genero": "F",
+        "esPersonaMoral": False,
+        "tipoParte": tipo_parte,
+        "tipoParteNombre": "Promovente" if tipo_parte == 0 else "",
+        "correoElectronico": "maria.nunez@correo.com",
+        "telefono": "8441234567",
+    }
+
+
+def ejecutar_ciclo(parametros: argparse.Namespace, contenido: bytes, hashes: dict, origen: dict) -> None:
+    """Ejecutar el ciclo de vida de un exhorto"""
+    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    exhorto_origen_id = uuid.uuid4().hex[:16]
+
+    # Recibir el exhorto
+    archivos = [
+        {"nombreArchivo": f"exhorto-{numero}.pdf", "tipoDocumento": 1, **hashes} for numero in range(parametros.archivos)
+    ]
+    peticion(
+        "POST /exh_exhortos/recibir",
+        "POST",
+        "/exh_exhortos/recibir",
+        json={
+            "exhortoOrigenId": exhorto_origen_id,
+            "municipioDestinoId": parametros.municipio_destino,
+            "materiaClave": parametros.materia,
+            "estadoOrigenId": origen["estado_id"],
+            "municipioOrigenId": origen["municipio_id"],
+            "juzgadoOrigenId": "EDO-J2-FAM",
+            "juzgadoOrigenNombre": "JUZGADO SEGUNDO DE PRIMERA INSTANCIA EN MATERIA FAMILIAR",
+            "numeroExpedienteOrigen": "123/2025",
+            "numeroOficioOrigen": "456/2025",
+            "tipoJuicioAsuntoDelitos": "DIVORCIO",
+            "juezExhortante": "JUAN PÉREZ LÓPEZ",
+            "partes": [crear_persona(1), crear_persona(2)],
+            "fojas": 41,
+            "diasResponder": 15,
+            "tipoDiligenciaId": parametros.tipo_diligencia,
+            "tipoDiligenciacionNombre": "OTROS",
+            "fechaOrigen": ahora,
+            "observaciones": "PRUEBA DE CARGA",
+            "archivos": archivos,
+            "promoventes": [crear_persona(0)],
+        },
+    )
+
+    # Recibir los archivos, con el último se obtiene el acuse con el folio de seguimiento
+    data = {}
+    for item in archivos:
+        data = peticion(
+            "POST /exh_exhortos/recibir_archivo",
+            "POST",
+            "/exh_exhortos/recibir_archivo",
+            data={"exhortoOrigenId": exhorto_origen_id},
+            files={"archivo": (item["nombreArchivo"], contenido, "application/pdf")},
+        )
+    folio_seguimiento = (data.get("acuse") or {}).get("folioSeguimiento")
+    if folio_seguimiento is None:
+        raise MyLoadStepError("POST /exh_exhortos/recibir_archivo: el último archivo no entregó el folio de seguimiento")
+
+    # Consultar el exhorto
+    peticion(
+        "GET /exh_exhortos/folio_seguimiento/{folio_seguimiento}",
+        "GET",
+        f"/exh_exhortos/folio_seguimiento/{folio_seguimiento}",
+    )
+
+    # Recibir la respuesta y su archivo
+    respuesta_origen_id = uuid.uuid4().hex[:16]
+    peticion(
+        "POST /exh_exhortos/recibir_respuesta",
+        "POST",
+        "/exh_exhortos/recibir_respuesta",
+        json={
+            "exhortoId": exhorto_origen_id,
+            "respuestaOrigenId": respuesta_origen_id,
+            "municipioTurnadoId": parametros.municipio_destino,
+            "areaTurnadoId": None,
+            "areaTurnadoNombre": "OFICIALÍA COMÚN DE PARTES",
+            "numeroExhorto": "1/2025",
+            "tipoDiligenciado": 2,
+            "observaciones": None,
+            "archivos": [{"nombreArchivo": "respuesta.pdf", "tipoDocumento": 1, **hashes}],
+            "videos": [],
+        },
+    )
+    peticion(
+        "POST /exh_exhortos/recibir_respuesta_archivo",
+        "POST",
+        "/exh_exhortos/recibir_respuesta_archivo",
+        data={"exhortoId": exhorto_origen_id, "respuestaOrigenId": respuesta_origen_id},
+        files={"archivo": ("respuesta.pdf", contenido, "application/pdf")},
+    )
+
+    # Recibir una actualización
+    peticion(
+        "POST /exh_exhortos/actualizar",
+        "POST",
+        "/exh_exhortos/actualizar",
+        json={
+            "exhortoId": exhorto_origen_id,
+            "actualizacionOrigenId": uuid.uuid4().hex[:16],
+            "tipoActualizacion": "AreaTurnado",
+            "fechaHora": ahora,
+            "descripcion": "PRUEBA DE CARGA",
+        },
+    )
+
+    # Recibir una promoción y su archivo
+    folio_origen_promocion = uuid.uuid4().hex[:16]
+    peticion(
+        "POST /exh_exhortos/recibir_promocion",
+        "POST",
+        "/exh_exhortos/recibir_promocion",
+        json={
+            "folioSeguimiento": folio_seguimiento,
+            "folioOrigenPromocion": folio_origen_promocion,
+            "promoventes": [crear_persona(0)],
+            "fojas": 1,
+            "fechaOrigen": ahora,
+            "observaciones": None,
+            "archivos": [{"nombreArchivo": "promocion.pdf", "tipoDocumento": 1, **hashes}],
+        },
+    )
+    peticion(
+        "POST /exh_exhortos/recibir_promocion_archivo",
+        "POST",
+        "/exh_exhortos/recibir_promocion_archivo",
+        data={"folioSeguimiento": folio_seguimiento, "folioOrigenPromocion": folio_origen_promocion},
+        files={"archivo": ("promocion.pdf", contenido, "application/pdf")},
+    )
+
+
+def consultar_origen() -> dict:
+    """Elegir el primer estado y su primer municipio como origen de los exhortos"""
+    estados = peticion("GET /estados", "GET", "/estados")
+    estado = estados["items"][0] if isinstance(estados, dict) else estados[0]
+    municipios = peticion("GET /municipios/{estado_clave}", "GET", f"/municipios/{estado['clave']}")
+    municipio = municipios["items"][0] if isinstance(municipios, dict) else municipios[0]
+    return {"estado_id": int(estado["clave"]), "municipio_id": int(municipio["clave"])}
+
+
+def percentil(valores: list[float], porcentaje: float) -> float:
+    """Percentil por rango más cercano, los valores deben estar ordenados"""
+    if not valores:
+        return 0.0
+    return valores[max(0, math.ceil(porcentaje / 100 * len(valores)) - 1)]
+
+
+def resumir(duracion: float) -> dict:
+    """Resumir las mediciones por endpoint, las latencias en milisegundos"""
+    resumen = {}
+    for endpoint, registros in mediciones.items():
+        latencias = sorted(segundos * 1000 for segundos, _, _ in registros)
+        codigos = {}
+        for _, codigo, exito in registros:
+            if not exito:
+                codigos[str(codigo)] = codigos.get(str(codigo), 0) + 1
+        resumen[endpoint] = {
+            "peticiones": len(registros),
+            "errores": sum(codigos.values()),
+            "errores_por_codigo": codigos,
+            "p50_ms": round(percentil(latencias, 50), 2),
+            "p95_ms": round(percentil(latencias, 95), 2),
+            "p99_ms": round(percentil(latencias, 99), 2),
+            "peticiones_por_segundo": round(len(registros) / duracion, 2),
+        }
+    return resumen
+
+
+def mostrar(resumen: dict) -> None:
+    """Mostrar el resumen como tabla"""
+    print(f"{'Endpoint':<58} {'Peticiones':>10} {'Errores':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'Pet/s':>7}")
+    for endpoint, datos in resumen.items():
+        print(
+            f"{endpoint:<58} {datos['peticiones']:>10} {datos['errores']:>8} "
+            f"{datos['p50_ms']:>7.1f}ms {datos['p95_ms']:>7.1f}ms {datos['p99_ms']:>7.1f}ms {datos['peticiones_por_segundo']:>7.2f}"
+        )
+
+
+def get_version() -> str:
+    """Versión del pyproject.toml y commit de git si se puede obtener"""
+    with open(DIRECTORIO.parent / "pyproject.toml", "rb") as archivo:
+        version = tomllib.load(archivo)["project"]["version"]
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, check=True, cwd=DIRECTORIO, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return version
+    return f"{version}-{commit}"
+
+
+def comparar(anterior_ruta: str, actual_ruta: str) -> None:
+    """Comparar dos resultados guardados, la diferencia es porcentual contra el anterior"""
+    with open(anterior_ruta, encoding="utf-8") as archivo:
+        anterior = json.load(archivo)
+    with open(actual_ruta, encoding="utf-8") as archivo:
+        actual = json.load(archivo)
+    print(f"Anterior {anterior['version']} {anterior['fecha']}")
+    print(f"Actual   {actual['version']} {actual['fecha']}")
+    print(f"{'Endpoint':<58} {'p50':>17} {'p95':>17} {'p99':>17} {'Errores':>12}")
+    for endpoint, datos in actual["endpoints"].items():
+        previos = anterior["endpoints"].get(endpoint)
+        if previos is None:
+            continue
+        columnas = []
+        for llave in ("p50_ms", "p95_ms", "p99_ms"):
+            cambio = (datos[llave] - previos[llave]) / previos[llave] * 100 if previos[llave] else 0.0
+            columnas.append(f"{datos[llave]:>7.1f}ms {cambio:>+6.1f}%")
+        print(f"{endpoint:<58} {' '.join(columnas)} {previos['errores']:>5} -> {datos['errores']:<4}")
+
+
+def main():
+    """Ejecutar la prueba de carga"""
+    parser = argparse.ArgumentParser(description="Prueba de carga del ciclo de vida de un exhorto")
+    parser.add_argument("--tasa", type=float, default=1.0, help="ciclos que se inician por segundo")
+    parser.add_argument("--duracion", type=float, default=30.0, help="segundos durante los que se inician ciclos")
+    parser.add_argument("--concurrencia", type=int, default=32, help="máximo de ciclos simultáneos")
+    parser.add_argument("--archivos", type=int, default=2, help="archivos por exhorto")
+    parser.add_argument("--tamano", type=int, default=512, help="tamaño de cada archivo en KiB")
+    parser.add_argument("--municipio-destino", type=int, default=30, help="ID del municipio destino en el estado de la API")
+    parser.add_argument("--materia", default="CIV", help="clave de la materia")
+    parser.add_argument("--tipo-diligencia", default="OTR", help="clave del tipo de diligencia")
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTERIOR", "ACTUAL"), help="comparar dos resultados guardados")
+    parametros = parser.parse_args()
+
+    # Si se piden comparar resultados, no se ejecuta la prueba
+    if parametros.comparar:
+        comparar(*parametros.comparar)
+        return
+    if API_KEY == "":
+        parser.error("Falta la variable de entorno API_KEY")
+
+    # Preparar el contenido de los archivos, es el mismo para todos
+    contenido = b"%PDF-1.4\n" + os.urandom(parametros.tamano * 1024)
+    hashes = {"hashSha1": hashlib.sha1(contenido).hexdigest(), "hashSha256": hashlib.sha256(contenido).hexdigest()}
+    origen = consultar_origen()
+    mediciones.clear()
+
+    # Iniciar los ciclos a la tasa pedida
+    errores = []
+    inicio = time.perf_counter()
+    cantidad = int(parametros.tasa * parametros.duracion)
+    with ThreadPoolExecutor(max_workers=parametros.concurrencia) as executor:
+        futuros = []
+        for numero in range(cantidad):
+            espera = inicio + numero / parametros.tasa - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            futuros.append(executor.submit(ejecutar_ciclo, parametros, contenido, hashes, origen))
+        for futuro in futuros:
+            try:
+                futuro.result()
+            except MyLoadStepError as error:
+                errores.append(str(error))
+    duracion = time.perf_counter() - inicio
+
+    # Mostrar y guardar los resultados
+    resumen = resumir(duracion)
+    mostrar(resumen)
+    print(f"Ciclos {cantidad - len(errores)} de {cantidad} completos en {duracion:.1f} s")
+    for error in sorted(set(errores))[:10]:
+        print(f"  {error}")
+    resultado = {
+        "version": get_version(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "api_base_url": API_BASE_URL,
+        "parametros": {llave: valor for llave, valor in vars(parametros).items() if llave not in ("salida", "comparar")},
+        "duracion_s": round(duracion, 2),
+        "ciclos": cantidad,
+        "ciclos_completos": cantidad - len(errores),
+        "endpoints": resumen,
+    }
+    if parametros.salida:
+        salida = Path(parametros.salida)
+    else:
+        RESULTADOS_DIRECTORIO.mkdir(exist_ok=True)
+        salida = RESULTADOS_DIRECTORIO / f"{resultado['version']}-{datetime.now():%Y%m%d%H%M%S}.json"
+    with open(salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Medir las funciones safe_string
+
+Cada caso es una llamada como las que hacen las rutas al recibir exhortos, respuestas y promociones,
+con nombres reales de juzgados, partes y áreas. Se mide con la memoria de la transliteración
+que conserva la ñ (caliente, los nombres se repiten entre peticiones) y vaciándola en cada pasada (fría).
+
+No necesita la base de datos
+
+    python3 -m benchmarks.safe_string
+"""
+
+import time
+
+from pjecz_carina_api_key.dependencies import safe_string as modulo
+from pjecz_carina_api_key.dependencies.safe_string import safe_clave, safe_email, safe_string, safe_telefono
+
+REPETICIONES = 2000
+
+JUZGADOS = [
+    "Juzgado Primero de Primera Instancia en Materia Civil del Distrito Judicial de Saltillo",
+    "JUZGADO SEGUNDO DE PRIMERA INSTANCIA EN MATERIA FAMILIAR DEL DISTRITO JUDICIAL DE TORREÓN",
+    "Juzgado Tercero Auxiliar de Primera Instancia en Materia Mercantil de Monclova",
+    "Tribunal Distrital del Distrito Judicial de Río Grande, con residencia en Piedras Negras",
+    "Juzgado de Primera Instancia en Materia Penal del Sistema Acusatorio y Oral de Parras de la Fuente",
+    "Oficialía Común de Partes de los Juzgados Civiles y Familiares de San Pedro de las Colonias",
+]
+
+NOMBRES = ["María José", "Peña", "Muñoz", "Núñez Ibáñez", "José Ángel", "Zúñiga", "López", "Ñañez", "Gómez Farías"]
+
+OBSERVACIONES = (
+    "Se remite el exhorto para que en auxilio de las labores de este juzgado se sirva emplazar a la parte demandada "
+    "en el domicilio ubicado en calle Niños Héroes número 123, colonia Año de Juárez, y se le corra traslado. "
+) * 3
+
+CASOS = {
+    "safe_string(nombre, save_enie=True)": lambda: [safe_string(nombre, save_enie=True) for nombre in NOMBRES],
+    "safe_string(juzgado)": lambda: [safe_string(juzgado) for juzgado in JUZGADOS],
+    "safe_string(juzgado, save_enie=True)": lambda: [safe_string(juzgado, save_enie=True) for juzgado in JUZGADOS],
+    "safe_string(observaciones, save_enie=True)": lambda: safe_string(OBSERVACIONES, save_enie=True, max_len=1000),
+    "safe_string(folio, max_len=64)": lambda: safe_string(
+        "c8f1f9a2-9e2a-4a0b-8f5e-1a2b3c4d5e6f", max_len=64, do_unidecode=True, to_uppercase=False
+    ),
+    "safe_string(juzgado, do_unidecode=False)": lambda: [safe_string(juzgado, do_unidecode=False) for juzgado in JUZGADOS],
+    "safe_clave(clave)": lambda: [safe_clave(clave) for clave in ("SLT-OCP", "trc ocp", "05", "Área-1")],
+    "safe_email(correo)": lambda: safe_email(" Juana.Perez@Correo.com "),
+    "safe_telefono(telefono)": lambda: safe_telefono("(844) 123-4567"),
+}
+
+
+def vaciar_memoria():
+    """Vaciar la memoria de la transliteración, si existe"""
+    for nombre in dir(modulo):
+        cache_clear = getattr(getattr(modulo, nombre), "cache_clear", None)
+        if cache_clear is not None:
+            cache_clear()
+
+
+def medir(funcion, fria: bool) -> float:
+    """Promedio en microsegundos"""
+    transcurrido = 0.0
+    for _ in range(REPETICIONES):
+        if fria:
+            vaciar_memoria()
+        inicio = time.perf_counter()
+        funcion()
+        transcurrido += time.perf_counter() - inicio
+    return transcurrido / REPETICIONES * 1_000_000
+
+
+def main():
+    """Medir y mostrar los tiempos"""
+    print(f"{'Caso':<46} {'Caliente':>10} {'Fría':>10}")
+    for nombre, funcion in CASOS.items():
+        caliente_us = medir(funcion, fria=False)
+        fria_us = medir(funcion, fria=True)
+        print(f"{nombre:<46} {caliente_us:>8.1f}us {fria_us:>8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
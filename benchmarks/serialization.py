@@ -0,0 +1,126 @@
+"""
+Medir la serialización JSON por endpoint
+
+Para cada respuesta representativa se mide lo que hace FastAPI después de la ruta:
+validar y convertir con el response_model (serialize_response) y convertir a bytes con
+JSONResponse (antes) o con ORJSONResponse (ahora, la clase por defecto de la app).
+
+No necesita la base de datos, los datos son sintéticos
+
+    python3 -m benchmarks.serialization
+"""
+
+import asyncio
+import time
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from pjecz_carina_api_key.dependencies.fastapi_pagination_custom_list import CustomList
+from pjecz_carina_api_key.schemas.estados import EstadoOut
+from pjecz_carina_api_key.schemas.exh_exhortos import OneExhExhortoConsultaOut
+from pjecz_carina_api_key.schemas.municipios import MunicipioOut
+
+REPETICIONES = 500
+
+
+def listado_municipios() -> dict:
+    """Listado de 300 municipios"""
+    data = [
+        {"clave": str(numero).zfill(3), "nombre": f"MUNICIPIO {numero}", "estado_clave": "05", "estado_nombre": "COAHUILA"}
+        for numero in range(1, 301)
+    ]
+    return {"success": True, "message": "Success", "errors": [], "data": data}
+
+
+def listado_estados() -> dict:
+    """Listado de 32 estados"""
+    data = [{"clave": str(numero).zfill(2), "nombre": f"ESTADO {numero}"} for numero in range(1, 33)]
+    return {"success": True, "message": "Success", "errors": [], "data": data}
+
+
+def consultar_exhorto() -> dict:
+    """Consulta de un exhorto con 10 partes y 20 archivos"""
+    parte = {
+        "nombre": "JUANA",
+        "apellidoPaterno": "PÉREZ",
+        "apellidoMaterno": "LÓPEZ",
+        "genero": "F",
+        "esPersonaMoral": False,
+        "tipoParte": 1,
+        "tipoParteNombre": "",
+        "correoElectronico": "juana@correo.com",
+        "telefono": "8441234567",
+    }
+    archivo = {"nombreArchivo": "documento.pdf", "hashSha1": "a" * 40, "hashSha256": "b" * 64, "tipoDocumento": 1}
+    data = {
+        "exhortoOrigenId": "ABCDEF1234567890",
+        "folioSeguimiento": "c8f1f9a2-9e2a-4a0b-8f5e-1a2b3c4d5e6f",
+        "estadoDestinoId": 5,
+        "estadoDestinoNombre": "COAHUILA DE ZARAGOZA",
+        "municipioDestinoId": 30,
+        "municipioDestinoNombre": "SALTILLO",
+        "materiaClave": "CIV",
+        "materiaNombre": "CIVIL",
+        "estadoOrigenId": 19,
+        "estadoOrigenNombre": "NUEVO LEÓN",
+        "municipioOrigenId": 39,
+        "municipioOrigenNombre": "MONTERREY",
+        "juzgadoOrigenId": "J1",
+        "juzgadoOrigenNombre": "JUZGADO PRIMERO CIVIL",
+        "numeroExpedienteOrigen": "123/2024",
+        "numeroOficioOrigen": "456/2024",
+        "tipoJuicioAsuntoDelitos": "DIVORCIO",
+        "juezExhortante": "JUEZ",
+        "partes": [parte] * 10,
+        "fojas": 20,
+        "diasResponder": 15,
+        "tipoDiligenciacionNombre": "NOTIFICACIÓN",
+        "fechaOrigen": "2024-01-01 12:00:00",
+        "observaciones": "OBSERVACIONES " * 20,
+        "archivos": [archivo] * 20,
+        "fechaHoraRecepcion": "2024-01-02 12:00:00",
+        "municipioTurnadoId": 30,
+        "municipioTurnadoNombre": "SALTILLO",
+        "areaTurnadoId": "SLT-OCP",
+        "areaTurnadoNombre": "OFICIALÍA COMÚN DE PARTES",
+        "numeroExhorto": "1/2024",
+        "urlInfo": None,
+    }
+    return {"success": True, "message": "Success", "errors": [], "data": data}
+
+
+ENDPOINTS = {
+    "GET /api/v5/municipios/{estado_clave}": (CustomList[MunicipioOut], listado_municipios),
+    "GET /api/v5/estados": (CustomList[EstadoOut], listado_estados),
+    "GET /api/v5/exh_exhortos/{folio_seguimiento}": (OneExhExhortoConsultaOut, consultar_exhorto),
+}
+
+
+def medir(funcion) -> float:
+    """Promedio en microsegundos"""
+    inicio = time.perf_counter()
+    for _ in range(REPETICIONES):
+        funcion()
+    return (time.perf_counter() - inicio) / REPETICIONES * 1_000_000
+
+
+async def main():
+    """Medir y mostrar los tiempos"""
+    print(f"{'Endpoint':<46} {'Modelo':>10} {'JSONResponse':>13} {'ORJSONResponse':>15}")
+    for nombre, (modelo, crear) in ENDPOINTS.items():
+        field = create_model_field(name="Response", type_=modelo, mode="serialization")
+        resultado = modelo.model_validate(crear())
+        contenido = await serialize_response(field=field, response_content=resultado)
+        inicio = time.perf_counter()
+        for _ in range(REPETICIONES):
+            await serialize_response(field=field, response_content=resultado)
+        modelo_us = (time.perf_counter() - inicio) / REPETICIONES * 1_000_000
+        json_us = medir(lambda: JSONResponse(content=contenido))
+        orjson_us = medir(lambda: ORJSONResponse(content=contenido))
+        print(f"{nombre:<46} {modelo_us:>8.1f}us {json_us:>11.1f}us {orjson_us:>13.1f}us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
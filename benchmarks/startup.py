@@ -0,0 +1,60 @@
+"""
+Medir el arranque de un worker
+
+Mide en un proceso nuevo lo que paga cada arranque en frío:
+
+- Importación de la aplicación, sin contar la carga de los secretos
+- Carga de los secretos de Google Cloud Secret Manager, cero en modo local
+- Arranque del lifespan
+- Primera petición y segunda petición, para comparar
+
+Si se define la variable de entorno API_KEY también se mide una petición autenticada,
+que incluye la primera conexión a la base de datos.
+
+Ejecutar con las mismas variables de entorno que la API
+
+    python3 -m benchmarks.startup
+"""
+
+import os
+import time
+
+inicio = time.perf_counter()
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from pjecz_carina_api_key import settings  # noqa: E402
+from pjecz_carina_api_key.main import app  # noqa: E402
+
+importacion = time.perf_counter() - inicio
+
+
+def medir(client: TestClient, url: str, headers: dict) -> float:
+    """Medir una petición GET en segundos"""
+    inicio_peticion = time.perf_counter()
+    respuesta = client.get(url, headers=headers)
+    respuesta.raise_for_status()
+    return time.perf_counter() - inicio_peticion
+
+
+def main():
+    """Medir y mostrar los tiempos"""
+    tiempos = {
+        "Importación": importacion - settings.secrets_load_seconds,
+        "Carga de secretos": settings.secrets_load_seconds,
+    }
+    inicio_lifespan = time.perf_counter()
+    with TestClient(app) as client:
+        tiempos["Arranque del lifespan"] = time.perf_counter() - inicio_lifespan
+        tiempos["Primera petición"] = medir(client, "/", {})
+        tiempos["Segunda petición"] = medir(client, "/", {})
+        api_key = os.getenv("API_KEY", "")
+        if api_key != "":
+            tiempos["Primera petición autenticada"] = medir(client, "/api/v5/estados", {"X-Api-Key": api_key})
+            tiempos["Segunda petición autenticada"] = medir(client, "/api/v5/estados", {"X-Api-Key": api_key})
+    for nombre, segundos in tiempos.items():
+        print(f"{nombre:<36} {segundos * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
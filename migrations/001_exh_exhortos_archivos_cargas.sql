@@ -0,0 +1,22 @@
+-- Sesiones de carga reanudable de los archivos de los exhortos
+
+CREATE TABLE IF NOT EXISTS exh_exhortos_archivos_cargas (
+    id SERIAL NOT NULL,
+    exh_exhorto_archivo_id INTEGER NOT NULL,
+    tamano INTEGER,
+    recibido INTEGER NOT NULL DEFAULT 0,
+    partes VARCHAR(512)[] NOT NULL DEFAULT '{}',
+    estado VARCHAR(10) NOT NULL,
+    creado TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    modificado TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    estatus CHAR NOT NULL DEFAULT 'A',
+    PRIMARY KEY (id),
+    FOREIGN KEY (exh_exhorto_archivo_id) REFERENCES exh_exhortos_archivos (id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_exh_exhortos_archivos_cargas_exh_exhorto_archivo_id
+    ON exh_exhortos_archivos_cargas (exh_exhorto_archivo_id);
+
+-- Sesiones abiertas por antigüedad, para cancelar las vencidas
+CREATE INDEX IF NOT EXISTS ix_exh_exhortos_archivos_cargas_abiertas
+    ON exh_exhortos_archivos_cargas (creado) WHERE estado = 'ABIERTA';
@@ -0,0 +1,27 @@
+-- Índices para las consultas más frecuentes de la API
+--
+-- Se crean con CONCURRENTLY para no bloquear las escrituras de Plataforma Web,
+-- por eso no se deben ejecutar dentro de una transacción.
+-- Los parciales (WHERE estatus = 'A') solo incluyen los registros activos, que son los que se consultan.
+
+-- Exhortos por exhorto_origen_id y por folio_seguimiento
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exh_exhortos_exhorto_origen_id_activos
+    ON exh_exhortos (exhorto_origen_id) WHERE estatus = 'A';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exh_exhortos_folio_seguimiento_activos
+    ON exh_exhortos (folio_seguimiento) WHERE estatus = 'A';
+
+-- Respuestas por respuesta_origen_id y promociones por folio_origen_promocion
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exh_exhortos_respuestas_respuesta_origen_id_activos
+    ON exh_exhortos_respuestas (respuesta_origen_id) WHERE estatus = 'A';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exh_exhortos_promociones_folio_origen_promocion_activos
+    ON exh_exhortos_promociones (folio_origen_promocion) WHERE estatus = 'A';
+
+-- Partes y archivos por su exhorto, respuesta o promoción, los archivos también por su estado
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exh_exhortos_partes_exh_exhorto_id
+    ON exh_exhortos_partes (exh_exhorto_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exh_exhortos_archivos_exh_exhorto_id_estado
+    ON exh_exhortos_archivos (exh_exhorto_id, estado);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exh_exhortos_promociones_archivos_promocion_id_estado
+    ON exh_exhortos_promociones_archivos (exh_exhorto_promocion_id, estado);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exh_exhortos_respuestas_archivos_respuesta_id_estado
+    ON exh_exhortos_respuestas_archivos (exh_exhorto_respuesta_id, estado);
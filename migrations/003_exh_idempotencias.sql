@@ -0,0 +1,24 @@
+-- Respuestas de las recepciones (exhortos, respuestas, promociones y actualizaciones)
+-- para entregar la misma en los reintentos. La restricción única evita duplicados
+-- aunque dos reintentos lleguen al mismo tiempo, y su índice es el de la consulta.
+
+CREATE TABLE IF NOT EXISTS exh_idempotencias (
+    id SERIAL NOT NULL,
+    usuario_id INTEGER NOT NULL,
+    ruta VARCHAR(64) NOT NULL,
+    clave VARCHAR(256) NOT NULL,
+    idempotency_key VARCHAR(256),
+    peticion_hash VARCHAR(64) NOT NULL,
+    respuesta TEXT NOT NULL,
+    creado TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    modificado TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    estatus CHAR NOT NULL DEFAULT 'A',
+    PRIMARY KEY (id),
+    FOREIGN KEY (usuario_id) REFERENCES usuarios (id),
+    CONSTRAINT uq_exh_idempotencias_usuario_id_ruta_clave UNIQUE (usuario_id, ruta, clave)
+);
+
+-- Para depurar las respuestas viejas, por ejemplo
+-- DELETE FROM exh_idempotencias WHERE creado < now() - interval '90 days';
+CREATE INDEX IF NOT EXISTS ix_exh_idempotencias_creado
+    ON exh_idempotencias (creado);
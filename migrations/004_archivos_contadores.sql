@@ -0,0 +1,20 @@
+-- Contadores de los archivos pendientes y recibidos de los exhortos, las respuestas y las promociones,
+-- se actualizan en la misma sentencia que marca cada archivo como RECIBIDO.
+-- No tienen valor por defecto, así los registros que ya existen y los que cree la versión anterior
+-- mientras se despliega quedan nulos, y la API los cuenta y corrige al recibir su primer archivo.
+-- Se puede volver a ejecutar.
+
+ALTER TABLE exh_exhortos ADD COLUMN IF NOT EXISTS archivos_pendientes INTEGER;
+ALTER TABLE exh_exhortos ADD COLUMN IF NOT EXISTS archivos_recibidos INTEGER;
+ALTER TABLE exh_exhortos_respuestas ADD COLUMN IF NOT EXISTS archivos_pendientes INTEGER;
+ALTER TABLE exh_exhortos_respuestas ADD COLUMN IF NOT EXISTS archivos_recibidos INTEGER;
+ALTER TABLE exh_exhortos_promociones ADD COLUMN IF NOT EXISTS archivos_pendientes INTEGER;
+ALTER TABLE exh_exhortos_promociones ADD COLUMN IF NOT EXISTS archivos_recibidos INTEGER;
+
+-- Quitar el valor por defecto de cero, con él un registro de la versión anterior parece no tener pendientes
+ALTER TABLE exh_exhortos ALTER COLUMN archivos_pendientes DROP NOT NULL, ALTER COLUMN archivos_pendientes DROP DEFAULT;
+ALTER TABLE exh_exhortos ALTER COLUMN archivos_recibidos DROP NOT NULL, ALTER COLUMN archivos_recibidos DROP DEFAULT;
+ALTER TABLE exh_exhortos_respuestas ALTER COLUMN archivos_pendientes DROP NOT NULL, ALTER COLUMN archivos_pendientes DROP DEFAULT;
+ALTER TABLE exh_exhortos_respuestas ALTER COLUMN archivos_recibidos DROP NOT NULL, ALTER COLUMN archivos_recibidos DROP DEFAULT;
+ALTER TABLE exh_exhortos_promociones ALTER COLUMN archivos_pendientes DROP NOT NULL, ALTER COLUMN archivos_pendientes DROP DEFAULT;
+ALTER TABLE exh_exhortos_promociones ALTER COLUMN archivos_recibidos DROP NOT NULL, ALTER COLUMN archivos_recibidos DROP DEFAULT;
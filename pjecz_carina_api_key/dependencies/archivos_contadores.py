@@ -0,0 +1,129 @@
+"""
+Archivos Contadores
+
+Los exhortos, las respuestas y las promociones llevan la cuenta de sus archivos en las columnas
+archivos_pendientes y archivos_recibidos. Al recibir archivos una sola sentencia los marca como RECIBIDOS,
+sólo si siguen PENDIENTES, y actualiza los contadores del padre entregando sus nuevos valores y los IDs
+de los archivos que sí marcó.
+Así se sabe si fue el último archivo sin consultar ni contar los demás, y si dos peticiones reciben
+el mismo archivo al mismo tiempo sólo una lo descuenta.
+
+Los registros que creó la versión anterior tienen los contadores nulos, si al recibir quedan nulos
+o negativos se cuentan los archivos en la misma transacción y se corrigen los contadores, para que
+el último archivo siempre entregue el folio o el acuse.
+
+El número de cada archivo para el nombre en Google Cloud Storage es su lugar en el orden en que se
+declararon, se calcula con row_number en la misma consulta que busca los archivos pendientes.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Integer, Select, String, column, func, select, update, values
+from sqlalchemy.orm import InstrumentedAttribute
+
+from .database import AsyncSession
+
+
+@dataclass
+class ArchivoRecibido:
+    """Archivo recibido, para marcarlo con update_archivos_recibidos"""
+
+    id: int
+    tamano: int
+    url: str | None
+
+
+def select_archivos_pendientes(
+    modelo: Any,
+    padre_columna: InstrumentedAttribute,
+    padre_id: int,
+    nombre_archivo: str | None = None,
+) -> Select:
+    """Consulta de los archivos PENDIENTES del padre con su número en el orden en que se declararon"""
+    numeros = (
+        select(modelo.id, func.row_number().over(order_by=modelo.id).label("numero"))
+        .where(padre_columna == padre_id)
+        .where(modelo.estatus == "A")
+        .subquery()
+    )
+    consulta = select(modelo, numeros.c.numero).join(numeros, numeros.c.id == modelo.id).where(modelo.estado == "PENDIENTE")
+    if nombre_archivo is not None:
+        consulta = consulta.where(modelo.nombre_archivo == nombre_archivo)
+    return consulta
+
+
+async def get_archivos_pendientes(
+    database: AsyncSession,
+    modelo: Any,
+    padre_columna: InstrumentedAttribute,
+    padre_id: int,
+    nombre_archivo: str | None = None,
+) -> dict[str, tuple[Any, int]]:
+    """Archivos PENDIENTES del padre por su nombre, con su número que no cambia aunque se reciban en otro orden"""
+    resultado = await database.execute(select_archivos_pendientes(modelo, padre_columna, padre_id, nombre_archivo))
+    return {archivo.nombre_archivo: (archivo, numero) for archivo, numero in resultado}
+
+
+async def update_archivos_recibidos(
+    database: AsyncSession,
+    modelo: Any,
+    modelo_padre: Any,
+    padre_columna: InstrumentedAttribute,
+    padre_id: int,
+    archivos: list[ArchivoRecibido],
+    fecha_hora_recepcion: datetime,
+) -> tuple[set[int], int, int]:
+    """
+    Marcar los archivos como RECIBIDOS y actualizar los contadores del padre en una sola sentencia,
+    sin terminar la transacción
+
+    :return: IDs de los archivos que se marcaron, los demás los recibió otra petición,
+        archivos pendientes y archivos recibidos del padre
+    """
+
+    # Marcar los archivos que sigan PENDIENTES, cada uno con su tamaño y su URL
+    datos = values(column("id", Integer), column("tamano", Integer), column("url", String), name="datos").data(
+        [(archivo.id, archivo.tamano, archivo.url) for archivo in archivos]
+    )
+    recibidos = (
+        update(modelo)
+        .where(modelo.id == datos.c.id)
+        .where(modelo.estado == "PENDIENTE")
+        .values(estado="RECIBIDO", fecha_hora_recepcion=fecha_hora_recepcion, tamano=datos.c.tamano, url=datos.c.url)
+        .returning(modelo.id)
+        .cte("recibidos")
+    )
+
+    # Descontarlos de los pendientes del padre y entregar los contadores con los IDs de los que se marcaron
+    cantidad = select(func.count()).select_from(recibidos).scalar_subquery()
+    ids = select(func.array_agg(recibidos.c.id)).scalar_subquery()
+    resultado = await database.execute(
+        update(modelo_padre)
+        .where(modelo_padre.id == padre_id)
+        .values(
+            archivos_pendientes=modelo_padre.archivos_pendientes - cantidad,
+            archivos_recibidos=modelo_padre.archivos_recibidos + cantidad,
+        )
+        .returning(ids, modelo_padre.archivos_pendientes, modelo_padre.archivos_recibidos)
+        .execution_options(synchronize_session=False)
+    )
+    marcados, pendientes, recibidos_cantidad = resultado.one()
+
+    # Si los contadores son nulos o quedaron negativos, contar los archivos y corregirlos
+    if pendientes is None or pendientes < 0:
+        contados = select(func.count()).select_from(modelo).where(padre_columna == padre_id).where(modelo.estatus == "A")
+        resultado = await database.execute(
+            update(modelo_padre)
+            .where(modelo_padre.id == padre_id)
+            .values(
+                archivos_pendientes=contados.where(modelo.estado == "PENDIENTE").scalar_subquery(),
+                archivos_recibidos=contados.where(modelo.estado == "RECIBIDO").scalar_subquery(),
+            )
+            .returning(modelo_padre.archivos_pendientes, modelo_padre.archivos_recibidos)
+            .execution_options(synchronize_session=False)
+        )
+        pendientes, recibidos_cantidad = resultado.one()
+
+    return set(marcados or []), pendientes, recibidos_cantidad
@@ -1,7 +1,18 @@
 """
 Usuarios v4, authentications
+
+Las api_keys ya validadas se guardan en un caché en memoria por un tiempo corto,
+así las peticiones siguientes no consultan la base de datos. La vigencia y el estatus
+se revisan en cada petición y el caché se invalida cuando cambia un usuario.
+
+Los permisos se toman en cada petición del caché de permissions.py, así el diccionario
+current_user.permissions que revisan las rutas ya está calculado.
+
+Las consultas usan la misma sesión asíncrona de la ruta (FastAPI entrega la misma dependencia
+get_async_db en toda la petición), así no se bloquea el event loop ni se ocupa otra conexión.
 """
 
+import hashlib
 import re
 from datetime import datetime
 from typing import Optional
@@ -9,25 +20,61 @@ from typing import Optional
 from fastapi import Depends, HTTPException
 from fastapi.security.api_key import APIKeyHeader
 from hashids import Hashids
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.orm import joinedload
 from starlette.status import HTTP_403_FORBIDDEN
 from unidecode import unidecode
 
+from ..models.autoridades import Autoridad
 from ..models.usuarios import Usuario
 from ..schemas.usuarios import UsuarioInDB
-from .database import get_db
+from ..settings import get_settings
+from .database import AsyncSession, get_async_db
 from .exceptions import MyAuthenticationError
+from .permissions import get_permissions_async
+from .query_detector import exempt_queries
+from .ttl_cache import TTLCache
 
 API_KEY_REGEXP = r"^\w+\.\w+\.\w+$"
 X_API_KEY = APIKeyHeader(name="X-Api-Key")
 
+settings = get_settings()
+
+# Caché de api_keys validadas, la clave es el SHA256 de la api_key y el valor el UsuarioInDB
+usuarios_cache = TTLCache(ttl=settings.api_key_cache_ttl, max_size=settings.api_key_cache_max_size)
+
+
+def get_api_key_hash(api_key: str) -> str:
+    """Obtener el SHA256 de la api_key, para no usarla en claro como clave del caché"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def invalidate_api_key(api_key: str) -> None:
+    """Quitar del caché una api_key, por ejemplo al rotarla"""
+    usuarios_cache.pop(get_api_key_hash(api_key))
+
+
+def invalidate_usuario(usuario_id: int) -> None:
+    """Quitar del caché todas las api_keys de un usuario"""
+    usuarios_cache.pop_where(lambda _, usuario: usuario.id == usuario_id)
+
+
+@event.listens_for(Usuario, "after_update")
+@event.listens_for(Usuario, "after_delete")
+def invalidate_usuario_on_change(_mapper, _connection, target: Usuario) -> None:
+    """Al cambiar la api_key, su expiración o el estatus de un usuario invalidar su caché"""
+    invalidate_usuario(target.id)
+
 
-def get_user(
+async def get_user(
     usuario_id: int,
-    database: Session = Depends(get_db),
+    database: AsyncSession,
 ) -> Optional[UsuarioInDB]:
-    """Consultar un usuario por su id"""
-    usuario = database.query(Usuario).get(usuario_id)
+    """Consultar un usuario por su id, con su autoridad y su distrito en la misma consulta"""
+    resultado = await database.execute(
+        select(Usuario).options(joinedload(Usuario.autoridad).joinedload(Autoridad.distrito)).where(Usuario.id == usuario_id)
+    )
+    usuario = resultado.scalar_one_or_none()
     if usuario:
         return UsuarioInDB(
             id=usuario.id,
@@ -46,7 +93,7 @@ def get_user(
             curp=usuario.curp,
             puesto=usuario.puesto,
             username=usuario.email,
-            permissions=usuario.permissions,
+            permissions=await get_permissions_async(database, usuario.id),
             hashed_password=usuario.contrasena,
             disabled=usuario.estatus != "A",
             api_key=usuario.api_key,
@@ -55,9 +102,9 @@ def get_user(
     return None
 
 
-def authenticate_user(
+async def authenticate_user(
     api_key: str,
-    database: Session,
+    database: AsyncSession,
 ) -> UsuarioInDB:
     """Autentificar un usuario por su api_key"""
 
@@ -75,7 +122,7 @@ def authenticate_user(
         raise MyAuthenticationError("No se pudo descifrar el ID")
 
     # Consultar
-    usuario = get_user(usuario_id, database)
+    usuario = await get_user(usuario_id, database)
     if usuario is None:
         raise MyAuthenticationError("No se encontro el usuario")
 
@@ -87,6 +134,16 @@ def authenticate_user(
     if api_key_email != Hashids(salt=usuario.email, min_length=8).encode(1):
         raise MyAuthenticationError("No coincide el correo electronico")
 
+    # Validar la vigencia y el estatus
+    validate_usuario(usuario)
+
+    # Entregar
+    return usuario
+
+
+def validate_usuario(usuario: UsuarioInDB) -> None:
+    """Validar que la api_key siga vigente y que el usuario sea activo"""
+
     # Validar el tiempo de expiracion
     if usuario.api_key_expiracion < datetime.now():
         raise MyAuthenticationError("No vigente porque ya expiro")
@@ -95,21 +152,41 @@ def authenticate_user(
     if usuario.disabled:
         raise MyAuthenticationError("No es activo este usuario porque fue eliminado")
 
-    # Entregar
-    return usuario
-
 
 async def get_current_active_user(
     api_key: str = Depends(X_API_KEY),
-    database: Session = Depends(get_db),
+    database: AsyncSession = Depends(get_async_db),
 ) -> UsuarioInDB:
     """Obtener el usuario activo actual"""
 
-    # Try-except
+    # Buscar en el caché, aunque esté la api_key se valida su vigencia y estatus
+    api_key_hash = get_api_key_hash(api_key)
+    usuario = usuarios_cache.get(api_key_hash)
+    if usuario is not None:
+        try:
+            validate_usuario(usuario)
+        except MyAuthenticationError as error:
+            usuarios_cache.pop(api_key_hash)
+            raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail=str(error)) from error
+        # Los permisos vienen de su propio caché, que se invalida al cambiar los roles o los permisos
+        return usuario.model_copy(update={"permissions": await get_permissions_async(database, usuario.id)})
+
+    # Try-except, las consultas para llenar el caché no cuentan para el detector de consultas
     try:
-        usuario = authenticate_user(api_key, database)
+        with exempt_queries():
+            usuario = await authenticate_user(api_key, database)
     except MyAuthenticationError as error:
         raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail=str(error)) from error
 
+    # Guardar en el caché
+    usuarios_cache.set(api_key_hash, usuario)
+
     # Entregar
     return usuario
+
+
+async def get_current_user_permissions(
+    current_user: UsuarioInDB = Depends(get_current_active_user),
+) -> dict[str, int]:
+    """Obtener los permisos del usuario activo actual, un diccionario con el nivel por nombre de módulo"""
+    return current_user.permissions
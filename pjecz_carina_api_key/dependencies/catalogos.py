@@ -0,0 +1,225 @@
+"""
+Catálogos
+
+Los catálogos que casi no cambian (estados, municipios, autoridades, áreas, tipos de diligencias
+y exh_externos) se cargan en memoria una vez por proceso, en diccionarios indexados por sus claves.
+
+Cada settings.catalogos_ttl segundos se consulta la versión, que es la cantidad de registros y la
+última modificación de cada tabla, con una sola consulta; si cambió se vuelven a cargar.
+
+Las materias y los distritos no se cargan, pero forman parte de la versión porque con ella
+se calculan los ETag de los listados y detalles de los catálogos (ver http_cache.py).
+
+Los registros son dataclasses congeladas para que se puedan compartir entre peticiones
+sin estar ligados a una sesión de SQLAlchemy.
+"""
+
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.autoridades import Autoridad
+from ..models.distritos import Distrito
+from ..models.estados import Estado
+from ..models.exh_areas import ExhArea
+from ..models.exh_externos import ExhExterno
+from ..models.exh_tipos_diligencias import ExhTipoDiligencia
+from ..models.materias import Materia
+from ..models.municipios import Municipio
+from ..settings import get_settings
+from .query_detector import exempt_queries
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class EstadoCatalogo:
+    """Estado del catálogo"""
+
+    id: int
+    clave: str
+    nombre: str
+
+
+@dataclass(frozen=True)
+class MunicipioCatalogo:
+    """Municipio del catálogo"""
+
+    id: int
+    estado_id: int
+    clave: str
+    nombre: str
+
+
+@dataclass(frozen=True)
+class AutoridadCatalogo:
+    """Autoridad del catálogo"""
+
+    id: int
+    clave: str
+    descripcion: str
+
+
+@dataclass(frozen=True)
+class ExhAreaCatalogo:
+    """Área del catálogo"""
+
+    id: int
+    clave: str
+    nombre: str
+
+
+@dataclass(frozen=True)
+class ExhTipoDiligenciaCatalogo:
+    """Tipo de diligencia del catálogo"""
+
+    id: int
+    clave: str
+    descripcion: str
+
+
+@dataclass(frozen=True)
+class ExhExternoCatalogo:
+    """Estado externo del catálogo, materias es un diccionario {clave: nombre}"""
+
+    id: int
+    estado_id: int
+    materias: dict[str, str]
+
+
+@dataclass(frozen=True)
+class Catalogos:
+    """Catálogos indexados, no se deben modificar"""
+
+    version: tuple
+    estados: dict[int, EstadoCatalogo]  # Por ID
+    estados_por_clave: dict[str, EstadoCatalogo]  # Por clave INEGI, por ejemplo "05"
+    municipios: dict[tuple[int, str], MunicipioCatalogo]  # Por (estado_id, clave INEGI), por ejemplo (5, "030")
+    municipios_por_id: dict[int, MunicipioCatalogo]  # Por ID
+    autoridades: dict[str, AutoridadCatalogo]  # Por clave
+    exh_areas: dict[str, ExhAreaCatalogo]  # Por clave
+    exh_tipos_diligencias: dict[str, ExhTipoDiligenciaCatalogo]  # Por clave
+    exh_externos: dict[int, ExhExternoCatalogo]  # Por estado_id
+
+
+MODELOS = (Estado, Municipio, Autoridad, ExhArea, ExhTipoDiligencia, ExhExterno, Materia, Distrito)
+
+_catalogos: Catalogos | None = None
+_revisado = 0.0
+
+
+def consultar_version():
+    """Consulta de la versión de los catálogos, la cantidad de registros y la última modificación de cada tabla"""
+    columnas = []
+    for modelo in MODELOS:
+        columnas.append(select(func.count(modelo.id)).scalar_subquery())
+        columnas.append(select(func.max(modelo.modificado)).scalar_subquery())
+    return select(*columnas)
+
+
+def ordenar(modelo):
+    """Ordenar con los registros activos al final, así con claves repetidas queda el activo"""
+    return ((modelo.estatus == "A"), modelo.id)
+
+
+async def cargar_catalogos(database: AsyncSession, version: tuple) -> Catalogos:
+    """Cargar los catálogos desde la base de datos"""
+
+    # Estados
+    estados = {}
+    estados_por_clave = {}
+    for id, clave, nombre in await database.execute(select(Estado.id, Estado.clave, Estado.nombre).order_by(*ordenar(Estado))):
+        estados[id] = estados_por_clave[clave] = EstadoCatalogo(id=id, clave=clave, nombre=nombre)
+
+    # Municipios
+    municipios = {}
+    municipios_por_id = {}
+    for id, estado_id, clave, nombre in await database.execute(
+        select(Municipio.id, Municipio.estado_id, Municipio.clave, Municipio.nombre).order_by(*ordenar(Municipio))
+    ):
+        municipio = MunicipioCatalogo(id=id, estado_id=estado_id, clave=clave, nombre=nombre)
+        municipios[(estado_id, clave)] = municipios_por_id[id] = municipio
+
+    # Autoridades
+    autoridades = {}
+    for id, clave, descripcion in await database.execute(
+        select(Autoridad.id, Autoridad.clave, Autoridad.descripcion).order_by(*ordenar(Autoridad))
+    ):
+        autoridades[clave] = AutoridadCatalogo(id=id, clave=clave, descripcion=descripcion)
+
+    # Áreas
+    exh_areas = {}
+    for id, clave, nombre in await database.execute(
+        select(ExhArea.id, ExhArea.clave, ExhArea.nombre).order_by(*ordenar(ExhArea))
+    ):
+        exh_areas[clave] = ExhAreaCatalogo(id=id, clave=clave, nombre=nombre)
+
+    # Tipos de diligencias
+    exh_tipos_diligencias = {}
+    for id, clave, descripcion in await database.execute(
+        select(ExhTipoDiligencia.id, ExhTipoDiligencia.clave, ExhTipoDiligencia.descripcion).order_by(
+            *ordenar(ExhTipoDiligencia)
+        )
+    ):
+        exh_tipos_diligencias[clave] = ExhTipoDiligenciaCatalogo(id=id, clave=clave, descripcion=descripcion)
+
+    # Externos, se queda el primero de cada estado
+    exh_externos = {}
+    for id, estado_id, materias in await database.execute(
+        select(ExhExterno.id, ExhExterno.estado_id, ExhExterno.materias).order_by(ExhExterno.id)
+    ):
+        if estado_id not in exh_externos:
+            materias = {item["clave"]: item["nombre"] for item in materias or []}
+            exh_externos[estado_id] = ExhExternoCatalogo(id=id, estado_id=estado_id, materias=materias)
+
+    # Entregar
+    return Catalogos(
+        version=version,
+        estados=estados,
+        estados_por_clave=estados_por_clave,
+        municipios=municipios,
+        municipios_por_id=municipios_por_id,
+        autoridades=autoridades,
+        exh_areas=exh_areas,
+        exh_tipos_diligencias=exh_tipos_diligencias,
+        exh_externos=exh_externos,
+    )
+
+
+async def get_catalogos(database: AsyncSession) -> Catalogos:
+    """Entregar los catálogos, se revisa su versión cada settings.catalogos_ttl segundos"""
+    global _catalogos, _revisado
+
+    # Si no ha pasado el tiempo para revisar, entregarlos
+    ahora = time.monotonic()
+    if _catalogos is not None and ahora - _revisado < settings.catalogos_ttl:
+        return _catalogos
+
+    # Consultar la versión y si cambió volver a cargarlos, no cuentan para el detector de consultas
+    with exempt_queries():
+        resultado = await database.execute(consultar_version())
+        version = tuple(resultado.one())
+        if _catalogos is None or _catalogos.version != version:
+            _catalogos = await cargar_catalogos(database, version)
+    _revisado = ahora
+
+    # Entregar
+    return _catalogos
+
+
+def invalidate_catalogos() -> None:
+    """Forzar que se revise la versión de los catálogos en la siguiente consulta"""
+    global _revisado
+    _revisado = float("-inf")
+
+
+def invalidate_catalogos_on_change(_mapper, _connection, _target) -> None:
+    """Al cambiar un registro de los catálogos en este proceso revisar la versión en la siguiente consulta"""
+    invalidate_catalogos()
+
+
+for _modelo in MODELOS:
+    for _evento in ("after_insert", "after_update", "after_delete"):
+        event.listen(_modelo, _evento, invalidate_catalogos_on_change)
@@ -1,41 +1,151 @@
 """
 Database
+
+Se crea un solo engine por proceso (por cada worker de gunicorn) con un QueuePool,
+de esta forma las conexiones a PostgreSQL se reutilizan entre peticiones.
+
+Además del engine síncrono (psycopg2) hay un engine asíncrono (asyncpg) para las rutas
+que no deben bloquear el event loop de uvicorn mientras esperan a la base de datos.
 """
 
+from threading import Lock
 from typing import Annotated
 
 from fastapi import Depends
 from sqlalchemy import Engine, create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from ..settings import Settings, get_settings
+from .metrics import register_engine
+from .query_detector import register_query_detector
+
+Base = declarative_base(cls=AsyncAttrs)
+
+_engine: Engine | None = None
+_engine_lock = Lock()
+_session_local: sessionmaker | None = None
 
-Base = declarative_base()
+_async_engine: AsyncEngine | None = None
+_async_session_local: async_sessionmaker | None = None
 
 
 def get_engine(settings: Annotated[Settings, Depends(get_settings)]) -> Engine:
-    """Database engine"""
+    """Database engine, se crea una sola vez por proceso y se reutiliza"""
+    global _engine, _session_local
+
+    # Si ya existe, entregarlo
+    if _engine is not None:
+        return _engine
+
+    with _engine_lock:
+        if _engine is None:
+            # Create engine
+            _engine = create_engine(
+                f"postgresql+psycopg2://{settings.db_user}:{settings.db_pass}@{settings.db_host}:{settings.db_port}/{settings.db_name}",
+                poolclass=QueuePool,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_recycle=settings.db_pool_recycle,
+                pool_pre_ping=settings.db_pool_pre_ping,
+                pool_timeout=settings.db_pool_timeout,
+            )
+
+            # Contar las sentencias SQL de cada petición (ver metrics.py y query_detector.py)
+            register_engine(_engine)
+            register_query_detector(_engine)
 
-    # Create engine
-    engine = create_engine(
-        f"postgresql+psycopg2://{settings.db_user}:{settings.db_pass}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
+            # Create session factory
+            _session_local = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+
+    return _engine
+
+
+def get_async_engine(settings: Annotated[Settings, Depends(get_settings)]) -> AsyncEngine:
+    """Database engine asíncrono, se crea una sola vez por proceso y se reutiliza"""
+    global _async_engine, _async_session_local
+
+    # Si ya existe, entregarlo
+    if _async_engine is not None:
+        return _async_engine
+
+    # Create async engine, usa AsyncAdaptedQueuePool con la misma configuración del pool
+    _async_engine = create_async_engine(
+        f"postgresql+asyncpg://{settings.db_user}:{settings.db_pass}@{settings.db_host}:{settings.db_port}/{settings.db_name}",
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_timeout=settings.db_pool_timeout,
     )
 
-    return engine
+    # Contar las sentencias SQL de cada petición (ver metrics.py y query_detector.py)
+    register_engine(_async_engine.sync_engine)
+    register_query_detector(_async_engine.sync_engine)
+
+    # Create async session factory, sin expirar al hacer commit para no provocar consultas implícitas
+    _async_session_local = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False)
+
+    return _async_engine
+
+
+def get_async_session_local(settings: Settings) -> async_sessionmaker:
+    """Fábrica de sesiones asíncronas, para las tareas que no son peticiones"""
+    get_async_engine(settings)
+    return _async_session_local
+
+
+def get_pool_status() -> dict:
+    """Estadísticas del pool de conexiones, vacío si aún no se ha creado el engine"""
+    if _engine is None:
+        return {}
+    pool = _engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+def dispose_engine() -> None:
+    """Cerrar las conexiones del pool al terminar el proceso"""
+    global _engine, _session_local
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _session_local = None
+
+
+async def dispose_async_engine() -> None:
+    """Cerrar las conexiones del pool asíncrono al terminar el proceso"""
+    global _async_engine, _async_session_local
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_session_local = None
 
 
 async def get_db(settings: Annotated[Settings, Depends(get_settings)]) -> Session:
     """Database session"""
 
-    # Create engine
-    engine = get_engine(settings)
-
-    # Create session
-    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Get the engine and the session factory of this process
+    get_engine(settings)
 
+    database = _session_local()
     try:
-        database = session_local()
         yield database
     finally:
         database.close()
+
+
+async def get_async_db(settings: Annotated[Settings, Depends(get_settings)]) -> AsyncSession:
+    """Database session asíncrona"""
+
+    # Get the async engine and the async session factory of this process
+    get_async_engine(settings)
+
+    async with _async_session_local() as database:
+        yield database
@@ -27,6 +27,10 @@ class MyEmptyError(MyAnyError):
     """Excepción porque no hay resultados"""
 
 
+class MyFileCorruptedError(MyAnyError):
+    """Excepción porque el archivo no coincide con su hash"""
+
+
 class MyFileNotAllowedError(MyAnyError):
     """Excepción porque no se permite el tipo del archivo"""
 
@@ -59,6 +63,10 @@ class MyOutOfRangeParamError(MyAnyError):
     """Excepción porque un parámetro esta fuera de rango"""
 
 
+class MyQueryBudgetError(MyAnyError):
+    """Excepción porque se excedió el presupuesto de consultas o se repitió una consulta (N+1)"""
+
+
 class MyRequestError(MyAnyError):
     """Excepción porque falló el request"""
 
@@ -0,0 +1,39 @@
+"""
+FastAPI Pagination Cursor
+
+Paginación por cursor (keyset) para CustomList y CustomPage, con el parámetro cursor:
+
+- Si no se da, se pagina con OFFSET como antes
+- Si se da vacío (?cursor=) se entrega la primera página
+- Si se da con el next_page de la respuesta anterior se entrega la página siguiente
+
+Con el cursor la consulta filtra por las columnas del order_by de la ruta, en lugar de saltar
+registros con OFFSET, así las páginas profundas cuestan lo mismo que la primera y no se cuenta el total.
+"""
+
+from typing import Any, Optional
+
+from fastapi import HTTPException, Query, status
+from fastapi_pagination.bases import CursorRawParams
+from fastapi_pagination.cursor import decode_cursor, encode_cursor
+from sqlakeyset import BadBookmark, unserialize_bookmark
+
+CURSOR_QUERY = Query(None, description="Cursor of the next page, empty for the first page")
+
+
+def get_cursor_raw_params(cursor: str, size: int) -> CursorRawParams:
+    """Decodificar y validar el cursor"""
+    bookmark = decode_cursor(cursor, to_str=True)
+    if bookmark is not None:
+        try:
+            unserialize_bookmark(bookmark)
+        except BadBookmark as error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor value") from error
+    return CursorRawParams(cursor=bookmark, size=size)
+
+
+def pop_next_page(kwargs: dict[str, Any]) -> Optional[str]:
+    """Quitar los datos del cursor que entrega fastapi_pagination y codificar el de la página siguiente"""
+    for llave in ("current", "current_backwards", "previous"):
+        kwargs.pop(llave, None)
+    return encode_cursor(kwargs.pop("next_", None))
@@ -1,14 +1,18 @@
 """
 FastAPI Pagination Custom List
+
+No se cuenta el total porque no se entrega, con el parámetro cursor se pagina por keyset
 """
 
 from typing import Any, Generic, Optional, Sequence, TypeVar
 
 from fastapi import Query
-from fastapi_pagination.bases import AbstractPage, AbstractParams
+from fastapi_pagination.bases import AbstractPage, AbstractParams, BaseRawParams, RawParams
 from fastapi_pagination.default import Params
 from typing_extensions import Self
 
+from .fastapi_pagination_cursor import CURSOR_QUERY, get_cursor_raw_params, pop_next_page
+
 
 class CustomListParams(Params):
     """
@@ -17,6 +21,13 @@ class CustomListParams(Params):
 
     page: int = Query(1, ge=1, description="Page number")
     size: int = Query(500, ge=1, le=1000, description="Page size")
+    cursor: Optional[str] = CURSOR_QUERY
+
+    def to_raw_params(self) -> BaseRawParams:
+        """Parámetros para OFFSET sin contar el total o para el cursor"""
+        if self.cursor is None:
+            return RawParams(limit=self.size, offset=self.size * (self.page - 1), include_total=False)
+        return get_cursor_raw_params(self.cursor, self.size)
 
 
 T = TypeVar("T")
@@ -31,6 +42,7 @@ class CustomList(AbstractPage[T], Generic[T]):
     message: str
     errors: list[str]
     data: Sequence[T] | None
+    next_page: Optional[str] = None
 
     __params_type__ = CustomListParams
 
@@ -48,7 +60,9 @@ class CustomList(AbstractPage[T], Generic[T]):
         if not isinstance(params, Params):
             raise TypeError("Page should be used with Params")
 
-        if total is None or total == 0:
+        next_page = pop_next_page(kwargs)
+
+        if len(items) == 0:
             return cls(
                 success=True,
                 message="No se encontraron registros",
@@ -61,5 +75,6 @@ class CustomList(AbstractPage[T], Generic[T]):
             message="Success",
             errors=[],
             data=items,
+            next_page=next_page,
             **kwargs,
         )
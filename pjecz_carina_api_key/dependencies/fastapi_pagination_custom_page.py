@@ -1,16 +1,20 @@
 """
 FastAPI Pagination Custom Page
+
+Con el parámetro cursor se pagina por keyset, limit es el tamaño de la página y no se cuenta el total
 """
 
 from abc import ABC
 from typing import Any, Generic, Optional, Sequence, TypeVar
 
 from fastapi import Query
-from fastapi_pagination.bases import AbstractPage, AbstractParams
+from fastapi_pagination.bases import AbstractPage, AbstractParams, BaseRawParams
 from fastapi_pagination.limit_offset import LimitOffsetParams
 from fastapi_pagination.types import GreaterEqualOne, GreaterEqualZero
 from typing_extensions import Self
 
+from .fastapi_pagination_cursor import CURSOR_QUERY, get_cursor_raw_params, pop_next_page
+
 
 class CustomPageParams(LimitOffsetParams):
     """
@@ -19,6 +23,13 @@ class CustomPageParams(LimitOffsetParams):
 
     offset: int = Query(0, ge=0, description="Page offset")
     limit: int = Query(10, ge=1, le=100, description="Page size limit")
+    cursor: Optional[str] = CURSOR_QUERY
+
+    def to_raw_params(self) -> BaseRawParams:
+        """Parámetros para OFFSET o para el cursor"""
+        if self.cursor is None:
+            return super().to_raw_params()
+        return get_cursor_raw_params(self.cursor, self.limit)
 
 
 T = TypeVar("T")
@@ -37,6 +48,7 @@ class CustomPage(AbstractPage[T], Generic[T], ABC):
     total: Optional[GreaterEqualZero]
     limit: Optional[GreaterEqualOne]
     offset: Optional[GreaterEqualZero]
+    next_page: Optional[str] = None
 
     __params_type__ = CustomPageParams
 
@@ -51,6 +63,22 @@ class CustomPage(AbstractPage[T], Generic[T], ABC):
         """
         Create Custom Page
         """
+        next_page = pop_next_page(kwargs)
+
+        # Con el cursor no hay total ni offset
+        if params.cursor is not None:
+            return cls(
+                success=len(items) > 0,
+                message="Success" if len(items) > 0 else "No se encontraron registros",
+                errors=[],
+                data=items,
+                total=None,
+                limit=params.limit,
+                offset=None,
+                next_page=next_page,
+                **kwargs,
+            )
+
         raw_params = params.to_raw_params().as_limit_offset()
 
         if total is None or total == 0:
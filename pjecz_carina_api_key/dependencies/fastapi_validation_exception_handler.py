@@ -3,9 +3,8 @@ FastAPI Validation Exception Handler
 """
 
 from fastapi import Request, status
-from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
-from starlette.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
 
 def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -17,7 +16,7 @@ def validation_exception_handler(request: Request, exc: RequestValidationError):
         "errors": errors,
         "data": None,
     }
-    return JSONResponse(
-        content=jsonable_encoder(payload),
+    return ORJSONResponse(
+        content=payload,
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
     )
@@ -0,0 +1,279 @@
+"""
+File Ingestion
+
+Recepción de archivos en una sola pasada: el UploadFile se lee por partes, cada parte
+actualiza los hashes SHA1 y SHA256 y se envía a Google Cloud Storage, de esta forma
+nunca se tiene el archivo completo en memoria.
+
+Como los hashes se conocen hasta el final, el archivo se sube con un nombre temporal único y sólo
+si coinciden se copia al nombre definitivo; si no coinciden se borra el temporal. Así nunca se
+reemplaza ni se borra el archivo que otra petición ya recibió con el mismo nombre.
+
+La lectura y la carga son bloqueantes, se ejecutan en el pool de hilos de google_cloud_storage.
+
+En las cargas reanudables cada parte se guarda como un archivo en el depósito y al finalizar
+se juntan. Los hashes se calculan parte por parte y se guardan en la memoria del proceso que las
+recibe, porque el estado de hashlib no se puede guardar en la base de datos; si alguna parte la
+recibió otro worker, al finalizar se descarga el archivo ya juntado completo para calcularlos.
+"""
+
+import hashlib
+import time
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, BinaryIO
+
+from fastapi import UploadFile
+
+from ..settings import get_settings
+from .exceptions import MyFileCorruptedError, MyNotValidParamError, MyOutOfRangeParamError
+from .google_cloud_storage import (
+    UPLOAD_CHUNK_SIZE,
+    copy_file_in_gcs,
+    delete_file_from_gcs,
+    read_file_by_chunks_from_gcs,
+    run_in_storage_executor,
+    upload_stream_to_gcs,
+)
+from .metrics import observe_hash
+from .pwgen import generar_aleatorio
+from .ttl_cache import TTLCache
+
+TAMANO_MAXIMO = 10 * 1024 * 1024  # 10 MB
+
+settings = get_settings()
+
+# Hashes parciales de las cargas reanudables, la clave es el ID de la carga y el valor (bytes, sha1, sha256)
+cargas_hashes = TTLCache(ttl=settings.archivo_carga_ttl, max_size=256)
+
+
+class HashingReader:
+    """Envoltura de un archivo que calcula SHA1 y SHA256 conforme se lee"""
+
+    def __init__(self, archivo: BinaryIO, tamano_maximo: int):
+        self._archivo = archivo
+        self._tamano_maximo = tamano_maximo
+        self.sha1 = hashlib.sha1()
+        self.sha256 = hashlib.sha256()
+        self.tamano = 0  # Bytes ya procesados por los hashes
+
+    def read(self, size: int = -1) -> bytes:
+        """Leer del archivo, los bytes que no se han procesado actualizan los hashes"""
+        inicio = self._archivo.tell()
+        datos = self._archivo.read(size)
+        final = inicio + len(datos)
+
+        # Si se reintenta una parte ya leída no se vuelve a procesar
+        if final > self.tamano:
+            nuevos = datos[self.tamano - inicio :]
+            self.tamano = final
+            if self.tamano > self._tamano_maximo:
+                raise MyOutOfRangeParamError("El archivo excede el tamaño máximo permitido")
+            inicio_hash = time.perf_counter()
+            self.sha1.update(nuevos)
+            self.sha256.update(nuevos)
+            observe_hash(time.perf_counter() - inicio_hash, len(nuevos))
+        return datos
+
+    def tell(self) -> int:
+        """Posición en el archivo"""
+        return self._archivo.tell()
+
+    def seek(self, posicion: int, desde: int = 0) -> int:
+        """Mover la posición en el archivo"""
+        return self._archivo.seek(posicion, desde)
+
+
+async def ingest_upload_file(
+    archivo: UploadFile,
+    bucket_name: str,
+    blob_name: str,
+    hash_sha1: str | None,
+    hash_sha256: str | None,
+    content_type: str = "application/pdf",
+    tamano_maximo: int = TAMANO_MAXIMO,
+) -> tuple[str, int]:
+    """
+    Subir un UploadFile a Google Cloud Storage validando su tamaño y sus hashes, sin bloquear el event loop
+
+    :return: URL pública y tamaño en bytes
+    """
+    return await run_in_storage_executor(
+        ingest_file,
+        archivo.file,
+        archivo.size,
+        bucket_name,
+        blob_name,
+        hash_sha1,
+        hash_sha256,
+        content_type,
+        tamano_maximo,
+    )
+
+
+def ingest_file(
+    archivo: BinaryIO,
+    tamano: int | None,
+    bucket_name: str,
+    blob_name: str,
+    hash_sha1: str | None,
+    hash_sha256: str | None,
+    content_type: str = "application/pdf",
+    tamano_maximo: int = TAMANO_MAXIMO,
+) -> tuple[str, int]:
+    """
+    Subir un archivo a Google Cloud Storage validando su tamaño y sus hashes
+
+    :return: URL pública y tamaño en bytes
+    """
+
+    # Leer desde el principio del archivo
+    archivo.seek(0)
+    lector = HashingReader(archivo, tamano_maximo)
+
+    # Subir por partes con un nombre temporal único, si se excede el tamaño se interrumpe la carga
+    temporal_blob_name = get_temporal_blob_name()
+    try:
+        upload_stream_to_gcs(
+            bucket_name=bucket_name,
+            blob_name=temporal_blob_name,
+            content_type=content_type,
+            stream=lector,
+            size=tamano,
+        )
+
+        # Validar la integridad del archivo con SHA1 y SHA256, y sólo si coincide copiarlo al nombre definitivo
+        validate_hashes(lector.sha1.hexdigest(), lector.sha256.hexdigest(), hash_sha1, hash_sha256)
+        url = copy_file_in_gcs(bucket_name, temporal_blob_name, blob_name)
+    finally:
+        delete_file_from_gcs(bucket_name, temporal_blob_name)
+
+    # Entregar
+    return url, lector.tamano
+
+
+def get_temporal_blob_name() -> str:
+    """Nombre único para subir un archivo antes de validarlo"""
+    return f"exh_exhortos_archivos_temporales/{generar_aleatorio(32)}"
+
+
+def validate_hashes(sha1: str, sha256: str, hash_sha1: str | None, hash_sha256: str | None) -> None:
+    """Validar los hashes calculados contra los declarados, los declarados vacíos no se validan"""
+    if hash_sha1 is not None and hash_sha1 != "" and hash_sha1 != sha1:
+        raise MyFileCorruptedError("El archivo no coincide con el hash SHA1")
+    if hash_sha256 is not None and hash_sha256 != "" and hash_sha256 != sha256:
+        raise MyFileCorruptedError("El archivo no coincide con el hash SHA256")
+
+
+def write_chunk_data(temporal: BinaryIO, datos: bytes, sha1, sha256) -> float:
+    """Escribir datos de una parte en su archivo temporal y actualizar los hashes, entrega los segundos del hash"""
+    temporal.write(datos)
+    if sha1 is None:
+        return 0.0
+    inicio_hash = time.perf_counter()
+    sha1.update(datos)
+    sha256.update(datos)
+    return time.perf_counter() - inicio_hash
+
+
+async def ingest_chunk(
+    stream: AsyncIterator[bytes],
+    bucket_name: str,
+    blob_name: str,
+    carga_id: int,
+    desplazamiento: int,
+    tamano_maximo: int,
+) -> tuple[int, tuple | None]:
+    """
+    Recibir una parte de una carga reanudable y subirla a Google Cloud Storage
+
+    La parte se guarda en un archivo temporal (en memoria hasta 1 MiB) mientras se calculan los hashes,
+    si este proceso tiene los hashes de las partes anteriores se continúan, si no quedan pendientes.
+    Lo recibido se junta hasta UPLOAD_CHUNK_SIZE y se escribe en el pool de hilos, para no bloquear el event loop.
+
+    :return: Tamaño de la parte y los hashes a guardar con save_chunk_hashes al confirmarla
+    """
+
+    # Continuar los hashes si este proceso recibió las partes anteriores
+    sha1 = sha256 = None
+    if desplazamiento == 0:
+        sha1, sha256 = hashlib.sha1(), hashlib.sha256()
+    else:
+        hashes = cargas_hashes.get(carga_id)
+        if hashes is not None and hashes[0] == desplazamiento:
+            sha1, sha256 = hashes[1].copy(), hashes[2].copy()
+
+    # Recibir la parte
+    tamano = 0
+    segundos_hash = 0.0
+    pendiente = bytearray()
+    with SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE) as temporal:
+        async for datos in stream:
+            tamano += len(datos)
+            if tamano > tamano_maximo:
+                raise MyOutOfRangeParamError("La parte excede el tamaño máximo permitido")
+            pendiente += datos
+            if len(pendiente) >= UPLOAD_CHUNK_SIZE:
+                segundos_hash += await run_in_storage_executor(write_chunk_data, temporal, bytes(pendiente), sha1, sha256)
+                pendiente.clear()
+        if pendiente:
+            segundos_hash += await run_in_storage_executor(write_chunk_data, temporal, bytes(pendiente), sha1, sha256)
+        if sha1 is not None:
+            observe_hash(segundos_hash, tamano)
+        if tamano == 0:
+            raise MyNotValidParamError("La parte está vacía")
+
+        # Subir la parte
+        temporal.seek(0)
+        await run_in_storage_executor(
+            upload_stream_to_gcs,
+            bucket_name=bucket_name,
+            blob_name=blob_name,
+            content_type="application/pdf",
+            stream=temporal,
+            size=tamano,
+        )
+
+    # Entregar
+    if sha1 is None:
+        return tamano, None
+    return tamano, (desplazamiento + tamano, sha1, sha256)
+
+
+def save_chunk_hashes(carga_id: int, hashes: tuple | None) -> None:
+    """Guardar los hashes de una carga después de confirmar la parte en la base de datos"""
+    if hashes is not None:
+        cargas_hashes.set(carga_id, hashes)
+
+
+def hash_file(bucket_name: str, blob_name: str) -> tuple[str, str]:
+    """Calcular SHA1 y SHA256 de un archivo en Google Cloud Storage leyéndolo por partes"""
+    sha1, sha256 = hashlib.sha1(), hashlib.sha256()
+    tamano = 0
+    segundos_hash = 0.0
+    for datos in read_file_by_chunks_from_gcs(bucket_name, blob_name):
+        inicio_hash = time.perf_counter()
+        sha1.update(datos)
+        sha256.update(datos)
+        segundos_hash += time.perf_counter() - inicio_hash
+        tamano += len(datos)
+    observe_hash(segundos_hash, tamano)
+    return sha1.hexdigest(), sha256.hexdigest()
+
+
+async def verify_composed_file(
+    carga_id: int,
+    tamano: int,
+    bucket_name: str,
+    blob_name: str,
+    hash_sha1: str | None,
+    hash_sha256: str | None,
+) -> None:
+    """Validar los hashes del archivo juntado, con los hashes parciales si están completos o leyéndolo"""
+    hashes = cargas_hashes.pop(carga_id)
+    if hashes is not None and hashes[0] == tamano:
+        sha1, sha256 = hashes[1].hexdigest(), hashes[2].hexdigest()
+    elif (hash_sha1 is None or hash_sha1 == "") and (hash_sha256 is None or hash_sha256 == ""):
+        return
+    else:
+        sha1, sha256 = await run_in_storage_executor(hash_file, bucket_name, blob_name)
+    validate_hashes(sha1, sha256, hash_sha1, hash_sha256)
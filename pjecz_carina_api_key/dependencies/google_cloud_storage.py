@@ -1,16 +1,136 @@
 """
 Google Cloud Storage
+
+Se usa un solo cliente por proceso (por cada worker de gunicorn) con un pool de conexiones HTTP,
+y los depósitos (buckets) se consultan una sola vez y se guardan.
+
+Las operaciones son bloqueantes, para no detener el event loop las rutas usan las versiones
+async que las ejecutan en un pool de hilos con un máximo de settings.storage_max_workers.
+
+Las librerías de Google se importan en las funciones que las usan, porque tardan en importarse
+y así no retrasan el arranque de cada worker.
+
+Las operaciones bloqueantes se miden con observe_storage (ver metrics.py).
 """
 
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterator
 from urllib.parse import unquote, urlparse
 
-from google.cloud import storage
-from google.cloud.exceptions import NotFound
+from ..settings import get_settings
+from .exceptions import (
+    MyAnyError,
+    MyBucketNotFoundError,
+    MyFileNotAllowedError,
+    MyFileNotFoundError,
+    MyNotValidParamError,
+    MyUploadError,
+)
+from .metrics import observe_storage, observe_upload
 
-from .exceptions import MyBucketNotFoundError, MyFileNotAllowedError, MyFileNotFoundError, MyNotValidParamError, MyUploadError
+if TYPE_CHECKING:
+    from google.cloud import storage
 
 EXTENSIONS_MEDIA_TYPES = {"pdf": "application/pdf"}
+UPLOAD_CHUNK_SIZE = 4 * 256 * 1024  # 1 MiB, la carga reanudable exige múltiplos de 256 KiB
+COMPOSE_MAX_SOURCES = 32  # Máximo de archivos que Google Cloud Storage puede juntar en una operación
+
+_storage_client: "storage.Client | None" = None
+_buckets: dict[str, "storage.Bucket"] = {}
+_executor: ThreadPoolExecutor | None = None
+_lock = Lock()
+
+
+def get_storage_client() -> "storage.Client":
+    """Cliente de Google Cloud Storage, se crea una sola vez por proceso y se reutiliza"""
+    global _storage_client
+
+    # Si ya existe, entregarlo
+    if _storage_client is not None:
+        return _storage_client
+
+    with _lock:
+        if _storage_client is None:
+            import google.auth
+            from google.auth.credentials import AnonymousCredentials
+            from google.auth.transport.requests import AuthorizedSession
+            from google.cloud import storage
+            from requests.adapters import HTTPAdapter
+
+            settings = get_settings()
+            # Credenciales, con el emulador (STORAGE_EMULATOR_HOST) no se necesitan
+            if os.getenv("STORAGE_EMULATOR_HOST"):
+                credentials = AnonymousCredentials()
+            else:
+                credentials, _ = google.auth.default(scopes=storage.Client.SCOPE)
+            # Sesión HTTP con un pool de conexiones del tamaño del pool de hilos, para reutilizar las conexiones
+            http = AuthorizedSession(credentials)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.storage_max_workers)
+            http.mount("https://", adapter)
+            http.mount("http://", adapter)
+            _storage_client = storage.Client(credentials=credentials, _http=http)
+
+    return _storage_client
+
+
+def get_bucket(bucket_name: str) -> "storage.Bucket":
+    """Depósito de Google Cloud Storage, se consulta una sola vez y se guarda"""
+    from google.cloud.exceptions import NotFound
+
+    # Si ya se consultó, entregarlo
+    bucket = _buckets.get(bucket_name)
+    if bucket is not None:
+        return bucket
+
+    # Consultar el depósito
+    try:
+        bucket = get_storage_client().get_bucket(bucket_name)
+    except NotFound as error:
+        raise MyBucketNotFoundError("No existe el deposito en Google Cloud Storage") from error
+
+    # Guardar y entregar
+    _buckets[bucket_name] = bucket
+    return bucket
+
+
+def get_storage_executor() -> ThreadPoolExecutor:
+    """Pool de hilos para las operaciones con Google Cloud Storage"""
+    global _executor
+
+    # Si ya existe, entregarlo
+    if _executor is not None:
+        return _executor
+
+    with _lock:
+        if _executor is None:
+            settings = get_settings()
+            _executor = ThreadPoolExecutor(max_workers=settings.storage_max_workers, thread_name_prefix="storage")
+
+    return _executor
+
+
+async def run_in_storage_executor(func: Callable, *args, **kwargs):
+    """Ejecutar una función bloqueante en el pool de hilos de Google Cloud Storage"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_storage_executor(), partial(func, *args, **kwargs))
+
+
+def shutdown_storage() -> None:
+    """Terminar el pool de hilos y cerrar las conexiones al terminar el proceso"""
+    global _storage_client, _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        if _storage_client is not None:
+            _storage_client.close()
+        _executor = None
+        _storage_client = None
+        _buckets.clear()
 
 
 def get_media_type_from_filename(filename: str) -> str:
@@ -58,6 +178,7 @@ def get_blob_name_from_url(url: str) -> str:
     return unquote(blob_name)
 
 
+@observe_storage
 def check_file_exists_from_gcs(
     bucket_name: str,
     blob_name: str,
@@ -71,21 +192,13 @@ def check_file_exists_from_gcs(
     """
 
     # Get bucket
-    storage_client = storage.Client()
-    try:
-        bucket = storage_client.get_bucket(bucket_name)
-    except NotFound as error:
-        raise MyBucketNotFoundError("Bucket not found") from error
-
-    # Get file
-    blob = bucket.get_blob(blob_name)
-    if blob is None:
-        return False
+    bucket = get_bucket(bucket_name)
 
     # Return True if file exists
-    return True
+    return bucket.blob(blob_name).exists()
 
 
+@observe_storage
 def get_public_url_from_gcs(
     bucket_name: str,
     blob_name: str,
@@ -99,11 +212,7 @@ def get_public_url_from_gcs(
     """
 
     # Get bucket
-    storage_client = storage.Client()
-    try:
-        bucket = storage_client.get_bucket(bucket_name)
-    except NotFound as error:
-        raise MyBucketNotFoundError("Bucket not found") from error
+    bucket = get_bucket(bucket_name)
 
     # Get file
     blob = bucket.get_blob(blob_name)
@@ -114,6 +223,7 @@ def get_public_url_from_gcs(
     return blob.public_url
 
 
+@observe_storage
 def get_file_from_gcs(
     bucket_name: str,
     blob_name: str,
@@ -125,23 +235,19 @@ def get_file_from_gcs(
     :param blob_name: Path to the file
     :return: File content
     """
+    from google.cloud.exceptions import NotFound
 
     # Get bucket
-    storage_client = storage.Client()
+    bucket = get_bucket(bucket_name)
+
+    # Get file content, without a previous request for its metadata
     try:
-        bucket = storage_client.get_bucket(bucket_name)
+        return bucket.blob(blob_name).download_as_bytes()
     except NotFound as error:
-        raise MyBucketNotFoundError("Bucket not found") from error
-
-    # Get file
-    blob = bucket.get_blob(blob_name)
-    if blob is None:
-        raise MyFileNotFoundError("File not found")
-
-    # Return file content
-    return blob.download_as_string()
+        raise MyFileNotFoundError("File not found") from error
 
 
+@observe_storage
 def upload_file_to_gcs(
     bucket_name: str,
     blob_name: str,
@@ -163,11 +269,7 @@ def upload_file_to_gcs(
         raise MyFileNotAllowedError("Tipo de archivo no permitido")
 
     # Get bucket
-    storage_client = storage.Client()
-    try:
-        bucket = storage_client.get_bucket(bucket_name)
-    except NotFound as error:
-        raise MyBucketNotFoundError("No existe el deposito en Google Cloud Storage") from error
+    bucket = get_bucket(bucket_name)
 
     # Create blob
     blob = bucket.blob(blob_name)
@@ -177,6 +279,212 @@ def upload_file_to_gcs(
         blob.upload_from_string(data, content_type=content_type)
     except Exception as error:
         raise MyUploadError("Error al subir el archivo a Google Cloud Storage") from error
+    observe_upload(len(data))
 
     # Return public URL
     return blob.public_url
+
+
+@observe_storage
+def upload_stream_to_gcs(
+    bucket_name: str,
+    blob_name: str,
+    content_type: str,
+    stream: BinaryIO,
+    size: int | None = None,
+) -> str:
+    """
+    Upload file-like stream to Google Cloud Storage, reading it by chunks
+
+    :param bucket_name: Name of the bucket
+    :param blob_name: Path to the file
+    :param content_type: Content type of the file
+    :param stream: File-like object positioned at the beginning
+    :param size: Size of the file if known
+    :return: Public URL
+    """
+
+    # Check content type
+    if content_type not in EXTENSIONS_MEDIA_TYPES.values():
+        raise MyFileNotAllowedError("Tipo de archivo no permitido")
+
+    # Get bucket
+    bucket = get_bucket(bucket_name)
+
+    # Create blob, with chunk_size the resumable upload reads and sends one chunk at a time
+    blob = bucket.blob(blob_name, chunk_size=UPLOAD_CHUNK_SIZE)
+
+    # If it fits in one chunk, send it in a single request
+    if size is not None and size > UPLOAD_CHUNK_SIZE:
+        size = None
+
+    # Upload
+    start = stream.tell()
+    try:
+        blob.upload_from_file(stream, size=size, content_type=content_type)
+    except MyAnyError:
+        raise
+    except Exception as error:
+        raise MyUploadError("Error al subir el archivo a Google Cloud Storage") from error
+    observe_upload(stream.tell() - start)
+
+    # Return public URL
+    return blob.public_url
+
+
+@observe_storage
+def delete_file_from_gcs(
+    bucket_name: str,
+    blob_name: str,
+) -> None:
+    """
+    Delete file from Google Cloud Storage, it does nothing if it does not exist
+
+    :param bucket_name: Name of the bucket
+    :param blob_name: Path to the file
+    """
+    from google.cloud.exceptions import NotFound
+
+    try:
+        get_bucket(bucket_name).blob(blob_name).delete()
+    except NotFound:
+        pass
+
+
+@observe_storage
+def read_file_by_chunks_from_gcs(
+    bucket_name: str,
+    blob_name: str,
+) -> Iterator[bytes]:
+    """
+    Read file from Google Cloud Storage by chunks, without having it complete in memory
+
+    :param bucket_name: Name of the bucket
+    :param blob_name: Path to the file
+    :return: Iterator of chunks
+    """
+    from google.cloud.exceptions import NotFound
+
+    try:
+        with get_bucket(bucket_name).blob(blob_name).open("rb", chunk_size=UPLOAD_CHUNK_SIZE) as archivo:
+            while datos := archivo.read(UPLOAD_CHUNK_SIZE):
+                yield datos
+    except NotFound as error:
+        raise MyFileNotFoundError("File not found") from error
+
+
+@observe_storage
+def compose_files_in_gcs(
+    bucket_name: str,
+    source_blob_names: list[str],
+    blob_name: str,
+    content_type: str,
+) -> str:
+    """
+    Compose files in Google Cloud Storage into one, in groups of up to 32 sources
+
+    :param bucket_name: Name of the bucket
+    :param source_blob_names: Paths to the files to join, in order
+    :param blob_name: Path to the composed file
+    :param content_type: Content type of the composed file
+    :return: Public URL
+    """
+
+    # Check content type
+    if content_type not in EXTENSIONS_MEDIA_TYPES.values():
+        raise MyFileNotAllowedError("Tipo de archivo no permitido")
+
+    # Get bucket
+    bucket = get_bucket(bucket_name)
+
+    # Compose, after the first group the composed file is the first source of the next group
+    # A new destination blob is used each time, so the checksums of the previous compose are not sent
+    sources = [bucket.blob(source_blob_name) for source_blob_name in source_blob_names]
+    group = sources[:COMPOSE_MAX_SOURCES]
+    sources = sources[COMPOSE_MAX_SOURCES:]
+    try:
+        while True:
+            blob = bucket.blob(blob_name)
+            blob.content_type = content_type
+            blob.compose(group)
+            if not sources:
+                break
+            group = [bucket.blob(blob_name)] + sources[: COMPOSE_MAX_SOURCES - 1]
+            sources = sources[COMPOSE_MAX_SOURCES - 1 :]
+    except Exception as error:
+        raise MyUploadError("Error al juntar las partes del archivo en Google Cloud Storage") from error
+
+    # Return public URL
+    return blob.public_url
+
+
+@observe_storage
+def copy_file_in_gcs(
+    bucket_name: str,
+    source_blob_name: str,
+    blob_name: str,
+) -> str:
+    """
+    Copy file inside the bucket in Google Cloud Storage, the destination is replaced if it exists
+
+    :param bucket_name: Name of the bucket
+    :param source_blob_name: Path to the file to copy
+    :param blob_name: Path to the copy
+    :return: Public URL
+    """
+    from google.cloud.exceptions import NotFound
+
+    # Get bucket
+    bucket = get_bucket(bucket_name)
+
+    # Copy, Google Cloud Storage does it without downloading the file
+    try:
+        blob = bucket.copy_blob(bucket.blob(source_blob_name), bucket, blob_name)
+    except NotFound as error:
+        raise MyFileNotFoundError("File not found") from error
+    except Exception as error:
+        raise MyUploadError("Error al copiar el archivo en Google Cloud Storage") from error
+
+    # Return public URL
+    return blob.public_url
+
+
+@observe_storage
+def delete_files_from_gcs(
+    bucket_name: str,
+    blob_names: list[str],
+) -> None:
+    """
+    Delete files from Google Cloud Storage, the ones that do not exist are ignored
+
+    :param bucket_name: Name of the bucket
+    :param blob_names: Paths to the files
+    """
+    from google.cloud.exceptions import NotFound
+
+    bucket = get_bucket(bucket_name)
+    for blob_name in blob_names:
+        try:
+            bucket.blob(blob_name).delete()
+        except NotFound:
+            pass
+
+
+async def check_file_exists_from_gcs_async(bucket_name: str, blob_name: str) -> bool:
+    """Check if file exists in Google Cloud Storage, without blocking the event loop"""
+    return await run_in_storage_executor(check_file_exists_from_gcs, bucket_name, blob_name)
+
+
+async def get_file_from_gcs_async(bucket_name: str, blob_name: str) -> bytes:
+    """Get file from Google Cloud Storage, without blocking the event loop"""
+    return await run_in_storage_executor(get_file_from_gcs, bucket_name, blob_name)
+
+
+async def upload_file_to_gcs_async(bucket_name: str, blob_name: str, content_type: str, data: bytes) -> str:
+    """Upload file to Google Cloud Storage, without blocking the event loop"""
+    return await run_in_storage_executor(upload_file_to_gcs, bucket_name, blob_name, content_type, data)
+
+
+async def delete_file_from_gcs_async(bucket_name: str, blob_name: str) -> None:
+    """Delete file from Google Cloud Storage, without blocking the event loop"""
+    await run_in_storage_executor(delete_file_from_gcs, bucket_name, blob_name)
@@ -0,0 +1,111 @@
+"""
+HTTP Cache
+
+Los catálogos (estados, municipios, materias, áreas y autoridades) casi no cambian, así que sus
+respuestas llevan un ETag fuerte calculado con la versión de los catálogos y la URL, además de
+Cache-Control para que el cliente las guarde settings.catalogos_ttl segundos.
+
+Si el encabezado If-None-Match coincide con el ETag se responde 304 sin cuerpo, antes de
+consultar la base de datos; la versión sale del caché en memoria de catalogos.py.
+
+Los listados además se guardan ya serializados en JSON (y comprimidos con gzip si son grandes)
+en un caché LRU cuya clave es el ETag, así las siguientes peticiones con la misma versión,
+ruta y parámetros se entregan sin consultar, sin crear los modelos de pydantic y sin serializar.
+"""
+
+import gzip
+import hashlib
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from pydantic import BaseModel
+
+from ..settings import get_settings
+from .catalogos import get_catalogos
+from .database import AsyncSession, get_async_db
+from .ttl_cache import TTLCache
+
+settings = get_settings()
+
+# Respuestas serializadas, la clave es el ETag y el valor (JSON, JSON comprimido con gzip o None)
+respuestas_cache = TTLCache(ttl=settings.catalogos_ttl, max_size=settings.respuestas_cache_max_size)
+
+
+async def get_catalogos_version(database: Annotated[AsyncSession, Depends(get_async_db)]) -> tuple:
+    """Versión de los catálogos, dentro de settings.catalogos_ttl no consulta la base de datos"""
+    catalogos = await get_catalogos(database)
+    return catalogos.version
+
+
+def get_etag(version: tuple, request: Request) -> str:
+    """Calcular el ETag fuerte con la versión de los catálogos, la ruta y los parámetros"""
+    contenido = f"{version}|{request.url.path}|{request.url.query}"
+    return '"' + hashlib.sha1(contenido.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Revisar si el ETag está en If-None-Match, la comparación es débil como indica el RFC 9110"""
+    if if_none_match is None or if_none_match == "":
+        return False
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*" or candidato.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def get_cache_headers(etag: str) -> dict[str, str]:
+    """Encabezados ETag y Cache-Control"""
+    return {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.catalogos_ttl}",
+    }
+
+
+def check_not_modified(request: Request, response: Response, version: tuple) -> str:
+    """Agregar ETag y Cache-Control a la respuesta y si el cliente ya la tiene responder 304, entrega el ETag"""
+    etag = get_etag(version, request)
+    headers = get_cache_headers(etag)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return etag
+
+
+def accepts_gzip(request: Request) -> bool:
+    """Revisar si el cliente acepta gzip"""
+    for codificacion in request.headers.get("Accept-Encoding", "").split(","):
+        nombre, _, parametros = codificacion.strip().partition(";")
+        if nombre.strip().lower() == "gzip":
+            return parametros.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def build_cached_response(request: Request, etag: str, contenido: bytes, comprimido: bytes | None) -> Response:
+    """Crear la respuesta con el JSON o con su copia comprimida si el cliente la acepta"""
+    headers = get_cache_headers(etag)
+    if comprimido is None:
+        return Response(content=contenido, media_type="application/json", headers=headers)
+    headers["Vary"] = "Accept-Encoding"
+    if accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=comprimido, media_type="application/json", headers=headers)
+    return Response(content=contenido, media_type="application/json", headers=headers)
+
+
+def get_cached_response(request: Request, etag: str) -> Response | None:
+    """Entregar la respuesta serializada del caché, o None si no está"""
+    guardado = respuestas_cache.get(etag)
+    if guardado is None:
+        return None
+    return build_cached_response(request, etag, *guardado)
+
+
+def set_cached_response(request: Request, etag: str, resultado: BaseModel) -> Response:
+    """Serializar el resultado una sola vez, guardarlo en el caché y entregar la respuesta"""
+    contenido = resultado.model_dump_json(by_alias=True).encode("utf-8")
+    comprimido = None
+    if len(contenido) >= settings.respuestas_cache_gzip_min_size:
+        comprimido = gzip.compress(contenido, mtime=0)
+    respuestas_cache.set(etag, (contenido, comprimido))
+    return build_cached_response(request, etag, contenido, comprimido)
@@ -0,0 +1,182 @@
+"""
+Idempotency
+
+Los remitentes reintentan /recibir, /recibir_respuesta, /recibir_promocion y /actualizar cuando se
+les agota el tiempo de espera. Para que un reintento no valide ni inserte de nuevo, la respuesta exitosa
+se guarda en la tabla exh_idempotencias en la misma transacción que los registros, con una restricción
+única por usuario, ruta y clave.
+
+La clave es siempre la llave natural de la petición, por ejemplo exhortoOrigenId o exhortoId y
+respuestaOrigenId, así ni un reintento con otro encabezado ni uno por /recibir_lote duplica los registros.
+También se guarda el SHA256 de la petición, si se repite la clave con otros datos se responde que falló.
+El encabezado Idempotency-Key, si viene, se guarda y es una revisión más: si la llave natural ya se recibió
+con otro encabezado también se responde que falló.
+
+Un reintento se entrega del caché en memoria o con una sola consulta por el índice de la restricción única.
+Si dos peticiones iguales llegan al mismo tiempo, la segunda choca con la restricción única al insertar y
+entrega la respuesta de la primera. Las respuestas fallidas no se guardan, así se pueden corregir y reenviar.
+"""
+
+import hashlib
+from dataclasses import dataclass
+
+from fastapi import Response
+from pydantic import BaseModel
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from ..models.exh_idempotencias import ExhIdempotencia
+from ..settings import get_settings
+from .database import AsyncSession
+from .schemas_base import OneBaseOut
+from .ttl_cache import TTLCache
+
+IDEMPOTENCY_KEY_MAX_LEN = 256
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+settings = get_settings()
+
+# Respuestas de las recepciones, la clave es (usuario_id, ruta, clave) y el valor (peticion_hash, idempotency_key, JSON)
+idempotencias_cache = TTLCache(ttl=settings.idempotencias_cache_ttl, max_size=settings.idempotencias_cache_max_size)
+
+
+@dataclass
+class Idempotencia:
+    """Clave de idempotencia de una petición"""
+
+    usuario_id: int
+    ruta: str
+    clave: str
+    peticion_hash: str
+    idempotency_key: str | None = None
+
+    @property
+    def cache_key(self) -> tuple:
+        """Clave en el caché en memoria"""
+        return self.usuario_id, self.ruta, self.clave
+
+
+def get_idempotencia(usuario_id: int, ruta: str, idempotency_key: str | None, peticion: BaseModel, *llaves) -> Idempotencia:
+    """Clave de idempotencia con las llaves naturales, el encabezado Idempotency-Key se guarda para revisarlo"""
+    clave = "|".join(str(llave).strip()[:64] for llave in llaves)
+    idempotency_key = (idempotency_key or "").strip()[:IDEMPOTENCY_KEY_MAX_LEN] or None
+    peticion_hash = hashlib.sha256(peticion.model_dump_json().encode("utf-8")).hexdigest()
+    return Idempotencia(
+        usuario_id=usuario_id,
+        ruta=ruta,
+        clave=clave[:IDEMPOTENCY_KEY_MAX_LEN],
+        peticion_hash=peticion_hash,
+        idempotency_key=idempotency_key,
+    )
+
+
+def get_replayed_content(
+    idempotencia: Idempotencia, peticion_hash: str, idempotency_key: str | None, contenido: bytes
+) -> bytes:
+    """Entregar la respuesta guardada, o una fallida si la clave se usó con otros datos o con otro encabezado"""
+    if peticion_hash != idempotencia.peticion_hash:
+        mensaje = "La clave de idempotencia ya se usó con otros datos"
+    elif (
+        idempotencia.idempotency_key is not None
+        and idempotency_key is not None
+        and idempotency_key != idempotencia.idempotency_key
+    ):
+        mensaje = "Ya se recibió la petición con otro encabezado Idempotency-Key"
+    else:
+        return contenido
+    return OneBaseOut(success=False, message=mensaje, errors=[mensaje], data=None).model_dump_json().encode("utf-8")
+
+
+def build_replayed_response(contenido: bytes) -> Response:
+    """Crear la respuesta de un reintento"""
+    return Response(content=contenido, media_type="application/json", headers={REPLAYED_HEADER: "true"})
+
+
+async def get_idempotent_contents(database: AsyncSession, idempotencias: list[Idempotencia]) -> dict[str, bytes]:
+    """Entregar por clave las respuestas de las peticiones ya recibidas, todas del mismo usuario y ruta"""
+    contenidos = {}
+
+    # Tomar del caché en memoria las que estén
+    faltantes = {}
+    for idempotencia in idempotencias:
+        guardado = idempotencias_cache.get(idempotencia.cache_key)
+        if guardado is None:
+            faltantes[idempotencia.clave] = idempotencia
+        else:
+            contenidos[idempotencia.clave] = get_replayed_content(idempotencia, *guardado)
+
+    # Consultar las demás en una sola consulta por el índice de la restricción única
+    if faltantes:
+        primera = next(iter(faltantes.values()))
+        resultado = await database.execute(
+            select(
+                ExhIdempotencia.clave, ExhIdempotencia.peticion_hash, ExhIdempotencia.idempotency_key, ExhIdempotencia.respuesta
+            )
+            .where(ExhIdempotencia.usuario_id == primera.usuario_id)
+            .where(ExhIdempotencia.ruta == primera.ruta)
+            .where(ExhIdempotencia.clave.in_(faltantes))
+        )
+        for fila in resultado:
+            idempotencia = faltantes[fila.clave]
+            guardado = (fila.peticion_hash, fila.idempotency_key, fila.respuesta.encode("utf-8"))
+            idempotencias_cache.set(idempotencia.cache_key, guardado)
+            contenidos[idempotencia.clave] = get_replayed_content(idempotencia, *guardado)
+
+    # Entregar
+    return contenidos
+
+
+async def get_idempotent_response(database: AsyncSession, idempotencia: Idempotencia) -> Response | None:
+    """Entregar la respuesta de una petición ya recibida, o None si es nueva"""
+    contenidos = await get_idempotent_contents(database, [idempotencia])
+    if idempotencia.clave not in contenidos:
+        return None
+    return build_replayed_response(contenidos[idempotencia.clave])
+
+
+async def save_idempotent_responses(database: AsyncSession, recepciones: list[tuple[Idempotencia, BaseModel]]) -> list[bytes]:
+    """Guardar las respuestas y terminar la transacción, si otra petición ya guardó una clave eleva IntegrityError"""
+
+    # Serializar una sola vez, se entrega y se guarda lo mismo
+    contenidos = [resultado.model_dump_json(by_alias=True) for _, resultado in recepciones]
+
+    # Insertar las respuestas y terminar la transacción, con los registros de las recepciones
+    try:
+        await database.execute(
+            insert(ExhIdempotencia).values(
+                [
+                    {
+                        "usuario_id": idempotencia.usuario_id,
+                        "ruta": idempotencia.ruta,
+                        "clave": idempotencia.clave,
+                        "peticion_hash": idempotencia.peticion_hash,
+                        "idempotency_key": idempotencia.idempotency_key,
+                        "respuesta": contenido,
+                    }
+                    for (idempotencia, _), contenido in zip(recepciones, contenidos)
+                ]
+            )
+        )
+        await database.commit()
+    except IntegrityError:
+        await database.rollback()
+        raise
+
+    # Guardar en el caché en memoria y entregar
+    contenidos = [contenido.encode("utf-8") for contenido in contenidos]
+    for (idempotencia, _), contenido in zip(recepciones, contenidos):
+        idempotencias_cache.set(idempotencia.cache_key, (idempotencia.peticion_hash, idempotencia.idempotency_key, contenido))
+    return contenidos
+
+
+async def save_idempotent_response(database: AsyncSession, idempotencia: Idempotencia, resultado: BaseModel) -> Response:
+    """Guardar la respuesta y terminar la transacción, si otra petición igual ya terminó se entrega la suya"""
+    try:
+        contenidos = await save_idempotent_responses(database, [(idempotencia, resultado)])
+    except IntegrityError:
+        # Otra petición con la misma clave terminó antes, esta ya se deshizo y se entrega aquella
+        respuesta = await get_idempotent_response(database, idempotencia)
+        if respuesta is None:
+            raise
+        return respuesta
+    return Response(content=contenidos[0], media_type="application/json")
@@ -0,0 +1,310 @@
+"""
+Metrics
+
+Métricas del proceso en el formato de texto de Prometheus, se guardan en memoria
+y cada worker de gunicorn tiene las suyas, por eso llevan la etiqueta worker con el PID.
+
+- MetricsMiddleware mide cada petición por plantilla de ruta (por ejemplo /api/v5/estados/{clave}),
+  método y código de estado, y con los eventos del engine de SQLAlchemy cuenta las sentencias
+  SQL y su tiempo en cada petición.
+- observe_storage mide el tiempo de las funciones de google_cloud_storage.py, que se ejecutan
+  en el pool de hilos, por eso se miden por operación y no por petición.
+- También se cuentan los bytes subidos y el tiempo para calcular los hashes.
+- observe_spool cuenta las cargas diferidas (ver upload_spool.py) y mide su retraso.
+"""
+
+import inspect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import Callable, Iterator
+
+from sqlalchemy import Engine, event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENTS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SPOOL_LAG_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+LE_INF = 'le="+Inf"'
+SIN_RUTA = "sin ruta"  # Las peticiones que no coinciden con una ruta se juntan para no crear una serie por URL
+
+
+def escape_label(valor: str) -> str:
+    """Escapar el valor de una etiqueta"""
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(nombres: tuple[str, ...], valores: tuple, extra: str = "") -> str:
+    """Etiquetas con el formato {nombre="valor",...}, siempre incluye worker"""
+    etiquetas = [f'{nombre}="{escape_label(str(valor))}"' for nombre, valor in zip(nombres, valores)]
+    etiquetas.append(f'worker="{os.getpid()}"')
+    if extra:
+        etiquetas.append(extra)
+    return "{" + ",".join(etiquetas) + "}"
+
+
+def format_value(valor: float) -> str:
+    """Número sin decimales si es entero"""
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class Counter:
+    """Contador con etiquetas"""
+
+    def __init__(self, nombre: str, descripcion: str, etiquetas: tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.etiquetas = etiquetas
+        self._valores: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRO.append(self)
+
+    def inc(self, valores: tuple = (), cantidad: float = 1.0) -> None:
+        """Incrementar"""
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0.0) + cantidad
+
+    def collect(self) -> Iterator[str]:
+        """Líneas en el formato de texto de Prometheus"""
+        yield f"# HELP {self.nombre} {self.descripcion}"
+        yield f"# TYPE {self.nombre} counter"
+        with self._lock:
+            valores = list(self._valores.items())
+        for etiquetas, valor in valores:
+            yield f"{self.nombre}{format_labels(self.etiquetas, etiquetas)} {format_value(valor)}"
+
+
+class Histogram:
+    """Histograma con etiquetas, las cubetas son los límites superiores"""
+
+    def __init__(self, nombre: str, descripcion: str, cubetas: tuple[float, ...], etiquetas: tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.cubetas = cubetas
+        self.etiquetas = etiquetas
+        self._valores: dict[tuple, list] = {}  # Por etiquetas, [conteos por cubeta, suma, cantidad]
+        self._lock = threading.Lock()
+        REGISTRO.append(self)
+
+    def observe(self, valor: float, valores: tuple = ()) -> None:
+        """Agregar una observación"""
+        with self._lock:
+            serie = self._valores.get(valores)
+            if serie is None:
+                serie = self._valores[valores] = [[0] * len(self.cubetas), 0.0, 0]
+            for indice, limite in enumerate(self.cubetas):
+                if valor <= limite:
+                    serie[0][indice] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def collect(self) -> Iterator[str]:
+        """Líneas en el formato de texto de Prometheus, las cubetas son acumulativas"""
+        yield f"# HELP {self.nombre} {self.descripcion}"
+        yield f"# TYPE {self.nombre} histogram"
+        with self._lock:
+            valores = [(etiquetas, list(serie[0]), serie[1], serie[2]) for etiquetas, serie in self._valores.items()]
+        for etiquetas, conteos, suma, cantidad in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.cubetas, conteos):
+                acumulado += conteo
+                le = f'le="{format_value(limite)}"'
+                yield f"{self.nombre}_bucket{format_labels(self.etiquetas, etiquetas, le)} {acumulado}"
+            yield f"{self.nombre}_bucket{format_labels(self.etiquetas, etiquetas, LE_INF)} {cantidad}"
+            yield f"{self.nombre}_sum{format_labels(self.etiquetas, etiquetas)} {format_value(suma)}"
+            yield f"{self.nombre}_count{format_labels(self.etiquetas, etiquetas)} {cantidad}"
+
+
+REGISTRO: list[Counter | Histogram] = []
+
+# Peticiones
+http_requests_total = Counter(
+    "http_requests_total",
+    "Peticiones por ruta, método y código de estado",
+    ("route", "method", "status"),
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Latencia de las peticiones por ruta y método",
+    LATENCY_BUCKETS,
+    ("route", "method"),
+)
+
+# Base de datos
+db_statements_per_request = Histogram(
+    "db_statements_per_request",
+    "Sentencias SQL por petición, por ruta y método",
+    STATEMENTS_BUCKETS,
+    ("route", "method"),
+)
+db_seconds_per_request = Histogram(
+    "db_seconds_per_request",
+    "Segundos de sentencias SQL por petición, por ruta y método",
+    LATENCY_BUCKETS,
+    ("route", "method"),
+)
+
+# Google Cloud Storage
+storage_operation_duration_seconds = Histogram(
+    "storage_operation_duration_seconds",
+    "Latencia de las operaciones con Google Cloud Storage",
+    LATENCY_BUCKETS,
+    ("operation", "result"),
+)
+storage_upload_bytes_total = Counter("storage_upload_bytes_total", "Bytes subidos a Google Cloud Storage")
+hash_seconds_total = Counter("hash_seconds_total", "Segundos para calcular los hashes SHA1 y SHA256 de los archivos recibidos")
+hash_bytes_total = Counter("hash_bytes_total", "Bytes procesados por los hashes SHA1 y SHA256")
+
+# Carga diferida de archivos
+upload_spool_jobs_total = Counter("upload_spool_jobs_total", "Intentos de carga diferida por resultado", ("result",))
+upload_spool_lag_seconds = Histogram(
+    "upload_spool_lag_seconds",
+    "Segundos desde la recepción hasta que el archivo quedó en Google Cloud Storage",
+    SPOOL_LAG_BUCKETS,
+)
+
+
+@dataclass
+class RequestMetrics:
+    """Sentencias SQL de la petición en curso"""
+
+    statements: int = 0
+    seconds: float = 0.0
+
+
+request_metrics: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+
+def before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+    """Guardar el inicio de la sentencia SQL en la conexión"""
+    conn.info.setdefault("metrics_inicio", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+    """Sumar la sentencia SQL y su tiempo a la petición en curso"""
+    inicio = conn.info["metrics_inicio"].pop()
+    metricas = request_metrics.get()
+    if metricas is not None:
+        metricas.statements += 1
+        metricas.seconds += time.perf_counter() - inicio
+
+
+def handle_error(contexto) -> None:
+    """Si falla la sentencia SQL quitar su inicio"""
+    inicios = contexto.connection.info.get("metrics_inicio") if contexto.connection is not None else None
+    if inicios:
+        inicios.pop()
+
+
+def register_engine(engine: Engine) -> None:
+    """Registrar los eventos del engine para contar las sentencias SQL de cada petición"""
+    if not event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(engine, "handle_error", handle_error)
+
+
+def get_route_template(scope: dict) -> str:
+    """Plantilla de la ruta que atendió la petición"""
+    route = scope.get("route")
+    return getattr(route, "path", SIN_RUTA)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide las peticiones HTTP"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Guardar el código de estado al iniciar la respuesta
+        estado = {"status": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                estado["status"] = message["status"]
+            await send(message)
+
+        # Atender la petición con sus propias métricas de SQL
+        metricas = RequestMetrics()
+        token = request_metrics.set(metricas)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duracion = time.perf_counter() - inicio
+            request_metrics.reset(token)
+            ruta = get_route_template(scope)
+            metodo = scope["method"]
+            http_requests_total.inc((ruta, metodo, estado["status"]))
+            http_request_duration_seconds.observe(duracion, (ruta, metodo))
+            db_statements_per_request.observe(metricas.statements, (ruta, metodo))
+            db_seconds_per_request.observe(metricas.seconds, (ruta, metodo))
+
+
+def observe_storage(func: Callable) -> Callable:
+    """Decorador que mide la latencia de una operación con Google Cloud Storage, también si es un generador"""
+    operacion = func.__name__
+
+    if inspect.isgeneratorfunction(func):
+
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            inicio = time.perf_counter()
+            resultado = "error"
+            try:
+                yield from func(*args, **kwargs)
+                resultado = "ok"
+            finally:
+                storage_operation_duration_seconds.observe(time.perf_counter() - inicio, (operacion, resultado))
+
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = "error"
+        try:
+            respuesta = func(*args, **kwargs)
+            resultado = "ok"
+            return respuesta
+        finally:
+            storage_operation_duration_seconds.observe(time.perf_counter() - inicio, (operacion, resultado))
+
+    return wrapper
+
+
+def observe_hash(segundos: float, cantidad: int) -> None:
+    """Sumar el tiempo y los bytes procesados por los hashes"""
+    hash_seconds_total.inc(cantidad=segundos)
+    hash_bytes_total.inc(cantidad=cantidad)
+
+
+def observe_upload(cantidad: int) -> None:
+    """Sumar los bytes subidos a Google Cloud Storage"""
+    storage_upload_bytes_total.inc(cantidad=cantidad)
+
+
+def observe_spool(resultado: str, retraso: float | None = None) -> None:
+    """Contar un intento de carga diferida y, si terminó, su retraso"""
+    upload_spool_jobs_total.inc((resultado,))
+    if retraso is not None:
+        upload_spool_lag_seconds.observe(retraso)
+
+
+def render_metrics(extra: dict[str, float] | None = None) -> str:
+    """Todas las métricas en el formato de texto de Prometheus, extra son gauges sin etiquetas"""
+    lineas = []
+    for metrica in REGISTRO:
+        lineas.extend(metrica.collect())
+    for nombre, valor in (extra or {}).items():
+        lineas.append(f"# TYPE {nombre} gauge")
+        lineas.append(f"{nombre}{format_labels((), ())} {format_value(valor)}")
+    return "\n".join(lineas) + "\n"
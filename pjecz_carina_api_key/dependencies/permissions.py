@@ -0,0 +1,96 @@
+"""
+Permissions
+
+Los permisos de un usuario se resuelven con una sola consulta que entrega
+el nivel máximo por módulo de sus roles y permisos activos.
+
+Se guardan en un caché por usuario que se invalida al cambiar sus roles,
+o por completo al cambiar los permisos, los roles o los módulos.
+
+La autentificación los consulta con la sesión asíncrona de la petición, con get_permissions_async;
+get_permissions es para la propiedad Usuario.permissions con una sesión síncrona.
+"""
+
+from sqlalchemy import Select, event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models.modulos import Modulo
+from ..models.permisos import Permiso
+from ..models.roles import Rol
+from ..models.usuarios_roles import UsuarioRol
+from ..settings import get_settings
+from .query_detector import exempt_queries
+from .ttl_cache import TTLCache
+
+settings = get_settings()
+
+# Caché de permisos, la clave es el ID del usuario y el valor el diccionario {modulo.nombre: nivel}
+permisos_cache = TTLCache(ttl=settings.permisos_cache_ttl, max_size=settings.permisos_cache_max_size)
+
+
+def select_permissions(usuario_id: int) -> Select:
+    """Consulta del nivel máximo por módulo de los roles y permisos activos de un usuario"""
+    return (
+        select(Modulo.nombre, func.max(Permiso.nivel))
+        .join(Permiso.modulo)
+        .join(UsuarioRol, UsuarioRol.rol_id == Permiso.rol_id)
+        .filter(UsuarioRol.usuario_id == usuario_id)
+        .filter(UsuarioRol.estatus == "A")
+        .filter(Permiso.estatus == "A")
+        .group_by(Modulo.nombre)
+    )
+
+
+def query_permissions(database: Session, usuario_id: int) -> dict[str, int]:
+    """Consultar en la base de datos el diccionario con los permisos de un usuario"""
+    return {modulo_nombre: nivel for modulo_nombre, nivel in database.execute(select_permissions(usuario_id))}
+
+
+def get_permissions(database: Session, usuario_id: int) -> dict[str, int]:
+    """Entregar los permisos de un usuario, del caché o de la base de datos"""
+    permisos = permisos_cache.get(usuario_id)
+    if permisos is None:
+        with exempt_queries():
+            permisos = query_permissions(database, usuario_id)
+        permisos_cache.set(usuario_id, permisos)
+    return permisos
+
+
+async def get_permissions_async(database: AsyncSession, usuario_id: int) -> dict[str, int]:
+    """Entregar los permisos de un usuario, del caché o de la base de datos con la sesión asíncrona"""
+    permisos = permisos_cache.get(usuario_id)
+    if permisos is None:
+        with exempt_queries():
+            resultado = await database.execute(select_permissions(usuario_id))
+        permisos = {modulo_nombre: nivel for modulo_nombre, nivel in resultado}
+        permisos_cache.set(usuario_id, permisos)
+    return permisos
+
+
+def invalidate_permissions(usuario_id: int | None = None) -> None:
+    """Quitar del caché los permisos de un usuario, o de todos si no se indica"""
+    if usuario_id is None:
+        permisos_cache.clear()
+    else:
+        permisos_cache.pop(usuario_id)
+
+
+@event.listens_for(UsuarioRol, "after_insert")
+@event.listens_for(UsuarioRol, "after_update")
+@event.listens_for(UsuarioRol, "after_delete")
+def invalidate_permissions_on_usuario_rol_change(_mapper, _connection, target: UsuarioRol) -> None:
+    """Al cambiar los roles de un usuario invalidar sus permisos"""
+    invalidate_permissions(target.usuario_id)
+
+
+@event.listens_for(Permiso, "after_insert")
+@event.listens_for(Permiso, "after_update")
+@event.listens_for(Permiso, "after_delete")
+@event.listens_for(Rol, "after_update")
+@event.listens_for(Rol, "after_delete")
+@event.listens_for(Modulo, "after_update")
+@event.listens_for(Modulo, "after_delete")
+def invalidate_permissions_on_change(_mapper, _connection, _target) -> None:
+    """Al cambiar un permiso, un rol o un módulo invalidar los permisos de todos"""
+    invalidate_permissions()
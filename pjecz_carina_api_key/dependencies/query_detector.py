@@ -0,0 +1,174 @@
+"""
+Query detector
+
+Detector de consultas N+1 para desarrollo y pruebas, se activa con settings.consultas_detector
+(variable de entorno CONSULTAS_DETECTOR=true), en producción no se registra nada.
+
+En cada petición se registran las sentencias SQL. Si la misma sentencia se ejecuta con distintos
+parámetros settings.consultas_detector_repetidas veces o más, se reporta con la relación que se cargó
+de forma perezosa (por ejemplo Municipio.estado) y el lugar del código que la provocó.
+
+Las rutas pueden declarar cuántas sentencias pueden ejecutar con el decorador query_budget,
+se revisa al terminar la ruta y la serialización de la respuesta, antes de enviarla. No cuentan
+las sentencias dentro de exempt_queries, que llenan los cachés (usuario, permisos y catálogos).
+
+Los reportes se escriben en el log; con settings.consultas_detector_raise se eleva MyQueryBudgetError,
+que se convierte en un error 500 y que en las pruebas con TestClient llega como excepción.
+"""
+
+import logging
+import re
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from ..settings import get_settings
+from .exceptions import MyQueryBudgetError
+
+RAIZ = str(Path(__file__).parent.parent.parent)  # Directorio del proyecto, para reportar también las pruebas
+ESTE_ARCHIVO = __file__
+LITERALES_REGEXP = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Sentencia:
+    """Sentencia SQL registrada en la petición"""
+
+    veces: int = 0
+    relacion: str | None = None
+    origen: str | None = None
+
+
+@dataclass
+class QueryLog:
+    """Sentencias SQL de la petición en curso"""
+
+    cantidad: int = 0
+    sentencias: dict[str, Sentencia] = field(default_factory=dict)
+    relacion: str | None = None  # Relación perezosa de la siguiente sentencia
+
+
+query_log: ContextVar[QueryLog | None] = ContextVar("query_log", default=None)
+query_exempt: ContextVar[bool] = ContextVar("query_exempt", default=False)
+
+
+def query_budget(max_statements: int) -> Callable:
+    """Decorador para declarar cuántas sentencias SQL puede ejecutar una ruta"""
+
+    def decorator(func: Callable) -> Callable:
+        func.query_budget = max_statements
+        return func
+
+    return decorator
+
+
+@contextmanager
+def exempt_queries():
+    """Las sentencias dentro de este bloque no cuentan para el detector, por ejemplo al llenar un caché"""
+    token = query_exempt.set(True)
+    try:
+        yield
+    finally:
+        query_exempt.reset(token)
+
+
+def get_call_site() -> str:
+    """Primer lugar del código del proyecto que no es este archivo ni una librería, desde el más reciente"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        archivo = frame.f_code.co_filename
+        if archivo.startswith(RAIZ) and archivo != ESTE_ARCHIVO and "site-packages" not in archivo:
+            return f"{Path(archivo).relative_to(RAIZ)}:{frame.f_lineno} en {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "desconocido"
+
+
+def do_orm_execute(orm_execute_state: ORMExecuteState) -> None:
+    """Guardar la relación que se carga de forma perezosa para la siguiente sentencia"""
+    log = query_log.get()
+    if log is not None and orm_execute_state.is_relationship_load:
+        log.relacion = str(orm_execute_state.loader_strategy_path[-1])
+
+
+def before_cursor_execute(_conn, _cursor, statement, _parameters, _context, _executemany) -> None:
+    """Registrar la sentencia en la petición en curso"""
+    log = query_log.get()
+    if log is None or query_exempt.get():
+        return
+    log.cantidad += 1
+    sentencia = log.sentencias.setdefault(LITERALES_REGEXP.sub("?", statement), Sentencia())
+    sentencia.veces += 1
+    if sentencia.veces == 2:
+        sentencia.relacion = log.relacion
+        sentencia.origen = get_call_site()
+    log.relacion = None
+
+
+def register_query_detector(engine: Engine) -> None:
+    """Registrar los eventos del engine y de las sesiones si está activo el detector"""
+    if not get_settings().consultas_detector:
+        return
+    if not event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    if not event.contains(Session, "do_orm_execute", do_orm_execute):
+        event.listen(Session, "do_orm_execute", do_orm_execute)
+
+
+def check_query_log(log: QueryLog, nombre: str, budget: int | None) -> list[str]:
+    """Revisar las sentencias de una petición, entrega los reportes"""
+    settings = get_settings()
+    reportes = []
+
+    # Revisar el presupuesto de la ruta
+    if budget is not None and log.cantidad > budget:
+        reportes.append(f"{nombre}: ejecutó {log.cantidad} sentencias SQL y su presupuesto es {budget}")
+
+    # Revisar las sentencias repetidas
+    for texto, sentencia in log.sentencias.items():
+        if sentencia.veces >= settings.consultas_detector_repetidas:
+            relacion = f" por la relación {sentencia.relacion}" if sentencia.relacion else ""
+            reportes.append(
+                f"{nombre}: se repitió {sentencia.veces} veces{relacion} desde {sentencia.origen}: {' '.join(texto.split())}"
+            )
+
+    return reportes
+
+
+class QueryDetectorMiddleware:
+    """Middleware ASGI que registra las sentencias SQL de cada petición y las revisa antes de responder"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+
+        async def send_checked(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                endpoint = getattr(route, "endpoint", None)
+                nombre = f"{scope['method']} {getattr(route, 'path', scope['path'])} ({getattr(endpoint, '__name__', '')})"
+                reportes = check_query_log(log, nombre, getattr(endpoint, "query_budget", None))
+                for reporte in reportes:
+                    logger.warning(reporte)
+                if reportes and get_settings().consultas_detector_raise:
+                    raise MyQueryBudgetError("\n".join(reportes))
+            await send(message)
+
+        token = query_log.set(log)
+        try:
+            await self.app(scope, receive, send_checked)
+        finally:
+            query_log.reset(token)
@@ -1,8 +1,20 @@
 """
 Safe string
+
+Estas funciones se llaman por cada campo de las partes y promoventes al recibir, por eso
+las expresiones regulares se compilan una sola vez y la transliteración evita unidecode
+cuando es posible:
+
+- Si el texto es ASCII se entrega tal cual, como lo hace unidecode.
+- Si todos los caracteres son latinos (menores a U+0250) se usa str.translate con una tabla
+  construida con el mismo unidecode, carácter por carácter, así que el resultado es idéntico.
+- En otro caso se usa unidecode.
+
+La transliteración que conserva la ñ se memoriza porque los nombres se repiten entre peticiones.
 """
 
 import re
+from functools import lru_cache
 
 from unidecode import unidecode
 
@@ -16,6 +28,43 @@ QUINCENA_REGEXP = r"^\d{6}$"
 RFC_REGEXP = r"^[a-zA-Z]{3,4}\d{6}[a-zA-Z0-9]{3}$"
 TOKEN_REGEXP = r"^[a-zA-Z0-9_.=+-]+$"
 
+# Expresiones regulares compiladas
+CURP_PATTERN = re.compile(CURP_REGEXP)
+EMAIL_PATTERN = re.compile(EMAIL_REGEXP)
+EMAIL_FRAGMENT_PATTERN = re.compile(r"^[\w.-]*@*[\w.-]*\.*\w*$")
+QUINCENA_PATTERN = re.compile(QUINCENA_REGEXP)
+RFC_PATTERN = re.compile(RFC_REGEXP)
+NOT_ALPHANUMERIC_PATTERN = re.compile(r"[^a-zA-Z0-9]+")
+NOT_DIGITS_PATTERN = re.compile(r"[^0-9]+")
+NOT_SAFE_PATTERN = re.compile(r"[^a-zA-Z0-9.()/-]+")
+NOT_SAFE_ACCENTS_PATTERN = re.compile(r"[^a-záéíóúüA-ZÁÉÍÓÚÜ0-9.()/-]+")
+NOT_SAFE_ACCENTS_ENIE_PATTERN = re.compile(r"[^a-záéíóúüñA-ZÁÉÍÓÚÜÑ0-9.()/-]+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Tablas de transliteración de los caracteres latinos, las mismas que usa unidecode
+LATIN_LIMIT = "ɐ"
+LATIN_TABLE = {codigo: unidecode(chr(codigo)) for codigo in range(0x80, ord(LATIN_LIMIT))}
+LATIN_ENIE_TABLE = {**LATIN_TABLE, ord("ñ"): "ñ", ord("Ñ"): "Ñ"}
+
+
+def transliterate(input_str: str) -> str:
+    """Transliterar a ASCII, igual que unidecode"""
+    if input_str.isascii():
+        return input_str
+    if max(input_str) < LATIN_LIMIT:
+        return input_str.translate(LATIN_TABLE)
+    return unidecode(input_str)
+
+
+@lru_cache(maxsize=1024)
+def transliterate_save_enie(input_str: str) -> str:
+    """Transliterar a ASCII conservando la ñ y la Ñ, igual que unidecode carácter por carácter"""
+    if input_str.isascii():
+        return input_str
+    if max(input_str) < LATIN_LIMIT:
+        return input_str.translate(LATIN_ENIE_TABLE)
+    return "ñ".join("Ñ".join(unidecode(parte) for parte in fragmento.split("Ñ")) for fragmento in input_str.split("ñ"))
+
 
 def safe_clave(input_str, max_len=16, only_digits=False, separator="-") -> str:
     """Safe clave"""
@@ -25,10 +74,10 @@ def safe_clave(input_str, max_len=16, only_digits=False, separator="-") -> str:
     if stripped == "":
         return ""
     if only_digits:
-        clean_string = re.sub(r"[^0-9]+", separator, stripped)
+        clean_string = NOT_DIGITS_PATTERN.sub(separator, stripped)
     else:
-        clean_string = re.sub(r"[^a-zA-Z0-9]+", separator, unidecode(stripped))
-    without_spaces = re.sub(r"\s+", "", clean_string)
+        clean_string = NOT_ALPHANUMERIC_PATTERN.sub(separator, transliterate(stripped))
+    without_spaces = WHITESPACE_PATTERN.sub("", clean_string)
     final = without_spaces.upper()
     if len(final) > max_len:
         return final[:max_len]
@@ -42,10 +91,8 @@ def safe_curp(input_str, is_optional=False, search_fragment=False) -> str:
     stripped = input_str.strip()
     if is_optional and stripped == "":
         return ""
-    clean_string = re.sub(r"[^a-zA-Z0-9]+", " ", unidecode(stripped))
-    without_spaces = re.sub(r"\s+", "", clean_string)
-    final = without_spaces.upper()
-    if search_fragment is False and re.match(CURP_REGEXP, final) is None:
+    final = NOT_ALPHANUMERIC_PATTERN.sub("", transliterate(stripped)).upper()
+    if search_fragment is False and CURP_PATTERN.match(final) is None:
         raise ValueError("CURP inválida")
     return final
 
@@ -58,10 +105,10 @@ def safe_email(input_str, search_fragment=False) -> str:
     if final == "":
         return ""
     if search_fragment:
-        if re.match(r"^[\w.-]*@*[\w.-]*\.*\w*$", final) is None:
+        if EMAIL_FRAGMENT_PATTERN.match(final) is None:
             return ""
         return final
-    if re.match(EMAIL_REGEXP, final) is None:
+    if EMAIL_PATTERN.match(final) is None:
         raise ValueError("E-mail inválido")
     return final
 
@@ -69,7 +116,7 @@ def safe_email(input_str, search_fragment=False) -> str:
 def safe_quincena(input_str) -> str:
     """Safe quincena"""
     final = input_str.strip()
-    if re.match(QUINCENA_REGEXP, final) is None:
+    if QUINCENA_PATTERN.match(final) is None:
         raise ValueError("Quincena invalida")
     return final
 
@@ -89,10 +136,8 @@ def safe_rfc(input_str, is_optional=False, search_fragment=False) -> str:
     stripped = input_str.strip()
     if is_optional and stripped == "":
         return ""
-    clean_string = re.sub(r"[^a-zA-Z0-9]+", " ", unidecode(stripped))
-    without_spaces = re.sub(r"\s+", "", clean_string)
-    final = without_spaces.upper()
-    if search_fragment is False and re.match(RFC_REGEXP, final) is None:
+    final = NOT_ALPHANUMERIC_PATTERN.sub("", transliterate(stripped)).upper()
+    if search_fragment is False and RFC_PATTERN.match(final) is None:
         raise ValueError("RFC inválido")
     return final
 
@@ -101,26 +146,16 @@ def safe_string(input_str, max_len=250, do_unidecode=True, save_enie=False, to_u
     """Safe string"""
     if not isinstance(input_str, str):
         return ""
-    if do_unidecode:
-        new_string = re.sub(r"[^a-zA-Z0-9.()/-]+", " ", input_str)
-        if save_enie:
-            new_string = ""
-            for char in input_str:
-                if char == "ñ":
-                    new_string += "ñ"
-                elif char == "Ñ":
-                    new_string += "Ñ"
-                else:
-                    new_string += unidecode(char)
-        else:
-            new_string = re.sub(r"[^a-zA-Z0-9.()/-]+", " ", unidecode(input_str))
+
+    # Sólo la transliteración que conserva la ñ deja pasar espacios distintos a uno solo
+    if do_unidecode and save_enie:
+        final = WHITESPACE_PATTERN.sub(" ", transliterate_save_enie(input_str)).strip()
+    elif do_unidecode:
+        final = NOT_SAFE_PATTERN.sub(" ", transliterate(input_str)).strip()
+    elif save_enie:
+        final = NOT_SAFE_ACCENTS_ENIE_PATTERN.sub(" ", input_str).strip()
     else:
-        if save_enie is False:
-            new_string = re.sub(r"[^a-záéíóúüA-ZÁÉÍÓÚÜ0-9.()/-]+", " ", input_str)
-        else:
-            new_string = re.sub(r"[^a-záéíóúüñA-ZÁÉÍÓÚÜÑ0-9.()/-]+", " ", input_str)
-    removed_multiple_spaces = re.sub(r"\s+", " ", new_string)
-    final = removed_multiple_spaces.strip()
+        final = NOT_SAFE_ACCENTS_PATTERN.sub(" ", input_str).strip()
     if to_uppercase:
         final = final.upper()
     if max_len == 0:
@@ -132,8 +167,7 @@ def safe_telefono(input_str) -> str:
     """Safe telefono always ten digits"""
     if not isinstance(input_str, str) or input_str.strip() == "":
         return ""
-    input_str = input_str.strip()
-    only_digits = re.sub(r"[^0-9]", "", input_str)
+    only_digits = NOT_DIGITS_PATTERN.sub("", input_str)
     if len(only_digits) == 10:
         return only_digits
     return ""
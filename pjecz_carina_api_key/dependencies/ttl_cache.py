@@ -0,0 +1,67 @@
+"""
+TTL Cache
+
+Caché en memoria del proceso (uno por cada worker de gunicorn) con tiempo de vida
+por registro y límite de tamaño; al llenarse se desecha el registro usado hace más tiempo (LRU).
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """Caché con tiempo de vida y desalojo LRU, seguro entre hilos"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._datos: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._datos)
+
+    def get(self, clave: Hashable, por_defecto: Any = None) -> Any:
+        """Obtener un valor vigente, si expiró o no existe entregar por_defecto"""
+        with self._lock:
+            registro = self._datos.get(clave)
+            if registro is None:
+                return por_defecto
+            expira, valor = registro
+            if expira < monotonic():
+                del self._datos[clave]
+                return por_defecto
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave: Hashable, valor: Any) -> None:
+        """Guardar un valor, si se rebasa el tamaño máximo se desecha el menos usado"""
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._datos[clave] = (monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_size:
+                self._datos.popitem(last=False)
+
+    def pop(self, clave: Hashable) -> Any:
+        """Quitar un valor y entregarlo, o None si no existe"""
+        with self._lock:
+            registro = self._datos.pop(clave, None)
+        return None if registro is None else registro[1]
+
+    def pop_where(self, condicion: Callable[[Hashable, Any], bool]) -> int:
+        """Quitar los valores que cumplan la condición, entrega la cantidad quitada"""
+        with self._lock:
+            claves = [clave for clave, (_, valor) in self._datos.items() if condicion(clave, valor)]
+            for clave in claves:
+                del self._datos[clave]
+        return len(claves)
+
+    def clear(self) -> None:
+        """Vaciar el caché"""
+        with self._lock:
+            self._datos.clear()
@@ -0,0 +1,374 @@
+"""
+Upload Spool
+
+Carga diferida de los archivos recibidos a Google Cloud Storage, se activa con settings.archivos_spool_dir
+(variable de entorno ARCHIVOS_SPOOL_DIR), que debe ser un directorio en un disco persistente o compartido.
+
+1. Al recibir el archivo se validan su tamaño y sus hashes mientras se escribe en el directorio,
+   junto con un archivo JSON con lo necesario para subirlo. El JSON se escribe al final,
+   un trabajo existe si existe su JSON.
+2. La ruta marca el archivo como RECIBIDO con su tamaño y sin URL, y responde sin esperar a Google.
+3. Los workers de carga (settings.archivos_spool_workers por proceso) suben el archivo, ponen la URL
+   y el tamaño en la base de datos y borran el trabajo. Si falla se reintenta, la espera se duplica
+   en cada intento hasta settings.archivos_spool_espera_maxima, nunca se desecha un archivo recibido.
+
+Al arrancar y cada settings.archivos_spool_revision segundos se revisa el directorio, así se recuperan
+los trabajos de un reinicio o de otro proceso que terminó. Cada trabajo se bloquea con flock mientras
+se sube, para que dos procesos no suban el mismo archivo al mismo tiempo.
+
+El JSON se escribe antes de que la ruta confirme la recepción en la base de datos, por eso la revisión
+sólo recupera los trabajos con más de settings.archivos_spool_gracia segundos, más que el tiempo máximo
+de una petición. Si aun así el registro no está RECIBIDO al subirlo, el trabajo se conserva y se vuelve a
+intentar mientras sea más reciente que la gracia; después se borra, porque la recepción nunca se confirmó.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import UploadFile
+from sqlalchemy import or_, update
+
+from ..settings import Settings, get_settings
+from .database import Base, get_async_session_local
+from .file_ingestion import TAMANO_MAXIMO, HashingReader, ingest_upload_file, validate_hashes
+from .google_cloud_storage import UPLOAD_CHUNK_SIZE, run_in_storage_executor, upload_stream_to_gcs
+from .metrics import observe_spool
+
+HUERFANOS_SEGUNDOS = 60 * 60  # Los archivos sin JSON de más de una hora son recepciones interrumpidas
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SpoolJob:
+    """Trabajo de carga de un archivo recibido, se guarda como JSON junto al archivo"""
+
+    nombre: str
+    tabla: str
+    registro_id: int
+    bucket_name: str
+    blob_name: str
+    content_type: str
+    tamano: int
+    creado: float  # Segundos desde la época, para medir el retraso aunque se reinicie
+    intentos: int = field(default=0, compare=False)
+
+
+@dataclass
+class SpoolState:
+    """Cola y trabajos pendientes de este proceso"""
+
+    directorio: Path
+    cola: asyncio.Queue
+    pendientes: dict[str, SpoolJob] = field(default_factory=dict)
+    tareas: list[asyncio.Task] = field(default_factory=list)
+
+
+_spool: SpoolState | None = None
+
+
+def get_data_path(directorio: Path, nombre: str) -> Path:
+    """Archivo con los datos del trabajo"""
+    return directorio / f"{nombre}.pdf"
+
+
+def get_job_path(directorio: Path, nombre: str) -> Path:
+    """Archivo JSON del trabajo"""
+    return directorio / f"{nombre}.json"
+
+
+def fsync_directory(directorio: Path) -> None:
+    """Asegurar en el disco las altas y bajas de archivos en el directorio"""
+    descriptor = os.open(directorio, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def spool_file(
+    archivo: BinaryIO,
+    directorio: Path,
+    tabla: str,
+    registro_id: int,
+    bucket_name: str,
+    blob_name: str,
+    hash_sha1: str | None,
+    hash_sha256: str | None,
+    content_type: str = "application/pdf",
+    tamano_maximo: int = TAMANO_MAXIMO,
+) -> SpoolJob:
+    """Escribir el archivo en el directorio validando su tamaño y sus hashes, y después su JSON"""
+    nombre = uuid.uuid4().hex
+    datos_path = get_data_path(directorio, nombre)
+
+    # Copiar por partes, los hashes se calculan en la misma pasada
+    archivo.seek(0)
+    lector = HashingReader(archivo, tamano_maximo)
+    try:
+        with open(datos_path, "wb") as destino:
+            while datos := lector.read(UPLOAD_CHUNK_SIZE):
+                destino.write(datos)
+            destino.flush()
+            os.fsync(destino.fileno())
+        validate_hashes(lector.sha1.hexdigest(), lector.sha256.hexdigest(), hash_sha1, hash_sha256)
+    except Exception:
+        datos_path.unlink(missing_ok=True)
+        raise
+
+    # Escribir el JSON en un temporal y renombrarlo, así nunca queda a medias
+    trabajo = SpoolJob(
+        nombre=nombre,
+        tabla=tabla,
+        registro_id=registro_id,
+        bucket_name=bucket_name,
+        blob_name=blob_name,
+        content_type=content_type,
+        tamano=lector.tamano,
+        creado=time.time(),
+    )
+    trabajo_path = get_job_path(directorio, nombre)
+    temporal_path = trabajo_path.with_suffix(".json.tmp")
+    with open(temporal_path, "w", encoding="utf-8") as destino:
+        json.dump(asdict(trabajo), destino)
+        destino.flush()
+        os.fsync(destino.fileno())
+    os.replace(temporal_path, trabajo_path)
+    fsync_directory(directorio)
+
+    # Entregar
+    return trabajo
+
+
+def read_spool_jobs(directorio: Path, ahora: float | None = None, gracia: float = 0) -> list[SpoolJob]:
+    """Leer los trabajos con más de gracia segundos, del más antiguo al más reciente, y borrar los archivos huérfanos"""
+    ahora = time.time() if ahora is None else ahora
+    trabajos = []
+    for path in directorio.iterdir():
+        if path.suffix == ".json":
+            try:
+                trabajo = SpoolJob(**json.loads(path.read_text(encoding="utf-8")))
+            except FileNotFoundError:
+                continue  # Otro proceso lo terminó
+            if ahora - trabajo.creado >= gracia:
+                trabajos.append(trabajo)
+        elif not get_job_path(directorio, path.name.split(".")[0]).exists():
+            try:
+                if ahora - path.stat().st_mtime > HUERFANOS_SEGUNDOS:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+    return sorted(trabajos, key=lambda trabajo: trabajo.creado)
+
+
+def lock_spool_job(directorio: Path, trabajo: SpoolJob) -> int | None:
+    """Bloquear el trabajo, entrega None si lo tiene otro proceso o ya se terminó"""
+    try:
+        descriptor = os.open(get_job_path(directorio, trabajo.nombre), os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(descriptor)
+        return None
+    if os.fstat(descriptor).st_nlink == 0:
+        os.close(descriptor)
+        return None
+    return descriptor
+
+
+def upload_spooled_file(directorio: Path, trabajo: SpoolJob) -> str:
+    """Subir el archivo del trabajo a Google Cloud Storage, entrega la URL pública"""
+    with open(get_data_path(directorio, trabajo.nombre), "rb") as archivo:
+        return upload_stream_to_gcs(
+            bucket_name=trabajo.bucket_name,
+            blob_name=trabajo.blob_name,
+            content_type=trabajo.content_type,
+            stream=archivo,
+            size=trabajo.tamano,
+        )
+
+
+def remove_spool_job(directorio: Path, trabajo: SpoolJob) -> None:
+    """Borrar el trabajo terminado, primero el JSON para que ya no se recupere"""
+    get_job_path(directorio, trabajo.nombre).unlink(missing_ok=True)
+    get_data_path(directorio, trabajo.nombre).unlink(missing_ok=True)
+    fsync_directory(directorio)
+
+
+def get_retry_delay(settings: Settings, intentos: int) -> float:
+    """Segundos de espera para el siguiente intento, se duplica en cada uno"""
+    return min(settings.archivos_spool_espera * 2 ** (intentos - 1), settings.archivos_spool_espera_maxima)
+
+
+async def process_spool_job(spool: SpoolState, trabajo: SpoolJob) -> str:
+    """
+    Subir el archivo y poner su URL y tamaño en la base de datos
+
+    :return: ok si terminó, bloqueado si lo tiene otro proceso, esperando si la recepción aún no se confirma
+        o descartado si nunca se confirmó
+    """
+    settings = get_settings()
+
+    # Bloquear el trabajo
+    descriptor = lock_spool_job(spool.directorio, trabajo)
+    if descriptor is None:
+        return "bloqueado"
+
+    try:
+        # Subir el archivo
+        url = await run_in_storage_executor(upload_spooled_file, spool.directorio, trabajo)
+
+        # Poner la URL y el tamaño, sólo si la recepción ya se confirmó y no tiene la URL de otro archivo
+        tabla = Base.metadata.tables[trabajo.tabla]
+        async with get_async_session_local(settings)() as database:
+            resultado = await database.execute(
+                update(tabla)
+                .where(tabla.c.id == trabajo.registro_id)
+                .where(tabla.c.estado == "RECIBIDO")
+                .where(or_(tabla.c.url.is_(None), tabla.c.url == url))
+                .values(url=url, tamano=trabajo.tamano)
+            )
+            await database.commit()
+
+        # Si no se actualizó y es reciente, la petición no ha terminado y se vuelve a intentar
+        if resultado.rowcount == 0 and time.time() - trabajo.creado < settings.archivos_spool_gracia:
+            return "esperando"
+        if resultado.rowcount == 0:
+            logger.warning(
+                "Se descarta %s, la recepción del registro %s no se confirmó", trabajo.blob_name, trabajo.registro_id
+            )
+
+        # Borrar el trabajo
+        await run_in_storage_executor(remove_spool_job, spool.directorio, trabajo)
+    finally:
+        os.close(descriptor)
+
+    return "ok" if resultado.rowcount > 0 else "descartado"
+
+
+async def run_spool_worker(spool: SpoolState) -> None:
+    """Worker de carga, toma los trabajos de la cola y si fallan los regresa después de esperar"""
+    settings = get_settings()
+    loop = asyncio.get_running_loop()
+    while True:
+        trabajo = await spool.cola.get()
+        try:
+            resultado = await process_spool_job(spool, trabajo)
+        except Exception as error:
+            trabajo.intentos += 1
+            espera = get_retry_delay(settings, trabajo.intentos)
+            logger.warning(
+                "No se pudo subir %s, intento %s, se reintenta en %ss: %s", trabajo.blob_name, trabajo.intentos, espera, error
+            )
+            observe_spool("error")
+            loop.call_later(espera, spool.cola.put_nowait, trabajo)
+            continue
+        if resultado == "esperando":
+            loop.call_later(settings.archivos_spool_espera, spool.cola.put_nowait, trabajo)
+            continue
+        spool.pendientes.pop(trabajo.nombre, None)
+        if resultado == "ok":
+            observe_spool(resultado, time.time() - trabajo.creado)
+        elif resultado == "descartado":
+            observe_spool(resultado)
+
+
+def enqueue_spool_job(trabajo: SpoolJob | None) -> None:
+    """Formar el trabajo en la cola de este proceso, después de confirmar la recepción en la base de datos"""
+    if trabajo is None or _spool is None or trabajo.nombre in _spool.pendientes:
+        return
+    _spool.pendientes[trabajo.nombre] = trabajo
+    _spool.cola.put_nowait(trabajo)
+
+
+async def discard_spool_job(trabajo: SpoolJob | None) -> None:
+    """Borrar el trabajo de una recepción que no se confirmó en la base de datos"""
+    if trabajo is None or _spool is None:
+        return
+    await run_in_storage_executor(remove_spool_job, _spool.directorio, trabajo)
+
+
+async def run_spool_recovery(spool: SpoolState) -> None:
+    """Revisar el directorio cada settings.archivos_spool_revision segundos para recuperar los trabajos"""
+    settings = get_settings()
+    while True:
+        for trabajo in await run_in_storage_executor(read_spool_jobs, spool.directorio, None, settings.archivos_spool_gracia):
+            enqueue_spool_job(trabajo)
+        await asyncio.sleep(settings.archivos_spool_revision)
+
+
+async def start_upload_spool(settings: Settings) -> None:
+    """Al arrancar el proceso crear la cola, los workers de carga y la revisión del directorio"""
+    global _spool
+    if settings.archivos_spool_dir == "" or _spool is not None:
+        return
+    directorio = Path(settings.archivos_spool_dir)
+    directorio.mkdir(parents=True, exist_ok=True)
+    _spool = SpoolState(directorio=directorio, cola=asyncio.Queue())
+    _spool.tareas.append(asyncio.create_task(run_spool_recovery(_spool)))
+    for _ in range(settings.archivos_spool_workers):
+        _spool.tareas.append(asyncio.create_task(run_spool_worker(_spool)))
+
+
+async def stop_upload_spool() -> None:
+    """Al terminar el proceso detener los workers de carga, los trabajos pendientes se quedan en el directorio"""
+    global _spool
+    if _spool is None:
+        return
+    for tarea in _spool.tareas:
+        tarea.cancel()
+    await asyncio.gather(*_spool.tareas, return_exceptions=True)
+    _spool = None
+
+
+def get_spool_status() -> dict:
+    """Trabajos pendientes de este proceso y segundos del más antiguo, vacío si no está activa"""
+    if _spool is None:
+        return {}
+    pendientes = list(_spool.pendientes.values())
+    return {
+        "depth": len(pendientes),
+        "lag_seconds": time.time() - min(trabajo.creado for trabajo in pendientes) if pendientes else 0,
+    }
+
+
+async def receive_upload_file(
+    archivo: UploadFile,
+    tabla: str,
+    registro_id: int,
+    bucket_name: str,
+    blob_name: str,
+    hash_sha1: str | None,
+    hash_sha256: str | None,
+) -> tuple[str | None, int, SpoolJob | None]:
+    """
+    Recibir un UploadFile validando su tamaño y sus hashes, si está activa la carga diferida se escribe
+    en el directorio y la URL es None, si no se sube a Google Cloud Storage
+
+    :return: URL pública, tamaño en bytes y el trabajo para enqueue_spool_job
+    """
+    if _spool is None:
+        url, tamano = await ingest_upload_file(archivo, bucket_name, blob_name, hash_sha1, hash_sha256)
+        return url, tamano, None
+    trabajo = await run_in_storage_executor(
+        spool_file,
+        archivo.file,
+        _spool.directorio,
+        tabla,
+        registro_id,
+        bucket_name,
+        blob_name,
+        hash_sha1,
+        hash_sha256,
+    )
+    return None, trabajo.tamano, trabajo
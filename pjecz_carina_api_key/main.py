@@ -2,12 +2,20 @@
 PJECZ Carina API Key
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi_pagination import add_pagination
 
+from .dependencies.database import dispose_async_engine, dispose_engine, get_async_engine, get_engine
 from .dependencies.fastapi_validation_exception_handler import validation_exception_handler
+from .dependencies.google_cloud_storage import shutdown_storage
+from .dependencies.metrics import MetricsMiddleware
+from .dependencies.query_detector import QueryDetectorMiddleware
+from .dependencies.upload_spool import start_upload_spool, stop_upload_spool
 from .routers.autoridades import autoridades
 from .routers.bitacoras import bitacoras
 from .routers.distritos import distritos
@@ -18,6 +26,7 @@ from .routers.exh_areas import exh_areas
 from .routers.exh_exhortos import exh_exhortos
 from .routers.exh_exhortos_actualizaciones import exh_exhortos_actualizaciones
 from .routers.exh_exhortos_archivos import exh_exhortos_archivos
+from .routers.exh_exhortos_archivos_cargas import exh_exhortos_archivos_cargas
 from .routers.exh_exhortos_partes import exh_exhortos_partes
 from .routers.exh_exhortos_promociones import exh_exhortos_promociones
 from .routers.exh_exhortos_promociones_archivos import exh_exhortos_promociones_archivos
@@ -29,6 +38,7 @@ from .routers.exh_exhortos_respuestas_videos import exh_exhortos_respuestas_vide
 from .routers.exh_externos import exh_externos
 from .routers.exh_tipos_diligencias import exh_tipos_diligencias
 from .routers.materias import materias
+from .routers.metricas import metricas
 from .routers.modulos import modulos
 from .routers.municipios import municipios
 from .routers.oficinas import oficinas
@@ -39,24 +49,49 @@ from .routers.usuarios import usuarios
 from .routers.usuarios_roles import usuarios_roles
 from .settings import get_settings
 
+# Configuración
+settings = get_settings()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """Al arrancar el worker crear los engines de la base de datos y al terminar cerrar sus conexiones"""
+    get_engine(settings)
+    get_async_engine(settings)
+    await start_upload_spool(settings)
+    yield
+    await stop_upload_spool()
+    await dispose_async_engine()
+    dispose_engine()
+    shutdown_storage()
+
+
 # FastAPI
 app = FastAPI(
     title="PJECZ Carina API Key",
     description="API con autentificación para enviar y recibir exhortos.",
     docs_url="/docs",
     redoc_url=None,
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORSMiddleware
-settings = get_settings()
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.origins.split(","),
     allow_credentials=False,
-    allow_methods=["GET", "POST"],
+    allow_methods=["GET", "POST", "PUT"],
     allow_headers=["*"],
 )
 
+# QueryDetectorMiddleware, sólo en desarrollo y pruebas
+if settings.consultas_detector:
+    app.add_middleware(QueryDetectorMiddleware)
+
+# MetricsMiddleware, al final para que sea el primero y mida todo
+app.add_middleware(MetricsMiddleware)
+
 # Override the default validation exception handler
 app.add_exception_handler(RequestValidationError, handler=validation_exception_handler)
 
@@ -71,6 +106,7 @@ app.include_router(exh_areas, include_in_schema=False)
 app.include_router(exh_exhortos, tags=["exhortos"])
 app.include_router(exh_exhortos_actualizaciones, tags=["exhortos"])
 app.include_router(exh_exhortos_archivos, tags=["exhortos"])
+app.include_router(exh_exhortos_archivos_cargas, tags=["exhortos"])
 app.include_router(exh_exhortos_partes, include_in_schema=False)
 app.include_router(exh_exhortos_promociones, tags=["exhortos"])
 app.include_router(exh_exhortos_promociones_archivos, tags=["exhortos"])
@@ -82,6 +118,7 @@ app.include_router(exh_exhortos_respuestas_videos, include_in_schema=False)
 app.include_router(exh_externos, include_in_schema=False)
 app.include_router(exh_tipos_diligencias, include_in_schema=False)
 app.include_router(materias, tags=["materias"])
+app.include_router(metricas, include_in_schema=False)
 app.include_router(modulos, include_in_schema=False)
 app.include_router(municipios, include_in_schema=False)
 app.include_router(oficinas, include_in_schema=False)
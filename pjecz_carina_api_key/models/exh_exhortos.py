@@ -5,7 +5,7 @@ Exh Exhortos, modelos
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import Enum, ForeignKey, String
+from sqlalchemy import Enum, ForeignKey, Index, String, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql.functions import now
@@ -39,6 +39,12 @@ class ExhExhorto(Base, UniversalMixin):
     # Nombre de la tabla
     __tablename__ = "exh_exhortos"
 
+    # Índices, los parciales solo incluyen los registros activos
+    __table_args__ = (
+        Index("ix_exh_exhortos_exhorto_origen_id_activos", "exhorto_origen_id", postgresql_where=text("estatus = 'A'")),
+        Index("ix_exh_exhortos_folio_seguimiento_activos", "folio_seguimiento", postgresql_where=text("estatus = 'A'")),
+    )
+
     # Clave primaria
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -169,6 +175,11 @@ class ExhExhorto(Base, UniversalMixin):
     estado: Mapped[str] = mapped_column(Enum(*ESTADOS, name="exh_exhortos_estados", native_enum=False), index=True)
     estado_anterior: Mapped[Optional[str]] = mapped_column(String(24))
 
+    # Contadores de los archivos, se actualizan en la misma sentencia que marca cada archivo como RECIBIDO,
+    # son nulos en los registros que creó la versión anterior y se cuentan al recibir su primer archivo
+    archivos_pendientes: Mapped[Optional[int]] = mapped_column(default=0)
+    archivos_recibidos: Mapped[Optional[int]] = mapped_column(default=0)
+
     # Conservar el JSON que se genera cuando se hace el envío y el que se recibe con el acuse
     paquete_enviado: Mapped[Optional[dict]] = mapped_column(JSONB)
     acuse_recibido: Mapped[Optional[dict]] = mapped_column(JSONB)
@@ -3,9 +3,9 @@ Exh Exhortos Archivos, modelos
 """
 
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from sqlalchemy import Enum, ForeignKey, String
+from sqlalchemy import Enum, ForeignKey, Index, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql.functions import now
 
@@ -32,6 +32,9 @@ class ExhExhortoArchivo(Base, UniversalMixin):
     # Nombre de la tabla
     __tablename__ = "exh_exhortos_archivos"
 
+    # Índices
+    __table_args__ = (Index("ix_exh_exhortos_archivos_exh_exhorto_id_estado", "exh_exhorto_id", "estado"),)
+
     # Clave primaria
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -66,6 +69,11 @@ class ExhExhortoArchivo(Base, UniversalMixin):
     # Estado de recepción del documento
     estado: Mapped[str] = mapped_column(Enum(*ESTADOS, name="exh_exhortos_archivos_estados", native_enum=False), index=True)
 
+    # Hijos
+    exh_exhortos_archivos_cargas: Mapped[List["ExhExhortoArchivoCarga"]] = relationship(
+        "ExhExhortoArchivoCarga", back_populates="exh_exhorto_archivo"
+    )
+
     @property
     def tipo_documento_nombre(self):
         """Nombre del tipo de documento"""
@@ -0,0 +1,48 @@
+"""
+Exh Exhortos Archivos Cargas, modelos
+"""
+
+from typing import Optional
+
+from sqlalchemy import Enum, ForeignKey, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from ..dependencies.database import Base
+from ..dependencies.universal_mixin import UniversalMixin
+
+
+class ExhExhortoArchivoCarga(Base, UniversalMixin):
+    """ExhExhortoArchivoCarga"""
+
+    ESTADOS = {
+        "ABIERTA": "Abierta",
+        "FINALIZADA": "Finalizada",
+        "CANCELADA": "Cancelada",
+    }
+
+    # Nombre de la tabla
+    __tablename__ = "exh_exhortos_archivos_cargas"
+
+    # Clave primaria
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    # Clave foránea
+    exh_exhorto_archivo_id: Mapped[int] = mapped_column(ForeignKey("exh_exhortos_archivos.id"), index=True)
+    exh_exhorto_archivo: Mapped["ExhExhortoArchivo"] = relationship(back_populates="exh_exhortos_archivos_cargas")
+
+    # Tamaño total declarado al abrir la carga en bytes. Opcional.
+    tamano: Mapped[Optional[int]]
+
+    # Bytes confirmados, es el desplazamiento donde debe comenzar la siguiente parte
+    recibido: Mapped[int] = mapped_column(default=0)
+
+    # Nombres de las partes en Google Storage, en el orden en que se deben juntar
+    partes: Mapped[list[str]] = mapped_column(ARRAY(String(512)), default=list)
+
+    # Estado de la carga
+    estado: Mapped[str] = mapped_column(Enum(*ESTADOS, name="exh_exhortos_archivos_cargas_estados", native_enum=False))
+
+    def __repr__(self):
+        """Representación"""
+        return f"<ExhExhortoArchivoCarga {self.id}>"
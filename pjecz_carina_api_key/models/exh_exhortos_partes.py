@@ -4,7 +4,7 @@ Exh Exhortos Partes, modelos
 
 from typing import Optional
 
-from sqlalchemy import Enum, ForeignKey, String
+from sqlalchemy import Enum, ForeignKey, Index, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..dependencies.database import Base
@@ -29,6 +29,9 @@ class ExhExhortoParte(Base, UniversalMixin):
     # Nombre de la tabla
     __tablename__ = "exh_exhortos_partes"
 
+    # Índices
+    __table_args__ = (Index("ix_exh_exhortos_partes_exh_exhorto_id", "exh_exhorto_id"),)
+
     # Clave primaria
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -5,7 +5,7 @@ Exh Exhortos Promociones Archivos, modelos
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Enum, ForeignKey, String
+from sqlalchemy import Enum, ForeignKey, Index, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql.functions import now
 
@@ -32,6 +32,9 @@ class ExhExhortoPromocionArchivo(Base, UniversalMixin):
     # Nombre de la tabla
     __tablename__ = "exh_exhortos_promociones_archivos"
 
+    # Índices
+    __table_args__ = (Index("ix_exh_exhortos_promociones_archivos_promocion_id_estado", "exh_exhorto_promocion_id", "estado"),)
+
     # Clave primaria
     id: Mapped[int] = mapped_column(primary_key=True)
 
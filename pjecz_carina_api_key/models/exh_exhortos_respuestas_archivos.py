@@ -5,7 +5,7 @@ Exh Exhortos Respuestas Archivos, modelos
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Enum, ForeignKey, String
+from sqlalchemy import Enum, ForeignKey, Index, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql.functions import now
 
@@ -32,6 +32,9 @@ class ExhExhortoRespuestaArchivo(Base, UniversalMixin):
     # Nombre de la tabla
     __tablename__ = "exh_exhortos_respuestas_archivos"
 
+    # Índices
+    __table_args__ = (Index("ix_exh_exhortos_respuestas_archivos_respuesta_id_estado", "exh_exhorto_respuesta_id", "estado"),)
+
     # Clave primaria
     id: Mapped[int] = mapped_column(primary_key=True)
 
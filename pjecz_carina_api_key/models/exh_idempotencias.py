@@ -0,0 +1,46 @@
+"""
+Exh Idempotencias, modelos
+"""
+
+from typing import Optional
+
+from sqlalchemy import ForeignKey, String, Text, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..dependencies.database import Base
+from ..dependencies.universal_mixin import UniversalMixin
+
+
+class ExhIdempotencia(Base, UniversalMixin):
+    """ExhIdempotencia"""
+
+    # Nombre de la tabla
+    __tablename__ = "exh_idempotencias"
+
+    # Una respuesta por usuario, ruta y clave
+    __table_args__ = (UniqueConstraint("usuario_id", "ruta", "clave", name="uq_exh_idempotencias_usuario_id_ruta_clave"),)
+
+    # Clave primaria
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    # Clave foránea, el usuario de la api_key que hizo la petición
+    usuario_id: Mapped[int] = mapped_column(ForeignKey("usuarios.id"))
+
+    # Ruta que atendió la petición, por ejemplo recibir o recibir_respuesta
+    ruta: Mapped[str] = mapped_column(String(64))
+
+    # Llave natural de la petición, las guardadas antes pueden ser el encabezado Idempotency-Key
+    clave: Mapped[str] = mapped_column(String(256))
+
+    # Encabezado Idempotency-Key de la petición. Opcional.
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(256))
+
+    # SHA256 de la petición, para rechazar la misma clave con otros datos
+    peticion_hash: Mapped[str] = mapped_column(String(64))
+
+    # Respuesta exitosa ya serializada en JSON, se entrega igual en los reintentos
+    respuesta: Mapped[str] = mapped_column(Text)
+
+    def __repr__(self):
+        """Representación"""
+        return f"<ExhIdempotencia {self.id}>"
@@ -6,9 +6,10 @@ from datetime import datetime
 from typing import List, Optional
 
 from sqlalchemy import ForeignKey, String
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, object_session, relationship
 
 from ..dependencies.database import Base
+from ..dependencies.permissions import get_permissions
 from ..dependencies.universal_mixin import UniversalMixin
 
 
@@ -44,9 +45,6 @@ class Usuario(Base, UniversalMixin):
     tareas: Mapped[List["Tarea"]] = relationship("Tarea", back_populates="usuario")
     usuarios_roles: Mapped[List["UsuarioRol"]] = relationship("UsuarioRol", back_populates="usuario")
 
-    # Propiedades
-    permisos_consultados = {}
-
     @property
     def distrito_id(self):
         """Distrito ID"""
@@ -99,18 +97,8 @@ class Usuario(Base, UniversalMixin):
 
     @property
     def permissions(self):
-        """Entrega un diccionario con todos los permisos"""
-        if len(self.permisos_consultados) > 0:
-            return self.permisos_consultados
-        self.permisos_consultados = {}
-        for usuario_rol in self.usuarios_roles:
-            if usuario_rol.estatus == "A":
-                for permiso in usuario_rol.rol.permisos:
-                    if permiso.estatus == "A":
-                        etiqueta = permiso.modulo.nombre
-                        if etiqueta not in self.permisos_consultados or permiso.nivel > self.permisos_consultados[etiqueta]:
-                            self.permisos_consultados[etiqueta] = permiso.nivel
-        return self.permisos_consultados
+        """Entrega un diccionario con todos los permisos, se consultan con una sola consulta"""
+        return get_permissions(object_session(self), self.id)
 
     def can(self, perm):
         """¿Tiene permiso?"""
@@ -4,14 +4,17 @@ Autoridades, routers
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import select
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
+from ..dependencies.catalogos import AutoridadCatalogo, get_catalogos
+from ..dependencies.database import AsyncSession, get_async_db
 from ..dependencies.exceptions import MyAnyError, MyNotExistsError, MyNotValidParamError
 from ..dependencies.fastapi_pagination_custom_list import CustomList
+from ..dependencies.http_cache import check_not_modified, get_cached_response, get_catalogos_version, set_cached_response
 from ..dependencies.safe_string import safe_clave
 from ..models.autoridades import Autoridad
 from ..models.distritos import Distrito
@@ -23,29 +26,35 @@ from ..settings import Settings, get_settings
 autoridades = APIRouter(prefix="/api/v5/autoridades")
 
 
-def get_autoridad_with_clave_nd(database: Annotated[Session, Depends(get_db)]) -> Autoridad:
+async def get_autoridad_with_clave_nd(database: Annotated[AsyncSession, Depends(get_async_db)]) -> AutoridadCatalogo:
     """Consultar la autoridad con clave ND"""
-    try:
-        return database.query(Autoridad).filter_by(clave="ND").one()
-    except (MultipleResultsFound, NoResultFound) as error:
-        raise MyNotExistsError("No existe la autoridad con clave ND") from error
+    catalogos = await get_catalogos(database)
+    autoridad = catalogos.autoridades.get("ND")
+    if autoridad is None:
+        raise MyNotExistsError("No existe la autoridad con clave ND")
+    return autoridad
 
 
 @autoridades.get("/{clave}", response_model=OneAutoridadOut)
 async def detalle_autoridad(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    request: Request,
+    response: Response,
+    version: Annotated[tuple, Depends(get_catalogos_version)],
     clave: str,
 ):
     """Detalle de una autoridad a partir de su clave"""
     if current_user.permissions.get("AUTORIDADES", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    check_not_modified(request, response, version)
     try:
         clave = safe_clave(clave)
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No es válida la clave")
     try:
-        autoridad = database.query(Autoridad).filter_by(clave=clave).one()
+        resultado = await database.execute(select(Autoridad).filter_by(clave=clave))
+        autoridad = resultado.scalar_one()
     except (MultipleResultsFound, NoResultFound) as error:
         return OneAutoridadOut(success=False, message="No existe esa autoridad", errors=[str(error)])
     if autoridad.estatus != "A":
@@ -57,7 +66,10 @@ async def detalle_autoridad(
 @autoridades.get("", response_model=CustomList[AutoridadOut])
 async def paginado_autoridades(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    request: Request,
+    response: Response,
+    version: Annotated[tuple, Depends(get_catalogos_version)],
     distrito_clave: str = None,
     es_jurisdiccional: bool = None,
     es_notaria: bool = None,
@@ -66,7 +78,11 @@ async def paginado_autoridades(
     """Paginado de autoridades"""
     if current_user.permissions.get("AUTORIDADES", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-    consulta = database.query(Autoridad)
+    etag = check_not_modified(request, response, version)
+    respuesta = get_cached_response(request, etag)
+    if respuesta is not None:
+        return respuesta
+    consulta = select(Autoridad)
     if distrito_clave is not None:
         try:
             distrito_clave = safe_clave(distrito_clave)
@@ -83,4 +99,6 @@ async def paginado_autoridades(
         except ValueError:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No es válida la clave de la materia")
         consulta = consulta.join(Materia).filter(Materia.clave == materia_clave).filter(Materia.estatus == "A")
-    return paginate(consulta.filter(Autoridad.estatus == "A").order_by(Autoridad.clave))
+    return set_cached_response(
+        request, etag, await paginate(database, consulta.filter(Autoridad.estatus == "A").order_by(Autoridad.clave))
+    )
@@ -4,13 +4,16 @@ Estados, routers
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import select
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
+from ..dependencies.database import AsyncSession, get_async_db
 from ..dependencies.fastapi_pagination_custom_list import CustomList
+from ..dependencies.http_cache import check_not_modified, get_cached_response, get_catalogos_version, set_cached_response
+from ..dependencies.query_detector import query_budget
 from ..dependencies.safe_string import safe_clave
 from ..models.estados import Estado
 from ..models.permisos import Permiso
@@ -22,18 +25,23 @@ estados = APIRouter(prefix="/api/v5/estados")
 @estados.get("/{clave}", response_model=OneEstadoOut)
 async def detalle_estado(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    request: Request,
+    response: Response,
+    version: Annotated[tuple, Depends(get_catalogos_version)],
     clave: str,
 ):
     """Detalle de un estado a partir de su clave INEGI"""
     if current_user.permissions.get("ESTADOS", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    check_not_modified(request, response, version)
     try:
         clave = safe_clave(clave).zfill(2)
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No es válida la clave")
     try:
-        estado = database.query(Estado).filter_by(clave=clave).one()
+        resultado = await database.execute(select(Estado).filter_by(clave=clave))
+        estado = resultado.scalar_one()
     except (MultipleResultsFound, NoResultFound) as error:
         return OneEstadoOut(success=False, message="No existe ese estado", errors=[str(error)])
     if estado.estatus != "A":
@@ -43,11 +51,21 @@ async def detalle_estado(
 
 
 @estados.get("", response_model=CustomList[EstadoOut])
+@query_budget(1)
 async def listado_estados(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    request: Request,
+    response: Response,
+    version: Annotated[tuple, Depends(get_catalogos_version)],
 ):
     """Listado de estados"""
     if current_user.permissions.get("ESTADOS", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-    return paginate(database.query(Estado).filter_by(estatus="A").order_by(Estado.clave))
+    etag = check_not_modified(request, response, version)
+    respuesta = get_cached_response(request, etag)
+    if respuesta is not None:
+        return respuesta
+    return set_cached_response(
+        request, etag, await paginate(database, select(Estado).filter_by(estatus="A").order_by(Estado.clave))
+    )
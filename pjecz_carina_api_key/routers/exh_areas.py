@@ -4,14 +4,18 @@ Exh Áreas, routers
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import select
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
+from ..dependencies.catalogos import ExhAreaCatalogo, get_catalogos
+from ..dependencies.database import AsyncSession, get_async_db
 from ..dependencies.exceptions import MyNotExistsError
 from ..dependencies.fastapi_pagination_custom_list import CustomList
+from ..dependencies.http_cache import check_not_modified, get_cached_response, get_catalogos_version, set_cached_response
+from ..dependencies.query_detector import query_budget
 from ..dependencies.safe_string import safe_clave
 from ..models.exh_areas import ExhArea
 from ..models.permisos import Permiso
@@ -20,29 +24,35 @@ from ..schemas.exh_areas import ExhAreaOut, OneExhAreaOut
 exh_areas = APIRouter(prefix="/api/v5/exh_areas")
 
 
-def get_exh_area_with_clave_nd(database: Annotated[Session, Depends(get_db)]) -> ExhArea:
+async def get_exh_area_with_clave_nd(database: Annotated[AsyncSession, Depends(get_async_db)]) -> ExhAreaCatalogo:
     """Consultar el área con clave ND"""
-    try:
-        return database.query(ExhArea).filter_by(clave="ND").one()
-    except (MultipleResultsFound, NoResultFound) as error:
-        raise MyNotExistsError("No existe el área con clave ND") from error
+    catalogos = await get_catalogos(database)
+    exh_area = catalogos.exh_areas.get("ND")
+    if exh_area is None:
+        raise MyNotExistsError("No existe el área con clave ND")
+    return exh_area
 
 
 @exh_areas.get("/{clave}", response_model=OneExhAreaOut)
 async def detalle_area(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    request: Request,
+    response: Response,
+    version: Annotated[tuple, Depends(get_catalogos_version)],
     clave: str,
 ):
     """Detalle de un area a partir de su clave"""
     if current_user.permissions.get("EXH AREAS", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    check_not_modified(request, response, version)
     try:
         clave = safe_clave(clave)
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No es válida la clave")
     try:
-        exh_area = database.query(ExhArea).filter_by(clave=clave).one()
+        resultado = await database.execute(select(ExhArea).filter_by(clave=clave))
+        exh_area = resultado.scalar_one()
     except (MultipleResultsFound, NoResultFound) as error:
         return OneExhAreaOut(success=False, message="No existe esa área", errors=[str(error)])
     if exh_area.estatus != "A":
@@ -52,11 +62,21 @@ async def detalle_area(
 
 
 @exh_areas.get("", response_model=CustomList[ExhAreaOut])
+@query_budget(1)
 async def listado_areas(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    request: Request,
+    response: Response,
+    version: Annotated[tuple, Depends(get_catalogos_version)],
 ):
     """Paginado de areas"""
     if current_user.permissions.get("EXH AREAS", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-    return paginate(database.query(ExhArea).filter_by(estatus="A").order_by(ExhArea.clave))
+    etag = check_not_modified(request, response, version)
+    respuesta = get_cached_response(request, etag)
+    if respuesta is not None:
+        return respuesta
+    return set_cached_response(
+        request, etag, await paginate(database, select(ExhArea).filter_by(estatus="A").order_by(ExhArea.clave))
+    )
@@ -2,31 +2,42 @@
 Exh Exhortos, routers
 """
 
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Annotated
 
 import pytz
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy import event, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
+from ..dependencies.catalogos import get_catalogos, invalidate_catalogos
+from ..dependencies.database import AsyncSession, get_async_db
 from ..dependencies.exceptions import MyAnyError, MyNotExistsError, MyNotValidParamError
+from ..dependencies.idempotency import (
+    IDEMPOTENCY_KEY_MAX_LEN,
+    get_idempotencia,
+    get_idempotent_contents,
+    get_idempotent_response,
+    save_idempotent_response,
+    save_idempotent_responses,
+)
+from ..dependencies.query_detector import query_budget
 from ..dependencies.safe_string import safe_clave, safe_email, safe_string, safe_telefono
-from ..models.estados import Estado
+from ..dependencies.ttl_cache import TTLCache
 from ..models.exh_exhortos import ExhExhorto
 from ..models.exh_exhortos_archivos import ExhExhortoArchivo
 from ..models.exh_exhortos_partes import ExhExhortoParte
 from ..models.exh_exhortos_promoventes import ExhExhortoPromovente
-from ..models.exh_externos import ExhExterno
-from ..models.exh_tipos_diligencias import ExhTipoDiligencia
-from ..models.municipios import Municipio
 from ..models.permisos import Permiso
 from ..schemas.exh_exhortos import (
     ExhExhortoConsultaOut,
     ExhExhortoIn,
     ExhExhortoOut,
     OneExhExhortoConsultaOut,
+    OneExhExhortoLoteOut,
     OneExhExhortoOut,
 )
 from ..schemas.exh_exhortos_archivos import ExhExhortoArchivoItem
@@ -40,29 +51,79 @@ exh_exhortos = APIRouter(prefix="/api/v5/exh_exhortos")
 
 TIPO_DILIGENCIA_CLAVE_POR_DEFECTO = "OTR"
 
+# Caché de las consultas por folio de seguimiento, la clave es el folio y el valor (exh_exhorto_id, ExhExhortoConsultaOut)
+exh_exhortos_consultas_cache = TTLCache(
+    ttl=get_settings().exh_exhortos_consultas_cache_ttl,
+    max_size=get_settings().exh_exhortos_consultas_cache_max_size,
+)
+
+
+def invalidate_exh_exhorto_consulta(exh_exhorto_id: int) -> None:
+    """Quitar del caché la consulta de un exhorto"""
+    exh_exhortos_consultas_cache.pop_where(lambda _, guardado: guardado[0] == exh_exhorto_id)
+
+
+@event.listens_for(ExhExhorto, "after_update")
+@event.listens_for(ExhExhorto, "after_delete")
+def invalidate_exh_exhorto_consulta_on_change(_mapper, _connection, target: ExhExhorto) -> None:
+    """Al cambiar un exhorto en este proceso invalidar su consulta"""
+    invalidate_exh_exhorto_consulta(target.id)
+
+
+@event.listens_for(ExhExhortoArchivo, "after_insert")
+@event.listens_for(ExhExhortoArchivo, "after_update")
+@event.listens_for(ExhExhortoArchivo, "after_delete")
+@event.listens_for(ExhExhortoParte, "after_insert")
+@event.listens_for(ExhExhortoParte, "after_update")
+@event.listens_for(ExhExhortoParte, "after_delete")
+def invalidate_exh_exhorto_consulta_on_child_change(_mapper, _connection, target) -> None:
+    """Al cambiar un archivo o una parte de un exhorto en este proceso invalidar su consulta"""
+    invalidate_exh_exhorto_consulta(target.exh_exhorto_id)
 
-def get_exhorto_with_exhorto_origen_id(
-    database: Annotated[Session, Depends(get_db)],
+
+def safe_exhorto_origen_id(exhorto_origen_id: str) -> str:
+    """Normalizar exhortoOrigenId como se guarda en exhorto_origen_id"""
+    return safe_string(exhorto_origen_id, max_len=64, do_unidecode=True, to_uppercase=False)
+
+
+async def get_exhortos_origen_ids_recibidos(database: AsyncSession, exhortos_origen_ids: list[str]) -> set[str]:
+    """Consultar cuáles exhorto_origen_id ya tienen un exhorto, en una sola consulta"""
+    exhortos_origen_ids = [exhorto_origen_id for exhorto_origen_id in exhortos_origen_ids if exhorto_origen_id != ""]
+    if not exhortos_origen_ids:
+        return set()
+    resultado = await database.execute(
+        select(ExhExhorto.exhorto_origen_id)
+        .where(ExhExhorto.exhorto_origen_id.in_(exhortos_origen_ids))
+        .where(ExhExhorto.estatus == "A")
+    )
+    return set(resultado.scalars())
+
+
+async def get_exhorto_with_exhorto_origen_id(
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     exhorto_origen_id: str,
 ) -> ExhExhorto:
     """Consultar un exhorto con su exhorto_origen_id"""
 
     # Validar exhorto_origen_id
-    exhorto_origen_id = safe_string(exhorto_origen_id, max_len=64, do_unidecode=True, to_uppercase=False)
+    exhorto_origen_id = safe_exhorto_origen_id(exhorto_origen_id)
     if exhorto_origen_id == "":
         raise MyNotValidParamError("No es un 'exhorto origen id' válido")
 
     # Consultar el exhorto
-    try:
-        exh_exhorto = database.query(ExhExhorto).filter_by(exhorto_origen_id=exhorto_origen_id).filter_by(estatus="A").first()
-    except (MultipleResultsFound, NoResultFound) as error:
-        raise MyNotExistsError(f"No existe el exhorto con el 'exhorto origen id' {exhorto_origen_id}") from error
+    resultado = await database.execute(select(ExhExhorto).filter_by(exhorto_origen_id=exhorto_origen_id).filter_by(estatus="A"))
+    exh_exhorto = resultado.scalars().first()
+    if exh_exhorto is None:
+        raise MyNotExistsError(f"No existe el exhorto con el 'exhorto origen id' {exhorto_origen_id}")
 
     # Entregar
     return exh_exhorto
 
 
-def get_exhorto_with_folio_seguimiento(database: Annotated[Session, Depends(get_db)], folio_seguimiento: str) -> ExhExhorto:
+async def get_exhorto_with_folio_seguimiento(
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    folio_seguimiento: str,
+) -> ExhExhorto:
     """Consultar un exhorto con su folio de seguimiento"""
 
     # Normalizar folio_seguimiento a 48 caracteres como máximo
@@ -71,7 +132,8 @@ def get_exhorto_with_folio_seguimiento(database: Annotated[Session, Depends(get_
         raise MyNotValidParamError("No es un 'folio seguimiento' válido")
 
     # Consultar el exhorto
-    exh_exhorto = database.query(ExhExhorto).filter_by(folio_seguimiento=folio_seguimiento).filter_by(estatus="A").first()
+    resultado = await database.execute(select(ExhExhorto).filter_by(folio_seguimiento=folio_seguimiento).filter_by(estatus="A"))
+    exh_exhorto = resultado.scalars().first()
     if exh_exhorto is None:
         raise MyNotExistsError(f"No existe el exhorto con folio de seguimiento {folio_seguimiento}")
 
@@ -79,61 +141,78 @@ def get_exhorto_with_folio_seguimiento(database: Annotated[Session, Depends(get_
     return exh_exhorto
 
 
-@exh_exhortos.get("/folio_seguimiento/{folio_seguimiento}", response_model=OneExhExhortoConsultaOut)
-async def consultar_exhorto_request(
-    current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
-    settings: Annotated[Settings, Depends(get_settings)],
+async def get_exhorto_consulta_with_folio_seguimiento(
+    database: AsyncSession,
+    settings: Settings,
     folio_seguimiento: str,
-):
-    """Detalle de un exhorto a partir de su folio de seguimiento"""
-    if current_user.permissions.get("EXH EXHORTOS", 0) < Permiso.VER:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-
-    # Consultar el exhorto
-    try:
-        exh_exhorto = get_exhorto_with_folio_seguimiento(database, folio_seguimiento)
-    except (MyNotExistsError, MyNotValidParamError) as error:
-        return OneExhExhortoConsultaOut(success=False, message=str(error), errors=[str(error)], data=None)
+) -> ExhExhortoConsultaOut:
+    """Consultar un exhorto con sus partes, archivos, autoridad y área para entregarlo en la consulta"""
 
-    # Inicializar listado de partes
-    partes = []
+    # Normalizar folio_seguimiento
+    folio_seguimiento = safe_string(folio_seguimiento, max_len=64, do_unidecode=True, to_uppercase=False)
+    if folio_seguimiento == "":
+        raise MyNotValidParamError("No es un 'folio seguimiento' válido")
 
-    # Pasar las partes del exhorto a instancias de ExhExhortoParteIn
-    for exh_exhorto_parte in exh_exhorto.exh_exhortos_partes:
-        partes.append(
-            ExhExhortoParteItem(
-                nombre=exh_exhorto_parte.nombre,
-                apellidoPaterno=exh_exhorto_parte.apellido_paterno,
-                apellidoMaterno=exh_exhorto_parte.apellido_materno,
-                genero=exh_exhorto_parte.genero,
-                esPersonaMoral=exh_exhorto_parte.es_persona_moral,
-                tipoParte=exh_exhorto_parte.tipo_parte,
-                tipoParteNombre=exh_exhorto_parte.tipo_parte_nombre,
-                correoElectronico=exh_exhorto_parte.correoElectronico,
-                telefono=exh_exhorto_parte.telefono,
-            )
+    # Buscar en el caché
+    guardado = exh_exhortos_consultas_cache.get(folio_seguimiento)
+    if guardado is not None:
+        return guardado[1]
+
+    # Consultar el exhorto con la autoridad y el área en la misma consulta, las partes y los archivos con selectinload
+    resultado = await database.execute(
+        select(ExhExhorto)
+        .filter_by(folio_seguimiento=folio_seguimiento)
+        .filter_by(estatus="A")
+        .options(
+            joinedload(ExhExhorto.autoridad),
+            joinedload(ExhExhorto.exh_area),
+            selectinload(ExhExhorto.exh_exhortos_partes),
+            selectinload(ExhExhorto.exh_exhortos_archivos),
         )
+    )
+    exh_exhorto = resultado.scalars().first()
+    if exh_exhorto is None:
+        raise MyNotExistsError(f"No existe el exhorto con folio de seguimiento {folio_seguimiento}")
 
-    # Inicializar listado de archivos
-    archivos = []
-
-    # Pasar los archivos del exhorto a instancias de ExhExhortoArchivoOut
-    for exh_exhorto_archivo in exh_exhorto.exh_exhortos_archivos:
-        archivos.append(
-            ExhExhortoArchivoItem(
-                nombreArchivo=exh_exhorto_archivo.nombre_archivo,
-                hashSha1=exh_exhorto_archivo.hash_sha1,
-                hashSha256=exh_exhorto_archivo.hash_sha256,
-                tipoDocumento=exh_exhorto_archivo.tipo_documento,
-            )
+    # Tomar los municipios y los estados de los catálogos en memoria, si falta alguno volver a cargarlos
+    municipios_ids = (exh_exhorto.municipio_destino_id, exh_exhorto.municipio_origen_id, exh_exhorto.autoridad.municipio_id)
+    catalogos = await get_catalogos(database)
+    if any(municipio_id not in catalogos.municipios_por_id for municipio_id in municipios_ids):
+        invalidate_catalogos()
+        catalogos = await get_catalogos(database)
+    try:
+        municipio_destino, municipio_origen, autoridad_municipio = [catalogos.municipios_por_id[id] for id in municipios_ids]
+        estado_destino = catalogos.estados[municipio_destino.estado_id]
+        estado_origen = catalogos.estados[municipio_origen.estado_id]
+    except KeyError as error:
+        raise MyNotExistsError(f"No existe el municipio o el estado con ID {error}") from error
+
+    # Pasar las partes del exhorto a instancias de ExhExhortoParteItem
+    partes = [
+        ExhExhortoParteItem(
+            nombre=exh_exhorto_parte.nombre,
+            apellidoPaterno=exh_exhorto_parte.apellido_paterno,
+            apellidoMaterno=exh_exhorto_parte.apellido_materno,
+            genero=exh_exhorto_parte.genero,
+            esPersonaMoral=exh_exhorto_parte.es_persona_moral,
+            tipoParte=exh_exhorto_parte.tipo_parte,
+            tipoParteNombre=exh_exhorto_parte.tipo_parte_nombre,
+            correoElectronico=exh_exhorto_parte.correo_electronico,
+            telefono=exh_exhorto_parte.telefono,
         )
-
-    # Consultar el municipio de destino
-    municipio_destino = database.query(Municipio).get(exh_exhorto.municipio_destino_id)
-
-    # Consultar el estado de destino
-    estado_destino = municipio_destino.estado
+        for exh_exhorto_parte in exh_exhorto.exh_exhortos_partes
+    ]
+
+    # Pasar los archivos del exhorto a instancias de ExhExhortoArchivoItem
+    archivos = [
+        ExhExhortoArchivoItem(
+            nombreArchivo=exh_exhorto_archivo.nombre_archivo,
+            hashSha1=exh_exhorto_archivo.hash_sha1,
+            hashSha256=exh_exhorto_archivo.hash_sha256,
+            tipoDocumento=exh_exhorto_archivo.tipo_documento,
+        )
+        for exh_exhorto_archivo in exh_exhorto.exh_exhortos_archivos
+    ]
 
     # Cambiar fecha_origen y fecha_hora_recepcion de UTC a tiempo local
     utc_tz = pytz.utc
@@ -151,10 +230,10 @@ async def consultar_exhorto_request(
         municipioDestinoNombre=municipio_destino.nombre,
         materiaClave=exh_exhorto.materia_clave,
         materiaNombre=exh_exhorto.materia_nombre,
-        estadoOrigenId=exh_exhorto.municipio_origen.estado.clave,
-        estadoOrigenNombre=exh_exhorto.municipio_origen.estado.nombre,
-        municipioOrigenId=exh_exhorto.municipio_origen.clave,
-        municipioOrigenNombre=exh_exhorto.municipio_origen.nombre,
+        estadoOrigenId=estado_origen.clave,
+        estadoOrigenNombre=estado_origen.nombre,
+        municipioOrigenId=municipio_origen.clave,
+        municipioOrigenNombre=municipio_origen.nombre,
         juzgadoOrigenId=exh_exhorto.juzgado_origen_id,
         juzgadoOrigenNombre=exh_exhorto.juzgado_origen_nombre,
         numeroExpedienteOrigen=exh_exhorto.numero_expediente_origen,
@@ -169,29 +248,58 @@ async def consultar_exhorto_request(
         observaciones=exh_exhorto.observaciones,
         archivos=archivos,
         fechaHoraRecepcion=fecha_hora_recepcion.strftime("%Y-%m-%d %H:%M:%S"),
-        municipioTurnadoId=exh_exhorto.autoridad.municipio.clave,
-        municipioTurnadoNombre=exh_exhorto.autoridad.municipio.nombre,
+        municipioTurnadoId=autoridad_municipio.clave,
+        municipioTurnadoNombre=autoridad_municipio.nombre,
         areaTurnadoId=exh_exhorto.exh_area.clave,
         areaTurnadoNombre=exh_exhorto.exh_area.nombre,
         numeroExhorto=exh_exhorto.numero_exhorto,
         urlInfo="https://carina.justiciadigital.gob.mx/",
     )
 
-    # Entregar
-    return OneExhExhortoConsultaOut(success=True, message="Consulta hecha con éxito", errors=[], data=data)
+    # Guardar en el caché y entregar
+    exh_exhortos_consultas_cache.set(folio_seguimiento, (exh_exhorto.id, data))
+    return data
 
 
-@exh_exhortos.post("/recibir", response_model=OneExhExhortoOut)
-async def recibir_exhorto_request(
+@exh_exhortos.get("/folio_seguimiento/{folio_seguimiento}", response_model=OneExhExhortoConsultaOut)
+@query_budget(3)
+async def consultar_exhorto_request(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     settings: Annotated[Settings, Depends(get_settings)],
-    exh_exhorto_in: ExhExhortoIn,
+    folio_seguimiento: str,
 ):
-    """Recepción de datos de un exhorto"""
-    if current_user.permissions.get("EXH EXHORTOS", 0) < Permiso.CREAR:
+    """Detalle de un exhorto a partir de su folio de seguimiento"""
+    if current_user.permissions.get("EXH EXHORTOS", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
+    # Consultar el exhorto
+    try:
+        data = await get_exhorto_consulta_with_folio_seguimiento(database, settings, folio_seguimiento)
+    except (MyNotExistsError, MyNotValidParamError) as error:
+        return OneExhExhortoConsultaOut(success=False, message=str(error), errors=[str(error)], data=None)
+
+    # Entregar
+    return OneExhExhortoConsultaOut(success=True, message="Consulta hecha con éxito", errors=[], data=data)
+
+
+@dataclass
+class ExhExhortoRecepcion:
+    """Exhorto recibido y validado, con los valores de sus registros listos para insertarse"""
+
+    exhorto: dict
+    partes: list[dict]
+    archivos: list[dict]
+    promoventes: list[dict]
+
+
+async def validate_exh_exhorto_in(
+    database: AsyncSession,
+    settings: Settings,
+    exh_exhorto_in: ExhExhortoIn,
+) -> tuple[ExhExhortoRecepcion | None, list[str]]:
+    """Validar un exhorto con los catálogos en memoria, entrega sus registros o los errores"""
+
     # Preparar las zonas horarias UTC y local
     utc_tz = pytz.utc
     local_tz = pytz.timezone(settings.tz)
@@ -200,23 +308,28 @@ async def recibir_exhorto_request(
     errores = []
 
     # Validar exhortoOrigenId
-    exhorto_origen_id = safe_string(exh_exhorto_in.exhortoOrigenId, max_len=64, do_unidecode=True, to_uppercase=False)
+    exhorto_origen_id = safe_exhorto_origen_id(exh_exhorto_in.exhortoOrigenId)
     if exhorto_origen_id == "":
         errores.append("No es válido exhortoOrigenId")
 
+    # Consultar los catálogos en memoria
+    catalogos = await get_catalogos(database)
+
     # Consultar nuestro estado
-    estado_destino = database.query(Estado).get(settings.estado_clave)
+    estado_destino = catalogos.estados.get(int(settings.estado_clave))
     if estado_destino is None:
         errores.append(f"No existe el estado de destino {settings.estado_clave}")
 
     # Validar municipioDestinoId, obligatorio y es un identificador INEGI
     try:
-        municipio_destino = get_municipio_destino(database, settings, exh_exhorto_in.municipioDestinoId)
+        municipio_destino = await get_municipio_destino(database, settings, exh_exhorto_in.municipioDestinoId)
     except MyAnyError as error:
         errores.append(str(error))
 
     # Consultar nuestro estado en exh_externos
-    estado_destino_exh_externo = database.query(ExhExterno).filter_by(estado_id=estado_destino.id).first()
+    estado_destino_exh_externo = None
+    if estado_destino is not None:
+        estado_destino_exh_externo = catalogos.exh_externos.get(estado_destino.id)
     if estado_destino_exh_externo is None:
         errores.append(f"No existe el registro del estado {settings.estado_clave} en exh_externos")
 
@@ -224,13 +337,10 @@ async def recibir_exhorto_request(
     materia_clave = ""
     materia_nombre = ""
     if estado_destino_exh_externo:
-        materias = estado_destino_exh_externo.materias  # Listado de diccionarios {"clave": "...", "nombre": "..."}
+        materias = estado_destino_exh_externo.materias  # Diccionario {clave: nombre}
         if materias:
             materia_clave = safe_clave(exh_exhorto_in.materiaClave)
-            for item in materias:
-                if item["clave"] == materia_clave:
-                    materia_nombre = item["nombre"]
-                    break
+            materia_nombre = materias.get(materia_clave, "")
     if materia_clave == "":
         errores.append(f"No hay materias en el estado {settings.estado_clave} en exh_externos")
     if materia_nombre == "":
@@ -238,7 +348,7 @@ async def recibir_exhorto_request(
 
     # Validar estadoOrigenId y municipioOrigenId, enteros obligatorios y son identificadores INEGI
     try:
-        municipio_origen = get_municipio_origen(database, exh_exhorto_in.estadoOrigenId, exh_exhorto_in.municipioOrigenId)
+        municipio_origen = await get_municipio_origen(database, exh_exhorto_in.estadoOrigenId, exh_exhorto_in.municipioOrigenId)
     except MyAnyError as error:
         errores.append(str(error))
 
@@ -276,27 +386,30 @@ async def recibir_exhorto_request(
     if exh_exhorto_in.diasResponder > 0:
         dias_responder = exh_exhorto_in.diasResponder
 
-    # Validar tipoDiligenciaId
+    # Validar tipoDiligenciaId, si no viene o no existe es el tipo de diligencia por defecto
     tipo_diligencia_id = safe_string(exh_exhorto_in.tipoDiligenciaId, max_len=32)
     tipo_diligenciacion_nombre = None
+    exh_tipo_diligencia = catalogos.exh_tipos_diligencias.get(TIPO_DILIGENCIA_CLAVE_POR_DEFECTO)
     if tipo_diligencia_id:
         # Consultar TipoDiligencia por su clave
-        exh_tipo_diligencia = database.query(ExhTipoDiligencia).filter_by(clave=tipo_diligencia_id).first()
-        if exh_tipo_diligencia is None:
-            exh_tipo_diligencia = database.query(ExhTipoDiligencia).filter_by(clave=TIPO_DILIGENCIA_CLAVE_POR_DEFECTO).first()
-        tipo_diligenciacion_nombre = exh_tipo_diligencia.descripcion
+        exh_tipo_diligencia = catalogos.exh_tipos_diligencias.get(tipo_diligencia_id, exh_tipo_diligencia)
+        if exh_tipo_diligencia is not None:
+            tipo_diligenciacion_nombre = exh_tipo_diligencia.descripcion
     elif exh_exhorto_in.tipoDiligenciacionNombre is not None:
-        exh_tipo_diligencia = database.query(ExhTipoDiligencia).filter_by(clave=TIPO_DILIGENCIA_CLAVE_POR_DEFECTO).first()
         tipo_diligenciacion_nombre = safe_string(exh_exhorto_in.tipoDiligenciacionNombre, save_enie=True)
+    if exh_tipo_diligencia is None:
+        errores.append("Falló porque no existe el tipo de diligencia por defecto")
 
     # Validar fechaOrigen, es opcional, cambiarla de local a UTC
     fecha_origen = None
     if exh_exhorto_in.fechaOrigen:
         try:
             fecha_origen = datetime.strptime(exh_exhorto_in.fechaOrigen, "%Y-%m-%d %H:%M:%S")
+            fecha_origen = (
+                fecha_origen.replace(tzinfo=local_tz).astimezone(utc_tz).replace(tzinfo=None)
+            )  # asyncpg exige fecha sin zona
         except ValueError:
             errores.append("La fecha de origen no tiene el formato correcto")
-        fecha_origen = fecha_origen.replace(tzinfo=local_tz).astimezone(utc_tz)
 
     # Validar observaciones, es opcional
     observaciones = None
@@ -338,127 +451,275 @@ async def recibir_exhorto_request(
 
     # Área de recepción, es NO DEFINIDO
     try:
-        exh_area = get_exh_area_with_clave_nd(database)
+        exh_area = await get_exh_area_with_clave_nd(database)
     except MyNotExistsError:
         errores.append("Falló porque no existe el área por defecto")
 
     # Juzgado/Área al que se turna el Exhorto, es NO DEFINIDO
     try:
-        autoridad = get_autoridad_with_clave_nd(database)
+        autoridad = await get_autoridad_with_clave_nd(database)
     except MyNotExistsError:
         errores.append("Falló porque no existe la autoridad por defecto")
 
-    # Si hubo errores, se termina de forma fallida
+    # Si hubo errores, se entregan sin registros
     if len(errores) > 0:
-        return OneExhExhortoOut(success=False, message="Falló la recepción del exhorto", errors=errores, data=None)
+        return None, errores
+
+    # Valores del exhorto
+    exhorto = {
+        "autoridad_id": autoridad.id,
+        "exh_area_id": exh_area.id,
+        "exh_tipo_diligencia_id": exh_tipo_diligencia.id,
+        "municipio_origen_id": municipio_origen.id,
+        "exhorto_origen_id": exhorto_origen_id,
+        "municipio_destino_id": municipio_destino.id,
+        "materia_clave": materia_clave,
+        "materia_nombre": materia_nombre,
+        "juzgado_origen_id": juzgado_origen_id,
+        "juzgado_origen_nombre": juzgado_origen_nombre,
+        "numero_expediente_origen": numero_expediente_origen,
+        "numero_oficio_origen": numero_oficio_origen,
+        "tipo_juicio_asunto_delitos": tipo_juicio_asunto_delitos,
+        "juez_exhortante": juez_exhortante,
+        "fojas": fojas,
+        "dias_responder": dias_responder,
+        "tipo_diligencia_id": tipo_diligencia_id,
+        "tipo_diligenciacion_nombre": tipo_diligenciacion_nombre,
+        "fecha_origen": fecha_origen,
+        "observaciones": observaciones,
+        "remitente": "EXTERNO",
+        "estado": "PENDIENTE",
+        "archivos_pendientes": len(exh_exhorto_in.archivos),
+    }
+
+    # OPCIONAL Valores de las partes
+    partes = []
+    for parte in exh_exhorto_in.partes or []:
+        genero = safe_string(parte.genero, to_uppercase=True)
+        if genero not in ExhExhortoParte.GENEROS:
+            genero = "-"  # En persona moral se usa guion
+        try:
+            correo_electronico = safe_email(parte.correoElectronico)
+        except ValueError:
+            correo_electronico = None
+        telefono = safe_telefono(parte.telefono)
+        if telefono == "":
+            telefono = None
+        partes.append(
+            {
+                "nombre": safe_string(parte.nombre, save_enie=True),
+                "apellido_paterno": safe_string(parte.apellidoPaterno, save_enie=True),
+                "apellido_materno": safe_string(parte.apellidoMaterno, save_enie=True),
+                "genero": genero,
+                "es_persona_moral": parte.esPersonaMoral,
+                "tipo_parte": parte.tipoParte,
+                "tipo_parte_nombre": safe_string(parte.tipoParteNombre, save_enie=True),
+                "correo_electronico": correo_electronico,
+                "telefono": telefono,
+            }
+        )
 
-    # Insertar el exhorto
-    exh_exhorto = ExhExhorto(
-        autoridad_id=autoridad.id,
-        exh_area_id=exh_area.id,
-        exh_tipo_diligencia_id=exh_tipo_diligencia.id,
-        municipio_origen=municipio_origen,
-        exhorto_origen_id=exhorto_origen_id,
-        municipio_destino_id=municipio_destino.id,
-        materia_clave=materia_clave,
-        materia_nombre=materia_nombre,
-        juzgado_origen_id=juzgado_origen_id,
-        juzgado_origen_nombre=juzgado_origen_nombre,
-        numero_expediente_origen=numero_expediente_origen,
-        numero_oficio_origen=numero_oficio_origen,
-        tipo_juicio_asunto_delitos=tipo_juicio_asunto_delitos,
-        juez_exhortante=juez_exhortante,
-        fojas=fojas,
-        dias_responder=dias_responder,
-        tipo_diligencia_id=tipo_diligencia_id,
-        tipo_diligenciacion_nombre=tipo_diligenciacion_nombre,
-        fecha_origen=fecha_origen,
-        observaciones=observaciones,
-        remitente="EXTERNO",
-        estado="PENDIENTE",
-    )
-    database.add(exh_exhorto)
-    database.commit()
-    database.refresh(exh_exhorto)
+    # Valores de los archivos
+    fecha_hora_recepcion = datetime.now()
+    archivos = [
+        {
+            "nombre_archivo": archivo.nombreArchivo,
+            "hash_sha1": archivo.hashSha1,
+            "hash_sha256": archivo.hashSha256,
+            "tipo_documento": archivo.tipoDocumento,
+            "estado": "PENDIENTE",
+            "tamano": 0,
+            "fecha_hora_recepcion": fecha_hora_recepcion,
+        }
+        for archivo in exh_exhorto_in.archivos
+    ]
+
+    # OPCIONAL Valores de los promoventes
+    promoventes = []
+    for promovente in exh_exhorto_in.promoventes or []:
+        genero = safe_string(promovente.genero, to_uppercase=True)
+        if genero not in ExhExhortoPromovente.GENEROS:
+            genero = "-"
+        try:
+            correo_electronico = safe_email(promovente.correoElectronico)
+        except ValueError:
+            correo_electronico = None
+        telefono = safe_telefono(promovente.telefono)
+        if telefono == "":
+            telefono = None
+        promoventes.append(
+            {
+                "nombre": safe_string(promovente.nombre, save_enie=True),
+                "apellido_paterno": safe_string(promovente.apellidoPaterno, save_enie=True),
+                "apellido_materno": safe_string(promovente.apellidoMaterno, save_enie=True),
+                "genero": genero,
+                "es_persona_moral": promovente.esPersonaMoral,
+                "tipo_parte": promovente.tipoParte,
+                "tipo_parte_nombre": safe_string(promovente.tipoParteNombre, save_enie=True),
+                "correo_electronico": correo_electronico,
+                "telefono": telefono,
+            }
+        )
 
-    # OPCIONAL Insertar las partes
-    if exh_exhorto_in.partes:
-        for parte in exh_exhorto_in.partes:
-            genero = safe_string(parte.genero, to_uppercase=True)
-            if genero not in ExhExhortoParte.GENEROS:
-                genero = "-"  # En persona moral se usa guion
-            try:
-                correo_electronico = safe_email(parte.correoElectronico)
-            except ValueError:
-                correo_electronico = None
-            telefono = safe_telefono(parte.telefono)
-            if telefono == "":
-                telefono = None
-            exh_exhorto_parte = ExhExhortoParte(
-                exh_exhorto_id=exh_exhorto.id,
-                nombre=safe_string(parte.nombre, save_enie=True),
-                apellido_paterno=safe_string(parte.apellidoPaterno, save_enie=True),
-                apellido_materno=safe_string(parte.apellidoMaterno, save_enie=True),
-                genero=genero,
-                es_persona_moral=parte.esPersonaMoral,
-                tipo_parte=parte.tipoParte,
-                tipo_parte_nombre=safe_string(parte.tipoParteNombre, save_enie=True),
-                correo_electronico=correo_electronico,
-                telefono=telefono,
-            )
-            database.add(exh_exhorto_parte)
+    # Entregar
+    return ExhExhortoRecepcion(exhorto=exhorto, partes=partes, archivos=archivos, promoventes=promoventes), []
 
-    # Insertar los archivos
-    for archivo in exh_exhorto_in.archivos:
-        exh_exhorto_archivo = ExhExhortoArchivo(
-            exh_exhorto_id=exh_exhorto.id,
-            nombre_archivo=archivo.nombreArchivo,
-            hash_sha1=archivo.hashSha1,
-            hash_sha256=archivo.hashSha256,
-            tipo_documento=archivo.tipoDocumento,
-            estado="PENDIENTE",
-            tamano=0,
-            fecha_hora_recepcion=datetime.now(),
-        )
-        database.add(exh_exhorto_archivo)
 
-    # OPCIONAL Insertar los promoventes
-    if exh_exhorto_in.promoventes:
-        for promovente in exh_exhorto_in.promoventes:
-            genero = safe_string(promovente.genero, to_uppercase=True)
-            if genero not in ExhExhortoPromovente.GENEROS:
-                genero = "-"
-            try:
-                correo_electronico = safe_email(promovente.correoElectronico)
-            except ValueError:
-                correo_electronico = None
-            telefono = safe_telefono(promovente.telefono)
-            if telefono == "":
-                telefono = None
-            exh_exhorto_promovente = ExhExhortoPromovente(
-                exh_exhorto_id=exh_exhorto.id,
-                nombre=safe_string(promovente.nombre, save_enie=True),
-                apellido_paterno=safe_string(promovente.apellidoPaterno, save_enie=True),
-                apellido_materno=safe_string(promovente.apellidoMaterno, save_enie=True),
-                genero=genero,
-                es_persona_moral=promovente.esPersonaMoral,
-                tipo_parte=promovente.tipoParte,
-                tipo_parte_nombre=safe_string(promovente.tipoParteNombre, save_enie=True),
-                correo_electronico=correo_electronico,
-                telefono=telefono,
-            )
-            database.add(exh_exhorto_promovente)
+async def insert_exh_exhortos(database: AsyncSession, recepciones: list[ExhExhortoRecepcion]) -> list[tuple[int, datetime]]:
+    """Insertar los exhortos y sus hijos con una sentencia por tabla, entrega el ID y la fecha de creación de cada uno"""
+
+    # Insertar los exhortos, se obtienen sus ID y sus fechas de creación en el mismo orden
+    resultado = await database.execute(
+        insert(ExhExhorto).returning(ExhExhorto.id, ExhExhorto.creado, sort_by_parameter_order=True),
+        [recepcion.exhorto for recepcion in recepciones],
+    )
+    filas = [tuple(fila) for fila in resultado.all()]
+
+    # Juntar las partes, los archivos y los promoventes de todos los exhortos
+    partes, archivos, promoventes = [], [], []
+    for (exh_exhorto_id, _), recepcion in zip(filas, recepciones):
+        partes.extend({**parte, "exh_exhorto_id": exh_exhorto_id} for parte in recepcion.partes)
+        archivos.extend({**archivo, "exh_exhorto_id": exh_exhorto_id} for archivo in recepcion.archivos)
+        promoventes.extend({**promovente, "exh_exhorto_id": exh_exhorto_id} for promovente in recepcion.promoventes)
+
+    # Insertar cada tabla en una sola sentencia
+    if partes:
+        await database.execute(insert(ExhExhortoParte).values(partes))
+    if archivos:
+        await database.execute(insert(ExhExhortoArchivo).values(archivos))
+    if promoventes:
+        await database.execute(insert(ExhExhortoPromovente).values(promoventes))
 
-    # Terminar la transacción
-    database.commit()
-    database.refresh(exh_exhorto)
+    # Entregar
+    return filas
 
-    # Cambiar fecha_hora de UTC a tiempo local
-    fecha_hora = exh_exhorto.creado.replace(tzinfo=utc_tz).astimezone(local_tz)
 
-    # Entregar acuse
+def build_exh_exhorto_acuse(settings: Settings, exhorto_origen_id: str, creado: datetime) -> OneExhExhortoOut:
+    """Acuse de recepción de un exhorto, con la fecha de creación en tiempo local"""
+    fecha_hora = creado.replace(tzinfo=pytz.utc).astimezone(pytz.timezone(settings.tz))
     data = ExhExhortoOut(
-        exhortoOrigenId=str(exh_exhorto.exhorto_origen_id),
+        exhortoOrigenId=str(exhorto_origen_id),
         fechaHora=fecha_hora.strftime("%Y-%m-%d %H:%M:%S"),
     )
     return OneExhExhortoOut(success=True, message="Exhorto recibido con éxito", errors=[], data=data)
+
+
+@exh_exhortos.post("/recibir", response_model=OneExhExhortoOut)
+@query_budget(7)
+async def recibir_exhorto_request(
+    current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    exh_exhorto_in: ExhExhortoIn,
+    idempotency_key: Annotated[str | None, Header(max_length=IDEMPOTENCY_KEY_MAX_LEN)] = None,
+):
+    """Recepción de datos de un exhorto"""
+    if current_user.permissions.get("EXH EXHORTOS", 0) < Permiso.CREAR:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    # Si es un reintento, entregar la respuesta guardada sin validar ni insertar de nuevo,
+    # la clave es exhortoOrigenId normalizado como se guarda
+    exhorto_origen_id = safe_exhorto_origen_id(exh_exhorto_in.exhortoOrigenId)
+    idempotencia = get_idempotencia(current_user.id, "recibir", idempotency_key, exh_exhorto_in, exhorto_origen_id)
+    respuesta = await get_idempotent_response(database, idempotencia)
+    if respuesta is not None:
+        return respuesta
+
+    # Si ya existe un exhorto con ese exhorto_origen_id, por ejemplo de otro usuario, se termina de forma fallida
+    if await get_exhortos_origen_ids_recibidos(database, [exhorto_origen_id]):
+        mensaje = f"Ya se recibió el exhorto con exhortoOrigenId {exhorto_origen_id}"
+        return OneExhExhortoOut(success=False, message="Falló la recepción del exhorto", errors=[mensaje], data=None)
+
+    # Validar el exhorto, si hubo errores se termina de forma fallida
+    recepcion, errores = await validate_exh_exhorto_in(database, settings, exh_exhorto_in)
+    if len(errores) > 0:
+        return OneExhExhortoOut(success=False, message="Falló la recepción del exhorto", errors=errores, data=None)
+
+    # Insertar el exhorto con sus partes, archivos y promoventes
+    [(_, exh_exhorto_creado)] = await insert_exh_exhortos(database, [recepcion])
+
+    # Terminar la transacción, el exhorto, sus hijos y el acuse para los reintentos se guardan juntos o nada
+    resultado = build_exh_exhorto_acuse(settings, recepcion.exhorto["exhorto_origen_id"], exh_exhorto_creado)
+    return await save_idempotent_response(database, idempotencia, resultado)
+
+
+@exh_exhortos.post("/recibir_lote", response_model=OneExhExhortoLoteOut)
+@query_budget(7)
+async def recibir_exhortos_lote_request(
+    current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    exh_exhortos_in: list[ExhExhortoIn],
+):
+    """Recepción de un lote de exhortos, se insertan juntos los válidos y se entrega el acuse o los errores de cada uno"""
+    if current_user.permissions.get("EXH EXHORTOS", 0) < Permiso.CREAR:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    # Validar la cantidad de exhortos
+    if len(exh_exhortos_in) == 0 or len(exh_exhortos_in) > settings.exh_exhortos_lote_max_size:
+        mensaje = f"El lote debe tener de 1 a {settings.exh_exhortos_lote_max_size} exhortos"
+        return OneExhExhortoLoteOut(success=False, message=mensaje, errors=[mensaje], data=None)
+
+    # Las claves de idempotencia son las mismas de /recibir, así un reintento por cualquiera de las dos rutas no duplica
+    exhortos_origen_ids = [safe_exhorto_origen_id(exh_exhorto_in.exhortoOrigenId) for exh_exhorto_in in exh_exhortos_in]
+    idempotencias = [
+        get_idempotencia(current_user.id, "recibir", None, exh_exhorto_in, exhorto_origen_id)
+        for exh_exhorto_in, exhorto_origen_id in zip(exh_exhortos_in, exhortos_origen_ids)
+    ]
+
+    # Consultar en una sola consulta los exhortos del lote que ya se recibieron, y en otra los que ya existen
+    guardados = await get_idempotent_contents(database, idempotencias)
+    existentes = await get_exhortos_origen_ids_recibidos(database, exhortos_origen_ids)
+
+    # Validar cada exhorto, los ya recibidos entregan su acuse original
+    acuses: list[OneExhExhortoOut | None] = [None] * len(exh_exhortos_in)
+    pendientes = []  # Índice y recepción de los exhortos válidos
+    claves = set()
+    for indice, (exh_exhorto_in, idempotencia) in enumerate(zip(exh_exhortos_in, idempotencias)):
+        if idempotencia.clave != "" and idempotencia.clave in claves:
+            mensaje = f"Se repite el exhortoOrigenId {idempotencia.clave} en el lote"
+            acuses[indice] = OneExhExhortoOut(success=False, message=mensaje, errors=[mensaje], data=None)
+            continue
+        claves.add(idempotencia.clave)
+        if idempotencia.clave in guardados:
+            acuses[indice] = OneExhExhortoOut.model_validate_json(guardados[idempotencia.clave])
+            continue
+        if exhortos_origen_ids[indice] in existentes:
+            mensaje = f"Ya se recibió el exhorto con exhortoOrigenId {exhortos_origen_ids[indice]}"
+            acuses[indice] = OneExhExhortoOut(
+                success=False, message="Falló la recepción del exhorto", errors=[mensaje], data=None
+            )
+            continue
+        recepcion, errores = await validate_exh_exhorto_in(database, settings, exh_exhorto_in)
+        if len(errores) > 0:
+            acuses[indice] = OneExhExhortoOut(
+                success=False, message="Falló la recepción del exhorto", errors=errores, data=None
+            )
+            continue
+        pendientes.append((indice, recepcion))
+
+    # Insertar los exhortos válidos y sus hijos, una sentencia por tabla
+    if pendientes:
+        filas = await insert_exh_exhortos(database, [recepcion for _, recepcion in pendientes])
+        for (indice, recepcion), (_, creado) in zip(pendientes, filas):
+            acuses[indice] = build_exh_exhorto_acuse(settings, recepcion.exhorto["exhorto_origen_id"], creado)
+
+        # Terminar la transacción, los exhortos, sus hijos y los acuses para los reintentos se guardan juntos o nada
+        try:
+            await save_idempotent_responses(database, [(idempotencias[indice], acuses[indice]) for indice, _ in pendientes])
+        except IntegrityError:
+            mensaje = "Otra petición recibió al mismo tiempo alguno de estos exhortos, vuelva a enviar el lote"
+            return OneExhExhortoLoteOut(success=False, message=mensaje, errors=[mensaje], data=None)
+
+    # Entregar el acuse o los errores de cada exhorto, en el mismo orden del lote
+    recibidos = sum(1 for acuse in acuses if acuse.success)
+    return OneExhExhortoLoteOut(
+        success=recibidos == len(acuses),
+        message=f"Se recibieron {recibidos} de {len(acuses)} exhortos",
+        errors=[
+            f"{exh_exhorto_in.exhortoOrigenId}: {error}"
+            for exh_exhorto_in, acuse in zip(exh_exhortos_in, acuses)
+            for error in acuse.errors or []
+        ],
+        data=acuses,
+    )
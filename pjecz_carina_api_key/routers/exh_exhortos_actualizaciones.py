@@ -6,11 +6,19 @@ from datetime import datetime
 from typing import Annotated
 
 import pytz
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy import insert
 
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
+from ..dependencies.database import AsyncSession, get_async_db
 from ..dependencies.exceptions import MyAnyError
+from ..dependencies.idempotency import (
+    IDEMPOTENCY_KEY_MAX_LEN,
+    get_idempotencia,
+    get_idempotent_response,
+    save_idempotent_response,
+)
+from ..dependencies.query_detector import query_budget
 from ..dependencies.safe_string import safe_string
 from ..models.exh_exhortos_actualizaciones import ExhExhortoActualizacion
 from ..models.permisos import Permiso
@@ -26,16 +34,31 @@ exh_exhortos_actualizaciones = APIRouter(prefix="/api/v5/exh_exhortos")
 
 
 @exh_exhortos_actualizaciones.post("/actualizar", response_model=OneExhExhortoActualizacionOut)
+@query_budget(4)
 async def recibir_exhorto_actualizacion_request(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     settings: Annotated[Settings, Depends(get_settings)],
     exh_exhorto_actualizacion_in: ExhExhortoActualizacionIn,
+    idempotency_key: Annotated[str | None, Header(max_length=IDEMPOTENCY_KEY_MAX_LEN)] = None,
 ):
     """Recibir una actualización de un exhorto"""
     if current_user.permissions.get("EXH EXHORTOS ACTUALIZACIONES", 0) < Permiso.CREAR:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
+    # Si es un reintento, entregar la respuesta guardada sin validar ni insertar de nuevo
+    idempotencia = get_idempotencia(
+        current_user.id,
+        "actualizar",
+        idempotency_key,
+        exh_exhorto_actualizacion_in,
+        exh_exhorto_actualizacion_in.exhortoId,
+        exh_exhorto_actualizacion_in.actualizacionOrigenId,
+    )
+    respuesta = await get_idempotent_response(database, idempotencia)
+    if respuesta is not None:
+        return respuesta
+
     # Preparar las zonas horarias UTC y local
     utc_tz = pytz.utc
     local_tz = pytz.timezone(settings.tz)
@@ -46,7 +69,7 @@ async def recibir_exhorto_actualizacion_request(
     # Consultar el exhorto
     exh_exhorto = None
     try:
-        exh_exhorto = get_exhorto_with_exhorto_origen_id(database, exh_exhorto_actualizacion_in.exhortoId)
+        exh_exhorto = await get_exhorto_with_exhorto_origen_id(database, exh_exhorto_actualizacion_in.exhortoId)
     except MyAnyError as error:
         errores.append(str(error))
 
@@ -64,13 +87,13 @@ async def recibir_exhorto_actualizacion_request(
     fecha_hora = None
     try:
         fecha_hora = datetime.strptime(exh_exhorto_actualizacion_in.fechaHora, "%Y-%m-%d %H:%M:%S")
+        fecha_hora = fecha_hora.replace(tzinfo=local_tz).astimezone(utc_tz).replace(tzinfo=None)  # asyncpg exige fecha sin zona
     except ValueError:
         errores.append("No es válido fecha_hora")
-    fecha_hora = fecha_hora.replace(tzinfo=local_tz).astimezone(utc_tz)
 
     # Validar descripción
     descripcion = safe_string(exh_exhorto_actualizacion_in.descripcion, max_len=256, save_enie=True)
-    if tipo_actualizacion == "":
+    if descripcion == "":
         errores.append("No es válida la descripción")
 
     # Si hubo errores, se termina de forma fallida
@@ -79,27 +102,32 @@ async def recibir_exhorto_actualizacion_request(
             success=False, message="Falló la recepción de la actualización", errors=errores, data=None
         )
 
-    # Insertar la actualización
-    exh_exhorto_actualizacion = ExhExhortoActualizacion(
-        exh_exhorto_id=exh_exhorto.id,
-        actualizacion_origen_id=actualizacion_origen_id,
-        tipo_actualizacion=tipo_actualizacion,
-        fecha_hora=fecha_hora,
-        descripcion=descripcion,
-        remitente="EXTERNO",
-        estado="ENVIADO",
+    # Insertar la actualización, en la misma sentencia se obtienen su ID y su fecha de creación
+    resultado = await database.execute(
+        insert(ExhExhortoActualizacion)
+        .values(
+            exh_exhorto_id=exh_exhorto.id,
+            actualizacion_origen_id=actualizacion_origen_id,
+            tipo_actualizacion=tipo_actualizacion,
+            fecha_hora=fecha_hora,
+            descripcion=descripcion,
+            remitente="EXTERNO",
+            estado="ENVIADO",
+        )
+        .returning(ExhExhortoActualizacion.creado)
     )
-    database.add(exh_exhorto_actualizacion)
-    database.commit()
-    database.refresh(exh_exhorto_actualizacion)
+    exh_exhorto_actualizacion_creado = resultado.scalar_one()
 
     # Cambiar fecha_hora de UTC a tiempo local
-    fecha_hora = exh_exhorto_actualizacion.creado.replace(tzinfo=utc_tz).astimezone(local_tz)
+    fecha_hora = exh_exhorto_actualizacion_creado.replace(tzinfo=utc_tz).astimezone(local_tz)
 
-    # Entregar
+    # Preparar el acuse
     data = ExhExhortoActualizacionOut(
-        exhortoId=exh_exhorto_actualizacion.exh_exhorto.exhorto_origen_id,
-        actualizacionOrigenId=exh_exhorto_actualizacion.actualizacion_origen_id,
+        exhortoId=exh_exhorto.exhorto_origen_id,
+        actualizacionOrigenId=actualizacion_origen_id,
         fechaHora=fecha_hora.strftime("%Y-%m-%d %H:%M:%S"),
     )
-    return OneExhExhortoActualizacionOut(success=True, message="Actualización recibida con éxito", errors=[], data=data)
+    resultado = OneExhExhortoActualizacionOut(success=True, message="Actualización recibida con éxito", errors=[], data=data)
+
+    # Terminar la transacción, la actualización y el acuse para los reintentos se guardan juntos o nada
+    return await save_idempotent_response(database, idempotencia, resultado)
@@ -2,25 +2,31 @@
 Exh Exhortos Archivos, routers
 """
 
-import hashlib
+import asyncio
 from datetime import datetime
 from typing import Annotated
 
 import pytz
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
 
+from ..dependencies.archivos_contadores import ArchivoRecibido, get_archivos_pendientes, update_archivos_recibidos
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
-from ..dependencies.exceptions import MyAnyError
-from ..dependencies.google_cloud_storage import upload_file_to_gcs
+from ..dependencies.database import AsyncSession, get_async_db
+from ..dependencies.exceptions import MyAnyError, MyFileCorruptedError, MyOutOfRangeParamError
+from ..dependencies.file_ingestion import TAMANO_MAXIMO
 from ..dependencies.pwgen import generar_identificador
+from ..dependencies.query_detector import query_budget
+from ..dependencies.upload_spool import discard_spool_job, enqueue_spool_job, receive_upload_file
+from ..models.exh_exhortos import ExhExhorto
 from ..models.exh_exhortos_archivos import ExhExhortoArchivo
 from ..models.permisos import Permiso
 from ..schemas.exh_exhortos_archivos import (
     ExhExhortoArchivoFileDataAcuse,
     ExhExhortoArchivoFileDataArchivo,
     ExhExhortoArchivoOut,
+    ExhExhortoArchivosOut,
     OneExhExhortoArchivoOut,
+    OneExhExhortoArchivosOut,
 )
 from ..settings import Settings, get_settings
 from .exh_exhortos import get_exhorto_with_exhorto_origen_id
@@ -28,10 +34,111 @@ from .exh_exhortos import get_exhorto_with_exhorto_origen_id
 exh_exhortos_archivos = APIRouter(prefix="/api/v5/exh_exhortos")
 
 
+async def get_exhorto_archivo_pendiente(
+    database: AsyncSession,
+    exh_exhorto_id: int,
+    nombre_archivo: str,
+) -> tuple[ExhExhortoArchivo | None, int]:
+    """Buscar el archivo PENDIENTE de un exhorto a partir de su nombre, entrega el archivo y su número en el exhorto"""
+    pendientes = await get_archivos_pendientes(
+        database, ExhExhortoArchivo, ExhExhortoArchivo.exh_exhorto_id, exh_exhorto_id, nombre_archivo
+    )
+    return pendientes.get(nombre_archivo, (None, 0))
+
+
+def get_exhorto_archivo_blob_name(exhorto_origen_id: str, numero: int, fecha_hora_recepcion: datetime) -> str:
+    """Definir el nombre del archivo en Google Storage, con la fecha de recepción en la ruta"""
+    archivo_pdf_nombre = f"{exhorto_origen_id}_{str(numero).zfill(4)}.pdf"
+    year = fecha_hora_recepcion.strftime("%Y")
+    month = fecha_hora_recepcion.strftime("%m")
+    day = fecha_hora_recepcion.strftime("%d")
+    return f"exh_exhortos_archivos/{year}/{month}/{day}/{archivo_pdf_nombre}"
+
+
+def set_exhorto_recibido(
+    settings: Settings,
+    exh_exhorto: ExhExhorto,
+    fecha_hora_recepcion: datetime,
+) -> ExhExhortoArchivoFileDataAcuse:
+    """Generar el folio de seguimiento del exhorto que ya tiene todos sus archivos y elaborar el acuse"""
+
+    # Generar el folio de seguimiento
+    folio_seguimiento = generar_identificador()
+
+    # Actualizar el exhorto
+    exh_exhorto.estado = "RECIBIDO"
+    exh_exhorto.folio_seguimiento = folio_seguimiento
+    exh_exhorto.respuesta_fecha_hora_recepcion = fecha_hora_recepcion
+    exh_exhorto.respuesta_municipio_turnado_id = 30  # Saltillo
+    exh_exhorto.respuesta_area_turnado_id = None  # Como el área NO esta definida se responde con nulo
+    exh_exhorto.respuesta_area_turnado_nombre = None  # Como el área NO esta definida se responde con nulo
+
+    # Cambiar fecha_hora_recepcion de UTC a tiempo local
+    utc_tz = pytz.utc
+    local_tz = pytz.timezone(settings.tz)
+    fecha_hora_recepcion = exh_exhorto.respuesta_fecha_hora_recepcion.replace(tzinfo=utc_tz).astimezone(local_tz)
+
+    # Elaborar el acuse
+    return ExhExhortoArchivoFileDataAcuse(
+        exhortoOrigenId=exh_exhorto.exhorto_origen_id,
+        folioSeguimiento=folio_seguimiento,
+        fechaHoraRecepcion=fecha_hora_recepcion.strftime("%Y-%m-%d %H:%M:%S"),
+        municipioAreaRecibeId=exh_exhorto.respuesta_municipio_turnado_id,
+        areaRecibeId=exh_exhorto.respuesta_area_turnado_id,
+        areaRecibeNombre=exh_exhorto.respuesta_area_turnado_nombre,
+        urlInfo="https://justiciadigital.gob.mx",
+    )
+
+
+async def registrar_exhorto_archivo_recibido(
+    database: AsyncSession,
+    settings: Settings,
+    exh_exhorto: ExhExhorto,
+    exh_exhorto_archivo: ExhExhortoArchivo,
+    archivo_pdf_url: str | None,
+    archivo_pdf_tamanio: int,
+    fecha_hora_recepcion: datetime,
+) -> ExhExhortoArchivoOut | None:
+    """Marcar el archivo como RECIBIDO y, si ya no hay pendientes, generar el folio de seguimiento y el acuse,
+    entrega None si otra petición ya lo recibió"""
+
+    # Marcar el archivo como RECIBIDO y descontarlo de los pendientes del exhorto en una sola sentencia
+    marcados, pendientes, _ = await update_archivos_recibidos(
+        database=database,
+        modelo=ExhExhortoArchivo,
+        modelo_padre=ExhExhorto,
+        padre_columna=ExhExhortoArchivo.exh_exhorto_id,
+        padre_id=exh_exhorto.id,
+        archivos=[ArchivoRecibido(id=exh_exhorto_archivo.id, tamano=archivo_pdf_tamanio, url=archivo_pdf_url)],
+        fecha_hora_recepcion=fecha_hora_recepcion,
+    )
+    if not marcados:
+        return None
+
+    # Si YA NO HAY PENDIENTES entonces ES EL ULTIMO ARCHIVO
+    acuse = None  # Si aún faltan archivos, entonces el acuse es nulo
+    if pendientes == 0:
+        acuse = set_exhorto_recibido(settings, exh_exhorto, fecha_hora_recepcion)
+    await database.commit()
+
+    # Definir los datos del archivo para la respuesta
+    archivo = ExhExhortoArchivoFileDataArchivo(
+        nombreArchivo=exh_exhorto_archivo.nombre_archivo,
+        tamaño=archivo_pdf_tamanio,
+    )
+
+    # Juntar los datos para la respuesta
+    return ExhExhortoArchivoOut(
+        archivo=archivo,
+        acuse=acuse,
+    )
+
+
 @exh_exhortos_archivos.post("/recibir_archivo", response_model=OneExhExhortoArchivoOut)
+@query_budget(5)
 async def recibir_exhorto_archivo_request(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     settings: Annotated[Settings, Depends(get_settings)],
     archivo: UploadFile = File(...),
     exhortoOrigenId: str = Form(...),
@@ -51,7 +158,7 @@ async def recibir_exhorto_archivo_request(
 
     # Consultar el exhorto
     try:
-        exh_exhorto = get_exhorto_with_exhorto_origen_id(database, exhortoOrigenId)
+        exh_exhorto = await get_exhorto_with_exhorto_origen_id(database, exhortoOrigenId)
     except MyAnyError:
         return OneExhExhortoArchivoOut(
             success=False,
@@ -60,28 +167,8 @@ async def recibir_exhorto_archivo_request(
             data=None,
         )
 
-    # Consultar los archivos del exhorto
-    exh_exhortos_archivos_consulta = (
-        database.query(ExhExhortoArchivo)
-        .filter_by(exh_exhorto_id=exh_exhorto.id)
-        .filter_by(estatus="A")
-        .order_by(ExhExhortoArchivo.id)
-        .all()
-    )
-
-    # Buscar el archivo a partir del nombre del archivo
-    total_contador = 0
-    pendientes_contador = 0
-    recibidos_contador = 0
-    exh_exhorto_archivo = None
-    for item in exh_exhortos_archivos_consulta:
-        total_contador += 1
-        if item.nombre_archivo == archivo.filename and item.estado == "PENDIENTE":
-            exh_exhorto_archivo = item
-        if item.estado == "PENDIENTE":
-            pendientes_contador += 1
-        else:
-            recibidos_contador += 1
+    # Buscar el archivo PENDIENTE a partir del nombre del archivo
+    exh_exhorto_archivo, numero = await get_exhorto_archivo_pendiente(database, exh_exhorto.id, archivo.filename)
 
     # Si NO se encontró el archivo, entonces entregar un error
     if exh_exhorto_archivo is None:
@@ -92,11 +179,8 @@ async def recibir_exhorto_archivo_request(
             data=None,
         )
 
-    # Determinar el tamaño del archivo
-    archivo_pdf_tamanio = archivo.size
-
     # Validar que el archivo no exceda el tamaño máximo permitido de 10MB
-    if archivo_pdf_tamanio > 10 * 1024 * 1024:
+    if archivo.size is not None and archivo.size > TAMANO_MAXIMO:
         return OneExhExhortoArchivoOut(
             success=False,
             message="El archivo excede el tamaño máximo permitido",
@@ -104,50 +188,34 @@ async def recibir_exhorto_archivo_request(
             data=None,
         )
 
-    # Cargar el archivo en memoria
-    archivo_en_memoria = archivo.file.read()
-
-    # Validar la integridad del archivo con SHA1
-    if exh_exhorto_archivo.hash_sha1 is not None and exh_exhorto_archivo.hash_sha1 != "":
-        hasher_sha1 = hashlib.sha1()
-        hasher_sha1.update(archivo_en_memoria)
-        if exh_exhorto_archivo.hash_sha1 != hasher_sha1.hexdigest():
-            return OneExhExhortoArchivoOut(
-                success=False,
-                message="El archivo está corrupto",
-                errors=["El archivo no coincide con el hash SHA1"],
-                data=None,
-            )
-
-    # Validar la integridad del archivo con SHA256
-    if exh_exhorto_archivo.hash_sha256 is not None and exh_exhorto_archivo.hash_sha256 != "":
-        hasher_sha256 = hashlib.sha256()
-        hasher_sha256.update(archivo_en_memoria)
-        if exh_exhorto_archivo.hash_sha256 != hasher_sha256.hexdigest():
-            return OneExhExhortoArchivoOut(
-                success=False,
-                message="El archivo está corrupto",
-                errors=["El archivo no coincide con el hash SHA256"],
-                data=None,
-            )
-
-    # Definir el nombre del archivo a subir a Google Storage
-    archivo_pdf_nombre = f"{exhortoOrigenId}_{str(recibidos_contador + 1).zfill(4)}.pdf"
-
     # Definir la ruta para blob_name con la fecha actual
     fecha_hora_recepcion = datetime.now()
-    year = fecha_hora_recepcion.strftime("%Y")
-    month = fecha_hora_recepcion.strftime("%m")
-    day = fecha_hora_recepcion.strftime("%d")
-    blob_name = f"exh_exhortos_archivos/{year}/{month}/{day}/{archivo_pdf_nombre}"
+    blob_name = get_exhorto_archivo_blob_name(exhortoOrigenId, numero, fecha_hora_recepcion)
 
-    # Almacenar el archivo en Google Cloud Storage
+    # Almacenar el archivo en Google Cloud Storage, o en el directorio de la carga diferida, validando sus hashes
     try:
-        archivo_pdf_url = upload_file_to_gcs(
+        archivo_pdf_url, archivo_pdf_tamanio, trabajo = await receive_upload_file(
+            archivo=archivo,
+            tabla=ExhExhortoArchivo.__tablename__,
+            registro_id=exh_exhorto_archivo.id,
             bucket_name=settings.cloud_storage_deposito,
             blob_name=blob_name,
-            content_type="application/pdf",
-            data=archivo_en_memoria,
+            hash_sha1=exh_exhorto_archivo.hash_sha1,
+            hash_sha256=exh_exhorto_archivo.hash_sha256,
+        )
+    except MyFileCorruptedError as error:
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="El archivo está corrupto",
+            errors=[str(error)],
+            data=None,
+        )
+    except MyOutOfRangeParamError:
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="El archivo excede el tamaño máximo permitido",
+            errors=["El archivo no debe exceder los 10MB"],
+            data=None,
         )
     except MyAnyError as error:
         return OneExhExhortoArchivoOut(
@@ -157,67 +225,140 @@ async def recibir_exhorto_archivo_request(
             data=None,
         )
 
-    # Actualizar el archivo en la base de datos
-    exh_exhorto_archivo.estado = "RECIBIDO"
-    exh_exhorto_archivo.fecha_hora_recepcion = fecha_hora_recepcion
-    exh_exhorto_archivo.tamano = archivo_pdf_tamanio
-    exh_exhorto_archivo.url = archivo_pdf_url
-    database.add(exh_exhorto_archivo)
-    database.commit()
+    # Registrar el archivo como recibido y, si es el último, elaborar el acuse
+    data = await registrar_exhorto_archivo_recibido(
+        database=database,
+        settings=settings,
+        exh_exhorto=exh_exhorto,
+        exh_exhorto_archivo=exh_exhorto_archivo,
+        archivo_pdf_url=archivo_pdf_url,
+        archivo_pdf_tamanio=archivo_pdf_tamanio,
+        fecha_hora_recepcion=fecha_hora_recepcion,
+    )
+    if data is None:
+        await discard_spool_job(trabajo)
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="No se encontró el archivo",
+            errors=["Al parecer el archivo ya fue recibido"],
+            data=None,
+        )
+    enqueue_spool_job(trabajo)
 
-    # Actualizar el exhorto en la base de datos al estado RECIBIDO
-    exh_exhorto.estado = "RECIBIDO"
+    # Entregar la respuesta
+    return OneExhExhortoArchivoOut(success=True, message="Archivo recibido con éxito", errors=[], data=data)
 
-    # Definir los datos del archivo para la respuesta
-    archivo = ExhExhortoArchivoFileDataArchivo(
-        nombreArchivo=exh_exhorto_archivo.nombre_archivo,
-        tamaño=archivo_pdf_tamanio,
-    )
 
-    # Consultar la cantidad de archivos PENDIENTES
-    exh_exhortos_archivos_pendientes_cantidad = (
-        database.query(ExhExhortoArchivo)
-        .filter_by(exh_exhorto_id=exh_exhorto.id)
-        .filter_by(estado="PENDIENTE")
-        .filter_by(estatus="A")
-        .order_by(ExhExhortoArchivo.id)
-        .count()
-    )
+@exh_exhortos_archivos.post("/recibir_archivos", response_model=OneExhExhortoArchivosOut)
+@query_budget(4)
+async def recibir_exhorto_archivos_request(
+    current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    archivos: list[UploadFile] = File(...),
+    exhortoOrigenId: str = Form(...),
+):
+    """Recibir varios archivos de un exhorto en una sola petición, se suben al mismo tiempo y el acuse se elabora una vez"""
+    if current_user.permissions.get("EXH EXHORTOS ARCHIVOS", 0) < Permiso.CREAR:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
-    # Si YA NO HAY PENDIENTES entonces ES EL ULTIMO ARCHIVO
-    acuse = None  # Si aún faltan archivos, entonces el acuse es nulo
-    if exh_exhortos_archivos_pendientes_cantidad == 0:
-        # Generar el folio de seguimiento
-        folio_seguimiento = generar_identificador()
-        # Actualizar el exhorto
-        exh_exhorto.estado = "RECIBIDO"
-        exh_exhorto.folio_seguimiento = folio_seguimiento
-        exh_exhorto.respuesta_fecha_hora_recepcion = fecha_hora_recepcion
-        exh_exhorto.respuesta_municipio_turnado_id = 30  # Saltillo
-        exh_exhorto.respuesta_area_turnado_id = None  # Como el área NO esta definida se responde con nulo
-        exh_exhorto.respuesta_area_turnado_nombre = None  # Como el área NO esta definida se responde con nulo
-        database.add(exh_exhorto)
-        database.commit()
-        # Cambiar fecha_hora_recepcion de UTC a tiempo local
-        utc_tz = pytz.utc
-        local_tz = pytz.timezone(settings.tz)
-        fecha_hora_recepcion = exh_exhorto.respuesta_fecha_hora_recepcion.replace(tzinfo=utc_tz).astimezone(local_tz)
-        # Y se va a elaborar el acuse
-        acuse = ExhExhortoArchivoFileDataAcuse(
-            exhortoOrigenId=exh_exhorto.exhorto_origen_id,
-            folioSeguimiento=folio_seguimiento,
-            fechaHoraRecepcion=fecha_hora_recepcion.strftime("%Y-%m-%d %H:%M:%S"),
-            municipioAreaRecibeId=exh_exhorto.respuesta_municipio_turnado_id,
-            areaRecibeId=exh_exhorto.respuesta_area_turnado_id,
-            areaRecibeNombre=exh_exhorto.respuesta_area_turnado_nombre,
-            urlInfo="https://justiciadigital.gob.mx",
+    # Consultar el exhorto
+    try:
+        exh_exhorto = await get_exhorto_with_exhorto_origen_id(database, exhortoOrigenId)
+    except MyAnyError:
+        return OneExhExhortoArchivosOut(
+            success=False,
+            message="No se encontró el exhorto",
+            errors=["No se encontró el exhorto"],
+            data=None,
         )
 
-    # Juntar los datos para la respuesta
-    data = ExhExhortoArchivoOut(
-        archivo=archivo,
-        acuse=acuse,
-    )
+    # Consultar en una sola consulta los archivos PENDIENTES del exhorto
+    pendientes = await get_archivos_pendientes(database, ExhExhortoArchivo, ExhExhortoArchivo.exh_exhorto_id, exh_exhorto.id)
+
+    # Emparejar cada archivo con su archivo PENDIENTE, los que no se pueden recibir se reportan
+    errores = []
+    cargas = []  # Archivo, archivo PENDIENTE y blob_name
+    fecha_hora_recepcion = datetime.now()
+    for archivo in archivos:
+        if not archivo.filename.lower().endswith(".pdf"):
+            errores.append(f"{archivo.filename}: El nombre del archivo no termina en PDF")
+            continue
+        exh_exhorto_archivo, numero = pendientes.pop(archivo.filename, (None, 0))
+        if exh_exhorto_archivo is None:
+            errores.append(f"{archivo.filename}: Al parecer el archivo ya fue recibido o no se declaró en el exhorto")
+            continue
+        if archivo.size is not None and archivo.size > TAMANO_MAXIMO:
+            errores.append(f"{archivo.filename}: El archivo no debe exceder los 10MB")
+            continue
+        blob_name = get_exhorto_archivo_blob_name(exh_exhorto.exhorto_origen_id, numero, fecha_hora_recepcion)
+        cargas.append((archivo, exh_exhorto_archivo, blob_name))
+
+    # Subir los archivos al mismo tiempo, a lo más settings.exh_exhortos_archivos_paralelos, los hashes se validan al subir
+    semaforo = asyncio.Semaphore(settings.exh_exhortos_archivos_paralelos)
+
+    async def subir(archivo: UploadFile, exh_exhorto_archivo: ExhExhortoArchivo, blob_name: str) -> tuple:
+        async with semaforo:
+            return await receive_upload_file(
+                archivo=archivo,
+                tabla=ExhExhortoArchivo.__tablename__,
+                registro_id=exh_exhorto_archivo.id,
+                bucket_name=settings.cloud_storage_deposito,
+                blob_name=blob_name,
+                hash_sha1=exh_exhorto_archivo.hash_sha1,
+                hash_sha256=exh_exhorto_archivo.hash_sha256,
+            )
+
+    resultados = await asyncio.gather(*(subir(*carga) for carga in cargas), return_exceptions=True)
+
+    # Juntar los archivos que se subieron, con su nombre y su trabajo de carga diferida
+    subidos = []
+    for (archivo, exh_exhorto_archivo, _), resultado in zip(cargas, resultados):
+        if isinstance(resultado, MyFileCorruptedError):
+            errores.append(f"{archivo.filename}: El archivo está corrupto, {resultado}")
+        elif isinstance(resultado, MyOutOfRangeParamError):
+            errores.append(f"{archivo.filename}: El archivo no debe exceder los 10MB")
+        elif isinstance(resultado, MyAnyError):
+            errores.append(f"{archivo.filename}: Hubo un error al subir el archivo al storage, {resultado}")
+        elif isinstance(resultado, BaseException):
+            raise resultado
+        else:
+            archivo_pdf_url, archivo_pdf_tamanio, trabajo = resultado
+            subidos.append(
+                (archivo, ArchivoRecibido(id=exh_exhorto_archivo.id, tamano=archivo_pdf_tamanio, url=archivo_pdf_url), trabajo)
+            )
+
+    # Marcarlos como RECIBIDOS en una sola sentencia y si YA NO HAY PENDIENTES generar el folio de seguimiento y el acuse
+    recibidos = []
+    acuse = None
+    if subidos:
+        marcados, pendientes_cantidad, _ = await update_archivos_recibidos(
+            database=database,
+            modelo=ExhExhortoArchivo,
+            modelo_padre=ExhExhorto,
+            padre_columna=ExhExhortoArchivo.exh_exhorto_id,
+            padre_id=exh_exhorto.id,
+            archivos=[archivo_recibido for _, archivo_recibido, _ in subidos],
+            fecha_hora_recepcion=fecha_hora_recepcion,
+        )
+        if marcados and pendientes_cantidad == 0:
+            acuse = set_exhorto_recibido(settings, exh_exhorto, fecha_hora_recepcion)
+        await database.commit()
+
+        # Formar los trabajos de los que se marcaron, los demás los recibió otra petición y se descartan
+        for archivo, archivo_recibido, trabajo in subidos:
+            if archivo_recibido.id in marcados:
+                recibidos.append(
+                    ExhExhortoArchivoFileDataArchivo(nombreArchivo=archivo.filename, tamaño=archivo_recibido.tamano)
+                )
+                enqueue_spool_job(trabajo)
+            else:
+                errores.append(f"{archivo.filename}: Al parecer el archivo ya fue recibido por otra petición")
+                await discard_spool_job(trabajo)
 
     # Entregar la respuesta
-    return OneExhExhortoArchivoOut(success=True, message="Archivo recibido con éxito", errors=[], data=data)
+    data = ExhExhortoArchivosOut(archivos=recibidos, acuse=acuse)
+    if errores:
+        mensaje = f"Se recibieron {len(recibidos)} de {len(archivos)} archivos"
+        return OneExhExhortoArchivosOut(success=False, message=mensaje, errors=errores, data=data)
+    return OneExhExhortoArchivosOut(success=True, message="Archivos recibidos con éxito", errors=[], data=data)
@@ -0,0 +1,522 @@
+"""
+Exh Exhortos Archivos Cargas, routers
+
+Carga reanudable de archivos grandes, en cuatro pasos:
+
+1. POST /recibir_archivo/sesiones abre una sesión para un archivo declarado en el exhorto
+2. PUT /recibir_archivo/sesiones/{sesion_id}?desplazamiento=N envía una parte, con el cuerpo en bytes
+3. GET /recibir_archivo/sesiones/{sesion_id} consulta el desplazamiento confirmado para continuar
+4. POST /recibir_archivo/sesiones/{sesion_id}/finalizar junta las partes, valida los hashes y recibe el archivo
+
+El estado de la sesión está en la base de datos, cualquier worker puede recibir la siguiente parte.
+Los hashes parciales están en la memoria del worker que recibió las partes, si la siguiente la recibe
+otro, al finalizar se descarga el archivo completo del depósito para calcularlos.
+Cada parte se confirma solo si el desplazamiento sigue siendo el mismo, si no se borra y se entrega
+el desplazamiento vigente para que el remitente continúe desde ahí.
+
+Las sesiones vencen settings.archivo_carga_vigencia segundos después de abrirse, se cancelan y se
+borran sus partes al recibir una parte o finalizar; al abrir una sesión también se cancelan hasta
+settings.archivo_carga_vencidas_limite sesiones vencidas de cualquier archivo, las abandonadas.
+
+Al finalizar, las partes se juntan en un archivo de la sesión y sólo si sus hashes coinciden se copia
+al nombre definitivo, así nunca se reemplaza ni se borra un archivo que otra petición ya recibió.
+"""
+
+from datetime import datetime, timedelta
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import func, select, update
+
+from ..dependencies.authentications import UsuarioInDB, get_current_active_user
+from ..dependencies.database import AsyncSession, get_async_db
+from ..dependencies.exceptions import (
+    MyAnyError,
+    MyFileCorruptedError,
+    MyNotValidParamError,
+    MyOutOfRangeParamError,
+)
+from ..dependencies.file_ingestion import ingest_chunk, save_chunk_hashes, verify_composed_file
+from ..dependencies.google_cloud_storage import (
+    compose_files_in_gcs,
+    copy_file_in_gcs,
+    delete_file_from_gcs_async,
+    delete_files_from_gcs,
+    run_in_storage_executor,
+)
+from ..dependencies.pwgen import generar_aleatorio
+from ..models.exh_exhortos import ExhExhorto
+from ..models.exh_exhortos_archivos import ExhExhortoArchivo
+from ..models.exh_exhortos_archivos_cargas import ExhExhortoArchivoCarga
+from ..models.permisos import Permiso
+from ..schemas.exh_exhortos_archivos import OneExhExhortoArchivoOut
+from ..schemas.exh_exhortos_archivos_cargas import (
+    ExhExhortoArchivoCargaIn,
+    ExhExhortoArchivoCargaOut,
+    OneExhExhortoArchivoCargaOut,
+)
+from ..settings import Settings, get_settings
+from .exh_exhortos import get_exhorto_with_exhorto_origen_id
+from .exh_exhortos_archivos import (
+    get_exhorto_archivo_blob_name,
+    get_exhorto_archivo_pendiente,
+    registrar_exhorto_archivo_recibido,
+)
+
+exh_exhortos_archivos_cargas = APIRouter(prefix="/api/v5/exh_exhortos")
+
+
+async def get_exh_exhorto_archivo_carga(database: AsyncSession, sesion_id: str) -> ExhExhortoArchivoCarga:
+    """Consultar una sesión de carga con su ID cifrado"""
+
+    # Decodificar el ID
+    exh_exhorto_archivo_carga_id = ExhExhortoArchivoCarga.decode_id(sesion_id)
+    if exh_exhorto_archivo_carga_id is None:
+        raise MyNotValidParamError("No es un ID de sesión válido")
+
+    # Consultar la sesión, se vuelve a leer de la base de datos porque otro worker pudo cambiarla
+    exh_exhorto_archivo_carga = await database.get(ExhExhortoArchivoCarga, exh_exhorto_archivo_carga_id, populate_existing=True)
+    if exh_exhorto_archivo_carga is None or exh_exhorto_archivo_carga.estatus != "A":
+        raise MyNotValidParamError("No existe la sesión de carga")
+
+    # Entregar
+    return exh_exhorto_archivo_carga
+
+
+async def get_exh_exhorto_archivo_carga_out(
+    database: AsyncSession,
+    settings: Settings,
+    exh_exhorto_archivo_carga: ExhExhortoArchivoCarga,
+) -> ExhExhortoArchivoCargaOut:
+    """Elaborar el estado de una sesión de carga para la respuesta"""
+    exh_exhorto_archivo = await database.get(ExhExhortoArchivo, exh_exhorto_archivo_carga.exh_exhorto_archivo_id)
+    exh_exhorto = await database.get(ExhExhorto, exh_exhorto_archivo.exh_exhorto_id)
+    return ExhExhortoArchivoCargaOut(
+        sesionId=exh_exhorto_archivo_carga.encode_id(),
+        exhortoOrigenId=exh_exhorto.exhorto_origen_id,
+        nombreArchivo=exh_exhorto_archivo.nombre_archivo,
+        tamaño=exh_exhorto_archivo_carga.tamano,
+        desplazamiento=exh_exhorto_archivo_carga.recibido,
+        tamañoParteMaximo=settings.archivo_carga_parte_tamano_maximo,
+        estado=exh_exhorto_archivo_carga.estado,
+    )
+
+
+async def cancelar_exh_exhortos_archivos_cargas_vencidas(
+    database: AsyncSession,
+    settings: Settings,
+    exh_exhorto_archivo_carga_id: int | None = None,
+) -> list[int]:
+    """Cancelar las sesiones ABIERTAS vencidas y borrar sus partes, una en particular o las más antiguas"""
+
+    # Cancelar las sesiones vencidas, si otra petición ya las tomó se omiten
+    vencidas = (
+        select(ExhExhortoArchivoCarga.id)
+        .where(ExhExhortoArchivoCarga.estado == "ABIERTA")
+        .where(ExhExhortoArchivoCarga.creado < func.localtimestamp() - timedelta(seconds=settings.archivo_carga_vigencia))
+    )
+    if exh_exhorto_archivo_carga_id is None:
+        vencidas = vencidas.order_by(ExhExhortoArchivoCarga.creado).limit(settings.archivo_carga_vencidas_limite)
+    else:
+        vencidas = vencidas.where(ExhExhortoArchivoCarga.id == exh_exhorto_archivo_carga_id)
+    resultado = await database.execute(
+        update(ExhExhortoArchivoCarga)
+        .where(ExhExhortoArchivoCarga.id.in_(vencidas.with_for_update(skip_locked=True).scalar_subquery()))
+        .values(estado="CANCELADA")
+        .returning(ExhExhortoArchivoCarga.id, ExhExhortoArchivoCarga.partes)
+        .execution_options(synchronize_session=False)
+    )
+    canceladas = resultado.all()
+    await database.commit()
+
+    # Borrar las partes de las sesiones canceladas
+    partes = [parte for _, partes_sesion in canceladas for parte in partes_sesion]
+    if partes:
+        await run_in_storage_executor(delete_files_from_gcs, settings.cloud_storage_deposito, partes)
+
+    # Entregar los IDs de las sesiones canceladas
+    return [exh_exhorto_archivo_carga_id for exh_exhorto_archivo_carga_id, _ in canceladas]
+
+
+@exh_exhortos_archivos_cargas.post("/recibir_archivo/sesiones", response_model=OneExhExhortoArchivoCargaOut)
+async def abrir_exh_exhorto_archivo_carga_request(
+    current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    exh_exhorto_archivo_carga_in: ExhExhortoArchivoCargaIn,
+):
+    """Abrir una sesión de carga reanudable para un archivo de un exhorto"""
+    if current_user.permissions.get("EXH EXHORTOS ARCHIVOS", 0) < Permiso.CREAR:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    # Validar que el nombre del archivo termine en pdf
+    if not exh_exhorto_archivo_carga_in.nombreArchivo.lower().endswith(".pdf"):
+        return OneExhExhortoArchivoCargaOut(
+            success=False,
+            message="Tipo de archivo no permitido",
+            errors=["El nombre del archivo no termina en PDF"],
+            data=None,
+        )
+
+    # Validar el tamaño declarado
+    tamano = exh_exhorto_archivo_carga_in.tamaño
+    if tamano is not None and (tamano <= 0 or tamano > settings.archivo_carga_tamano_maximo):
+        return OneExhExhortoArchivoCargaOut(
+            success=False,
+            message="El archivo excede el tamaño máximo permitido",
+            errors=[f"El archivo no debe exceder los {settings.archivo_carga_tamano_maximo // (1024 * 1024)}MB"],
+            data=None,
+        )
+
+    # Consultar el exhorto
+    try:
+        exh_exhorto = await get_exhorto_with_exhorto_origen_id(database, exh_exhorto_archivo_carga_in.exhortoOrigenId)
+    except MyAnyError:
+        return OneExhExhortoArchivoCargaOut(
+            success=False,
+            message="No se encontró el exhorto",
+            errors=["No se encontró el exhorto"],
+            data=None,
+        )
+
+    # Buscar el archivo PENDIENTE a partir del nombre del archivo
+    exh_exhorto_archivo, _ = await get_exhorto_archivo_pendiente(
+        database, exh_exhorto.id, exh_exhorto_archivo_carga_in.nombreArchivo
+    )
+    if exh_exhorto_archivo is None:
+        return OneExhExhortoArchivoCargaOut(
+            success=False,
+            message="No se encontró el archivo",
+            errors=["Al parecer el archivo ya fue recibido o no se declaró en el exhorto"],
+            data=None,
+        )
+
+    # Cancelar las sesiones vencidas, así no se acumulan las partes de las abandonadas
+    await cancelar_exh_exhortos_archivos_cargas_vencidas(database, settings)
+
+    # Insertar la sesión de carga
+    exh_exhorto_archivo_carga = ExhExhortoArchivoCarga(
+        exh_exhorto_archivo_id=exh_exhorto_archivo.id,
+        tamano=tamano,
+        recibido=0,
+        partes=[],
+        estado="ABIERTA",
+    )
+    database.add(exh_exhorto_archivo_carga)
+    await database.commit()
+
+    # Entregar la respuesta
+    return OneExhExhortoArchivoCargaOut(
+        success=True,
+        message="Sesión de carga abierta",
+        errors=[],
+        data=await get_exh_exhorto_archivo_carga_out(database, settings, exh_exhorto_archivo_carga),
+    )
+
+
+@exh_exhortos_archivos_cargas.get("/recibir_archivo/sesiones/{sesion_id}", response_model=OneExhExhortoArchivoCargaOut)
+async def detalle_exh_exhorto_archivo_carga_request(
+    current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    sesion_id: str,
+):
+    """Consultar una sesión de carga, el desplazamiento es donde debe comenzar la siguiente parte"""
+    if current_user.permissions.get("EXH EXHORTOS ARCHIVOS", 0) < Permiso.VER:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    # Consultar la sesión
+    try:
+        exh_exhorto_archivo_carga = await get_exh_exhorto_archivo_carga(database, sesion_id)
+    except MyAnyError as error:
+        return OneExhExhortoArchivoCargaOut(success=False, message="No se encontró la sesión", errors=[str(error)], data=None)
+
+    # Entregar la respuesta
+    return OneExhExhortoArchivoCargaOut(
+        success=True,
+        message="Sesión de carga consultada",
+        errors=[],
+        data=await get_exh_exhorto_archivo_carga_out(database, settings, exh_exhorto_archivo_carga),
+    )
+
+
+@exh_exhortos_archivos_cargas.put("/recibir_archivo/sesiones/{sesion_id}", response_model=OneExhExhortoArchivoCargaOut)
+async def recibir_exh_exhorto_archivo_carga_parte_request(
+    current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    request: Request,
+    sesion_id: str,
+    desplazamiento: int,
+):
+    """Recibir una parte de un archivo, el cuerpo son los bytes que comienzan en el desplazamiento"""
+    if current_user.permissions.get("EXH EXHORTOS ARCHIVOS", 0) < Permiso.CREAR:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    # Consultar la sesión
+    try:
+        exh_exhorto_archivo_carga = await get_exh_exhorto_archivo_carga(database, sesion_id)
+    except MyAnyError as error:
+        return OneExhExhortoArchivoCargaOut(success=False, message="No se encontró la sesión", errors=[str(error)], data=None)
+
+    # Si la sesión venció, cancelarla y borrar sus partes
+    if exh_exhorto_archivo_carga.estado == "ABIERTA" and await cancelar_exh_exhortos_archivos_cargas_vencidas(
+        database, settings, exh_exhorto_archivo_carga.id
+    ):
+        return OneExhExhortoArchivoCargaOut(
+            success=False,
+            message="La sesión venció",
+            errors=["La sesión venció y se canceló, abra otra para enviar el archivo"],
+            data=None,
+        )
+
+    # Validar que la sesión esté abierta y que el desplazamiento sea el confirmado
+    if exh_exhorto_archivo_carga.estado != "ABIERTA" or desplazamiento != exh_exhorto_archivo_carga.recibido:
+        return OneExhExhortoArchivoCargaOut(
+            success=False,
+            message="La parte no corresponde a la sesión",
+            errors=[
+                f"La sesión está {exh_exhorto_archivo_carga.estado} y espera el desplazamiento {exh_exhorto_archivo_carga.recibido}"
+            ],
+            data=await get_exh_exhorto_archivo_carga_out(database, settings, exh_exhorto_archivo_carga),
+        )
+
+    # La parte no puede exceder su tamaño máximo, ni el tamaño declarado o el máximo del archivo
+    tamano_total = exh_exhorto_archivo_carga.tamano or settings.archivo_carga_tamano_maximo
+    tamano_maximo = min(settings.archivo_carga_parte_tamano_maximo, tamano_total - desplazamiento)
+
+    # Recibir la parte y subirla a Google Storage con un nombre único
+    parte_blob_name = f"exh_exhortos_archivos_cargas/{sesion_id}/{generar_aleatorio()}"
+    try:
+        parte_tamano, hashes = await ingest_chunk(
+            stream=request.stream(),
+            bucket_name=settings.cloud_storage_deposito,
+            blob_name=parte_blob_name,
+            carga_id=exh_exhorto_archivo_carga.id,
+            desplazamiento=desplazamiento,
+            tamano_maximo=tamano_maximo,
+        )
+    except MyOutOfRangeParamError as error:
+        return OneExhExhortoArchivoCargaOut(
+            success=False, message="La parte excede el tamaño máximo permitido", errors=[str(error)], data=None
+        )
+    except MyNotValidParamError as error:
+        return OneExhExhortoArchivoCargaOut(success=False, message="La parte no es válida", errors=[str(error)], data=None)
+    except MyAnyError as error:
+        return OneExhExhortoArchivoCargaOut(
+            success=False, message="Hubo un error al subir la parte al storage", errors=[str(error)], data=None
+        )
+
+    # Confirmar la parte, solo si ninguna otra petición cambió el desplazamiento mientras se recibía
+    resultado = await database.execute(
+        update(ExhExhortoArchivoCarga)
+        .where(ExhExhortoArchivoCarga.id == exh_exhorto_archivo_carga.id)
+        .where(ExhExhortoArchivoCarga.estado == "ABIERTA")
+        .where(ExhExhortoArchivoCarga.recibido == desplazamiento)
+        .values(
+            recibido=ExhExhortoArchivoCarga.recibido + parte_tamano,
+            partes=func.array_append(ExhExhortoArchivoCarga.partes, parte_blob_name),
+        )
+        .returning(ExhExhortoArchivoCarga.recibido)
+        .execution_options(synchronize_session=False)
+    )
+    recibido = resultado.scalar_one_or_none()
+    await database.commit()
+
+    # Si no se confirmó, borrar la parte y entregar el desplazamiento vigente
+    if recibido is None:
+        await delete_file_from_gcs_async(settings.cloud_storage_deposito, parte_blob_name)
+        exh_exhorto_archivo_carga = await get_exh_exhorto_archivo_carga(database, sesion_id)
+        return OneExhExhortoArchivoCargaOut(
+            success=False,
+            message="La parte no corresponde a la sesión",
+            errors=[f"Otra petición cambió la sesión, espera el desplazamiento {exh_exhorto_archivo_carga.recibido}"],
+            data=await get_exh_exhorto_archivo_carga_out(database, settings, exh_exhorto_archivo_carga),
+        )
+
+    # Guardar los hashes parciales para continuarlos con la siguiente parte
+    save_chunk_hashes(exh_exhorto_archivo_carga.id, hashes)
+
+    # Entregar la respuesta
+    exh_exhorto_archivo_carga = await get_exh_exhorto_archivo_carga(database, sesion_id)
+    return OneExhExhortoArchivoCargaOut(
+        success=True,
+        message="Parte recibida con éxito",
+        errors=[],
+        data=await get_exh_exhorto_archivo_carga_out(database, settings, exh_exhorto_archivo_carga),
+    )
+
+
+async def cambiar_estado_exh_exhorto_archivo_carga(
+    database: AsyncSession,
+    exh_exhorto_archivo_carga_id: int,
+    estado_anterior: str,
+    estado: str,
+) -> bool:
+    """Cambiar el estado de una sesión de carga, solo si tiene el estado anterior; entrega si se cambió"""
+    resultado = await database.execute(
+        update(ExhExhortoArchivoCarga)
+        .where(ExhExhortoArchivoCarga.id == exh_exhorto_archivo_carga_id)
+        .where(ExhExhortoArchivoCarga.estado == estado_anterior)
+        .values(estado=estado)
+        .returning(ExhExhortoArchivoCarga.id)
+        .execution_options(synchronize_session=False)
+    )
+    cambiado = resultado.scalar_one_or_none() is not None
+    await database.commit()
+    return cambiado
+
+
+@exh_exhortos_archivos_cargas.post("/recibir_archivo/sesiones/{sesion_id}/finalizar", response_model=OneExhExhortoArchivoOut)
+async def finalizar_exh_exhorto_archivo_carga_request(
+    current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    sesion_id: str,
+):
+    """Finalizar una sesión de carga, se juntan las partes, se validan los hashes y se recibe el archivo"""
+    if current_user.permissions.get("EXH EXHORTOS ARCHIVOS", 0) < Permiso.CREAR:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    # Consultar la sesión
+    try:
+        exh_exhorto_archivo_carga = await get_exh_exhorto_archivo_carga(database, sesion_id)
+    except MyAnyError as error:
+        return OneExhExhortoArchivoOut(success=False, message="No se encontró la sesión", errors=[str(error)], data=None)
+
+    # Si la sesión venció, cancelarla y borrar sus partes
+    if exh_exhorto_archivo_carga.estado == "ABIERTA" and await cancelar_exh_exhortos_archivos_cargas_vencidas(
+        database, settings, exh_exhorto_archivo_carga.id
+    ):
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="La sesión venció",
+            errors=["La sesión venció y se canceló, abra otra para enviar el archivo"],
+            data=None,
+        )
+
+    # Validar que se recibió el archivo completo
+    recibido = exh_exhorto_archivo_carga.recibido
+    if recibido == 0 or (exh_exhorto_archivo_carga.tamano is not None and recibido != exh_exhorto_archivo_carga.tamano):
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="El archivo está incompleto",
+            errors=[f"Se han recibido {recibido} de {exh_exhorto_archivo_carga.tamano} bytes"],
+            data=None,
+        )
+
+    # Tomar la sesión, si otra petición ya la está finalizando no se continúa
+    if not await cambiar_estado_exh_exhorto_archivo_carga(database, exh_exhorto_archivo_carga.id, "ABIERTA", "FINALIZADA"):
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="La sesión no está abierta",
+            errors=["La sesión ya fue finalizada o cancelada"],
+            data=None,
+        )
+    exh_exhorto_archivo_carga = await get_exh_exhorto_archivo_carga(database, sesion_id)
+    partes = list(exh_exhorto_archivo_carga.partes)
+
+    # Consultar el archivo y el exhorto, el archivo debe seguir PENDIENTE
+    exh_exhorto_archivo = await database.get(ExhExhortoArchivo, exh_exhorto_archivo_carga.exh_exhorto_archivo_id)
+    exh_exhorto = await database.get(ExhExhorto, exh_exhorto_archivo.exh_exhorto_id)
+    exh_exhorto_archivo_pendiente, numero = await get_exhorto_archivo_pendiente(
+        database, exh_exhorto.id, exh_exhorto_archivo.nombre_archivo
+    )
+    if exh_exhorto_archivo_pendiente is None or exh_exhorto_archivo_pendiente.id != exh_exhorto_archivo.id:
+        await cambiar_estado_exh_exhorto_archivo_carga(database, exh_exhorto_archivo_carga.id, "FINALIZADA", "CANCELADA")
+        await run_in_storage_executor(delete_files_from_gcs, settings.cloud_storage_deposito, partes)
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="No se encontró el archivo",
+            errors=["Al parecer el archivo ya fue recibido"],
+            data=None,
+        )
+
+    # Definir la ruta para blob_name con la fecha actual
+    fecha_hora_recepcion = datetime.now()
+    blob_name = get_exhorto_archivo_blob_name(exh_exhorto.exhorto_origen_id, numero, fecha_hora_recepcion)
+
+    # Juntar las partes en un archivo de la sesión, si falla la sesión vuelve a estar abierta para reintentar
+    juntado_blob_name = f"exh_exhortos_archivos_cargas/{sesion_id}/final"
+    try:
+        await run_in_storage_executor(
+            compose_files_in_gcs,
+            bucket_name=settings.cloud_storage_deposito,
+            source_blob_names=partes,
+            blob_name=juntado_blob_name,
+            content_type="application/pdf",
+        )
+    except MyAnyError as error:
+        await cambiar_estado_exh_exhorto_archivo_carga(database, exh_exhorto_archivo_carga.id, "FINALIZADA", "ABIERTA")
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="Hubo un error al subir el archivo al storage",
+            errors=[str(error)],
+            data=None,
+        )
+
+    # Validar la integridad del archivo con SHA1 y SHA256, si no coincide se borra y se cancela la sesión
+    try:
+        await verify_composed_file(
+            carga_id=exh_exhorto_archivo_carga.id,
+            tamano=recibido,
+            bucket_name=settings.cloud_storage_deposito,
+            blob_name=juntado_blob_name,
+            hash_sha1=exh_exhorto_archivo.hash_sha1,
+            hash_sha256=exh_exhorto_archivo.hash_sha256,
+        )
+    except MyFileCorruptedError as error:
+        await cambiar_estado_exh_exhorto_archivo_carga(database, exh_exhorto_archivo_carga.id, "FINALIZADA", "CANCELADA")
+        await run_in_storage_executor(delete_files_from_gcs, settings.cloud_storage_deposito, partes + [juntado_blob_name])
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="El archivo está corrupto",
+            errors=[str(error)],
+            data=None,
+        )
+    except MyAnyError as error:
+        await cambiar_estado_exh_exhorto_archivo_carga(database, exh_exhorto_archivo_carga.id, "FINALIZADA", "ABIERTA")
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="Hubo un error al leer el archivo del storage",
+            errors=[str(error)],
+            data=None,
+        )
+
+    # Copiar el archivo juntado al nombre definitivo, si falla la sesión vuelve a estar abierta para reintentar
+    try:
+        archivo_pdf_url = await run_in_storage_executor(
+            copy_file_in_gcs, settings.cloud_storage_deposito, juntado_blob_name, blob_name
+        )
+    except MyAnyError as error:
+        await cambiar_estado_exh_exhorto_archivo_carga(database, exh_exhorto_archivo_carga.id, "FINALIZADA", "ABIERTA")
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="Hubo un error al subir el archivo al storage",
+            errors=[str(error)],
+            data=None,
+        )
+
+    # Borrar las partes y el archivo juntado
+    await run_in_storage_executor(delete_files_from_gcs, settings.cloud_storage_deposito, partes + [juntado_blob_name])
+
+    # Registrar el archivo como recibido y, si es el último, elaborar el acuse
+    data = await registrar_exhorto_archivo_recibido(
+        database=database,
+        settings=settings,
+        exh_exhorto=exh_exhorto,
+        exh_exhorto_archivo=exh_exhorto_archivo,
+        archivo_pdf_url=archivo_pdf_url,
+        archivo_pdf_tamanio=recibido,
+        fecha_hora_recepcion=fecha_hora_recepcion,
+    )
+    if data is None:
+        return OneExhExhortoArchivoOut(
+            success=False,
+            message="No se encontró el archivo",
+            errors=["Al parecer el archivo ya fue recibido"],
+            data=None,
+        )
+
+    # Entregar la respuesta
+    return OneExhExhortoArchivoOut(success=True, message="Archivo recibido con éxito", errors=[], data=data)
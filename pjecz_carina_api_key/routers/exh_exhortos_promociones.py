@@ -6,11 +6,19 @@ from datetime import datetime
 from typing import Annotated
 
 import pytz
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy import insert, select
 
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
+from ..dependencies.database import AsyncSession, get_async_db
 from ..dependencies.exceptions import MyNotExistsError, MyNotValidParamError
+from ..dependencies.idempotency import (
+    IDEMPOTENCY_KEY_MAX_LEN,
+    get_idempotencia,
+    get_idempotent_response,
+    save_idempotent_response,
+)
+from ..dependencies.query_detector import query_budget
 from ..dependencies.safe_string import safe_email, safe_string, safe_telefono
 from ..models.exh_exhortos import ExhExhorto
 from ..models.exh_exhortos_promociones import ExhExhortoPromocion
@@ -24,8 +32,8 @@ from .exh_exhortos import get_exhorto_with_folio_seguimiento
 exh_exhortos_promociones = APIRouter(prefix="/api/v5/exh_exhortos")
 
 
-def get_exhorto_promocion(
-    database: Annotated[Session, Depends(get_db)],
+async def get_exhorto_promocion(
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     folio_seguimiento: str,
     folio_origen_promocion: str,
 ) -> ExhExhortoPromocion:
@@ -42,14 +50,14 @@ def get_exhorto_promocion(
         raise MyNotValidParamError("No es un 'folio origen promocion' válido")
 
     # Consultar la promoción
-    exh_exhorto_promocion = (
-        database.query(ExhExhortoPromocion)
+    resultado = await database.execute(
+        select(ExhExhortoPromocion)
         .join(ExhExhorto)
         .filter(ExhExhorto.folio_seguimiento == folio_seguimiento)
         .filter(ExhExhortoPromocion.folio_origen_promocion == folio_origen_promocion)
         .filter(ExhExhortoPromocion.estatus == "A")
-        .first()
     )
+    exh_exhorto_promocion = resultado.scalars().first()
 
     # Verificar que exista
     if exh_exhorto_promocion is None:
@@ -60,16 +68,31 @@ def get_exhorto_promocion(
 
 
 @exh_exhortos_promociones.post("/recibir_promocion", response_model=OneExhExhortoPromocionOut)
+@query_budget(6)
 async def recibir_exhorto_promocion_request(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     settings: Annotated[Settings, Depends(get_settings)],
     exh_exhorto_promocion_in: ExhExhortoPromocionIn,
+    idempotency_key: Annotated[str | None, Header(max_length=IDEMPOTENCY_KEY_MAX_LEN)] = None,
 ):
     """Recibir una promoción de un exhorto"""
     if current_user.permissions.get("EXH EXHORTOS PROMOCIONES", 0) < Permiso.CREAR:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
+    # Si es un reintento, entregar la respuesta guardada sin validar ni insertar de nuevo
+    idempotencia = get_idempotencia(
+        current_user.id,
+        "recibir_promocion",
+        idempotency_key,
+        exh_exhorto_promocion_in,
+        exh_exhorto_promocion_in.folioSeguimiento,
+        exh_exhorto_promocion_in.folioOrigenPromocion,
+    )
+    respuesta = await get_idempotent_response(database, idempotencia)
+    if respuesta is not None:
+        return respuesta
+
     # Preparar las zonas horarias UTC y local
     utc_tz = pytz.utc
     local_tz = pytz.timezone(settings.tz)
@@ -80,7 +103,7 @@ async def recibir_exhorto_promocion_request(
     # Consultar el exhorto
     exh_exhorto = None
     try:
-        exh_exhorto = get_exhorto_with_folio_seguimiento(database, exh_exhorto_promocion_in.folioSeguimiento)
+        exh_exhorto = await get_exhorto_with_folio_seguimiento(database, exh_exhorto_promocion_in.folioSeguimiento)
     except (MyNotExistsError, MyNotValidParamError):
         return OneExhExhortoPromocionOut(success=False, message="No se encuentra el exhorto", errors=errores, data=None)
 
@@ -96,9 +119,11 @@ async def recibir_exhorto_promocion_request(
     if exh_exhorto_promocion_in.fechaOrigen is not None:
         try:
             fecha_origen = datetime.strptime(exh_exhorto_promocion_in.fechaOrigen, "%Y-%m-%d %H:%M:%S")
+            fecha_origen = (
+                fecha_origen.replace(tzinfo=local_tz).astimezone(utc_tz).replace(tzinfo=None)
+            )  # asyncpg exige fecha sin zona
         except ValueError:
             errores.append("La fecha no tiene el formato correcto")
-        fecha_origen = fecha_origen.replace(tzinfo=local_tz).astimezone(utc_tz)
 
     # Validar observaciones
     observaciones = None
@@ -133,21 +158,25 @@ async def recibir_exhorto_promocion_request(
     if len(errores) > 0:
         return OneExhExhortoPromocionOut(success=False, message="Falló la recepción del exhorto", errors=errores, data=None)
 
-    # Insertar la promoción
-    exh_exhorto_promocion = ExhExhortoPromocion(
-        exh_exhorto_id=exh_exhorto.id,
-        folio_origen_promocion=folio_origen_promocion,
-        fojas=exh_exhorto_promocion_in.fojas,
-        fecha_origen=fecha_origen,
-        observaciones=observaciones,
-        remitente="EXTERNO",
-        estado="ENVIADO",
+    # Insertar la promoción, en la misma sentencia se obtienen su ID y su fecha de creación
+    resultado = await database.execute(
+        insert(ExhExhortoPromocion)
+        .values(
+            exh_exhorto_id=exh_exhorto.id,
+            folio_origen_promocion=folio_origen_promocion,
+            fojas=exh_exhorto_promocion_in.fojas,
+            fecha_origen=fecha_origen,
+            observaciones=observaciones,
+            remitente="EXTERNO",
+            estado="ENVIADO",
+            archivos_pendientes=len(exh_exhorto_promocion_in.archivos),
+        )
+        .returning(ExhExhortoPromocion.id, ExhExhortoPromocion.creado)
     )
-    database.add(exh_exhorto_promocion)
-    database.commit()
-    database.refresh(exh_exhorto_promocion)
+    exh_exhorto_promocion_id, exh_exhorto_promocion_creado = resultado.one()
 
-    # Insertar los promoventes
+    # Insertar los promoventes, todos en una sola sentencia
+    exh_exhortos_promociones_promoventes = []
     for promovente in exh_exhorto_promocion_in.promoventes:
         try:
             correo_electronico = safe_email(promovente.correoElectronico)
@@ -156,45 +185,54 @@ async def recibir_exhorto_promocion_request(
         telefono = safe_telefono(promovente.telefono)
         if telefono == "":
             telefono = None
-        exh_exhorto_promocion_promovente = ExhExhortoPromocionPromovente(
-            exh_exhorto_promocion_id=exh_exhorto_promocion.id,
-            nombre=safe_string(promovente.nombre, save_enie=True),
-            apellido_paterno=safe_string(promovente.apellidoPaterno, save_enie=True),
-            apellido_materno=safe_string(promovente.apellidoMaterno, save_enie=True),
-            genero=promovente.genero if promovente.genero in ExhExhortoPromocionPromovente.GENEROS else "-",
-            es_persona_moral=promovente.esPersonaMoral,
-            tipo_parte=promovente.tipoParte,
-            tipo_parte_nombre=safe_string(promovente.tipoParteNombre, save_enie=True),
-            correo_electronico=correo_electronico,
-            telefono=telefono,
+        exh_exhortos_promociones_promoventes.append(
+            {
+                "exh_exhorto_promocion_id": exh_exhorto_promocion_id,
+                "nombre": safe_string(promovente.nombre, save_enie=True),
+                "apellido_paterno": safe_string(promovente.apellidoPaterno, save_enie=True),
+                "apellido_materno": safe_string(promovente.apellidoMaterno, save_enie=True),
+                "genero": promovente.genero if promovente.genero in ExhExhortoPromocionPromovente.GENEROS else "-",
+                "es_persona_moral": promovente.esPersonaMoral,
+                "tipo_parte": promovente.tipoParte,
+                "tipo_parte_nombre": safe_string(promovente.tipoParteNombre, save_enie=True),
+                "correo_electronico": correo_electronico,
+                "telefono": telefono,
+            }
         )
-        database.add(exh_exhorto_promocion_promovente)
-
-    # Insertar los archivos
-    for archivo in exh_exhorto_promocion_in.archivos:
-        exh_exhorto_promocion_archivo = ExhExhortoPromocionArchivo(
-            exh_exhorto_promocion_id=exh_exhorto_promocion.id,
-            nombre_archivo=archivo.nombreArchivo,
-            hash_sha1=archivo.hashSha1,
-            hash_sha256=archivo.hashSha256,
-            tipo_documento=archivo.tipoDocumento,
-            estado="PENDIENTE",
-            tamano=0,
-            fecha_hora_recepcion=datetime.now(),
+    if exh_exhortos_promociones_promoventes:
+        await database.execute(insert(ExhExhortoPromocionPromovente).values(exh_exhortos_promociones_promoventes))
+
+    # Insertar los archivos, todos en una sola sentencia
+    if exh_exhorto_promocion_in.archivos:
+        fecha_hora_recepcion = datetime.now()
+        await database.execute(
+            insert(ExhExhortoPromocionArchivo).values(
+                [
+                    {
+                        "exh_exhorto_promocion_id": exh_exhorto_promocion_id,
+                        "nombre_archivo": archivo.nombreArchivo,
+                        "hash_sha1": archivo.hashSha1,
+                        "hash_sha256": archivo.hashSha256,
+                        "tipo_documento": archivo.tipoDocumento,
+                        "estado": "PENDIENTE",
+                        "tamano": 0,
+                        "fecha_hora_recepcion": fecha_hora_recepcion,
+                    }
+                    for archivo in exh_exhorto_promocion_in.archivos
+                ]
+            )
         )
-        database.add(exh_exhorto_promocion_archivo)
-
-    # Terminar la transacción
-    database.commit()
-    database.refresh(exh_exhorto_promocion)
 
     # Cambiar fecha_hora de UTC a tiempo local
-    fecha_hora = exh_exhorto_promocion.creado.replace(tzinfo=utc_tz).astimezone(local_tz)
+    fecha_hora = exh_exhorto_promocion_creado.replace(tzinfo=utc_tz).astimezone(local_tz)
 
-    # Entregar
+    # Preparar el acuse
     data = ExhExhortoPromocionOut(
-        folioSeguimiento=exh_exhorto_promocion.exh_exhorto.folio_seguimiento,
-        folioOrigenPromocion=exh_exhorto_promocion.folio_origen_promocion,
+        folioSeguimiento=exh_exhorto.folio_seguimiento,
+        folioOrigenPromocion=folio_origen_promocion,
         fechaHora=fecha_hora.strftime("%Y-%m-%d %H:%M:%S"),
     )
-    return OneExhExhortoPromocionOut(success=True, message="Promoción recibida con éxito", errors=[], data=data)
+    resultado = OneExhExhortoPromocionOut(success=True, message="Promoción recibida con éxito", errors=[], data=data)
+
+    # Terminar la transacción, la promoción, sus hijos y el acuse para los reintentos se guardan juntos o nada
+    return await save_idempotent_response(database, idempotencia, resultado)
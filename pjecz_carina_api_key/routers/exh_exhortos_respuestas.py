@@ -6,11 +6,20 @@ from datetime import datetime
 from typing import Annotated
 
 import pytz
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy import insert, select
+from sqlalchemy.orm import contains_eager
 
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
+from ..dependencies.database import AsyncSession, get_async_db
 from ..dependencies.exceptions import MyAnyError, MyNotExistsError, MyNotValidParamError
+from ..dependencies.idempotency import (
+    IDEMPOTENCY_KEY_MAX_LEN,
+    get_idempotencia,
+    get_idempotent_response,
+    save_idempotent_response,
+)
+from ..dependencies.query_detector import query_budget
 from ..dependencies.safe_string import safe_string
 from ..models.exh_exhortos import ExhExhorto
 from ..models.exh_exhortos_respuestas import ExhExhortoRespuesta
@@ -24,8 +33,8 @@ from .exh_exhortos import get_exhorto_with_exhorto_origen_id
 exh_exhortos_respuestas = APIRouter(prefix="/api/v5/exh_exhortos")
 
 
-def get_exhorto_respuesta(
-    database: Annotated[Session, Depends(get_db)],
+async def get_exhorto_respuesta(
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     exhorto_id: str,
     respuesta_origen_id: str,
 ) -> ExhExhortoRespuesta:
@@ -41,15 +50,16 @@ def get_exhorto_respuesta(
     if respuesta_origen_id == "":
         raise MyNotValidParamError("No es una 'respuesta origen id' válida")
 
-    # Consultar la promoción
-    exh_exhorto_respuesta = (
-        database.query(ExhExhortoRespuesta)
+    # Consultar la respuesta, junto con su exhorto
+    resultado = await database.execute(
+        select(ExhExhortoRespuesta)
         .join(ExhExhorto)
+        .options(contains_eager(ExhExhortoRespuesta.exh_exhorto))
         .filter(ExhExhorto.exhorto_origen_id == exhorto_id)
         .filter(ExhExhortoRespuesta.respuesta_origen_id == respuesta_origen_id)
         .filter(ExhExhortoRespuesta.estatus == "A")
-        .first()
     )
+    exh_exhorto_respuesta = resultado.scalars().first()
 
     # Verificar que exista
     if exh_exhorto_respuesta is None:
@@ -60,16 +70,31 @@ def get_exhorto_respuesta(
 
 
 @exh_exhortos_respuestas.post("/recibir_respuesta", response_model=OneExhExhortoRespuestaOut)
+@query_budget(7)
 async def recibir_exhorto_respuesta_request(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     settings: Annotated[Settings, Depends(get_settings)],
     exh_exhorto_respuesta_in: ExhExhortoRespuestaIn,
+    idempotency_key: Annotated[str | None, Header(max_length=IDEMPOTENCY_KEY_MAX_LEN)] = None,
 ):
     """Recibir una respuesta de un exhorto"""
     if current_user.permissions.get("EXH EXHORTOS RESPUESTAS", 0) < Permiso.CREAR:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
+    # Si es un reintento, entregar la respuesta guardada sin validar ni insertar de nuevo
+    idempotencia = get_idempotencia(
+        current_user.id,
+        "recibir_respuesta",
+        idempotency_key,
+        exh_exhorto_respuesta_in,
+        exh_exhorto_respuesta_in.exhortoId,
+        exh_exhorto_respuesta_in.respuestaOrigenId,
+    )
+    respuesta = await get_idempotent_response(database, idempotencia)
+    if respuesta is not None:
+        return respuesta
+
     # Preparar las zonas horarias UTC y local
     utc_tz = pytz.utc
     local_tz = pytz.timezone(settings.tz)
@@ -80,7 +105,7 @@ async def recibir_exhorto_respuesta_request(
     # Consultar el exhorto
     exh_exhorto = None
     try:
-        exh_exhorto = get_exhorto_with_exhorto_origen_id(database, exh_exhorto_respuesta_in.exhortoId)
+        exh_exhorto = await get_exhorto_with_exhorto_origen_id(database, exh_exhorto_respuesta_in.exhortoId)
     except MyAnyError as error:
         errores.append(str(error))
 
@@ -126,70 +151,81 @@ async def recibir_exhorto_respuesta_request(
     if len(errores) > 0:
         return OneExhExhortoRespuestaOut(success=False, message="Falló la recepción de la respuesta", errors=errores, data=None)
 
-    # Insertar la respuesta
-    exh_exhorto_respuesta = ExhExhortoRespuesta(
-        exh_exhorto_id=exh_exhorto.id,
-        respuesta_origen_id=respuesta_origen_id,
-        municipio_turnado_id=municipio_turnado_id,
-        area_turnado_id=area_turnado_id,
-        area_turnado_nombre=area_turnado_nombre,
-        numero_exhorto=numero_exhorto,
-        tipo_diligenciado=tipo_diligenciado,
-        observaciones=observaciones,
-        remitente="EXTERNO",
-        estado="PENDIENTE",
+    # Insertar la respuesta, en la misma sentencia se obtienen su ID y su fecha de creación
+    resultado = await database.execute(
+        insert(ExhExhortoRespuesta)
+        .values(
+            exh_exhorto_id=exh_exhorto.id,
+            respuesta_origen_id=respuesta_origen_id,
+            municipio_turnado_id=municipio_turnado_id,
+            area_turnado_id=area_turnado_id,
+            area_turnado_nombre=area_turnado_nombre,
+            numero_exhorto=numero_exhorto,
+            tipo_diligenciado=tipo_diligenciado,
+            observaciones=observaciones,
+            remitente="EXTERNO",
+            estado="PENDIENTE",
+            archivos_pendientes=len(exh_exhorto_respuesta_in.archivos),
+        )
+        .returning(ExhExhortoRespuesta.id, ExhExhortoRespuesta.creado)
     )
-    database.add(exh_exhorto_respuesta)
-    database.commit()
-    database.refresh(exh_exhorto_respuesta)
+    exh_exhorto_respuesta_id, exh_exhorto_respuesta_creado = resultado.one()
 
     # El estado del exhorto cambia a RESPONDIDO
     exh_exhorto.estado = "RESPONDIDO"
-    database.add(exh_exhorto)
-    database.commit()
-
-    # Insertar los archivos
-    for archivo in exh_exhorto_respuesta_in.archivos:
-        exh_exhorto_respuesta_archivo = ExhExhortoRespuestaArchivo(
-            exh_exhorto_respuesta_id=exh_exhorto_respuesta.id,
-            nombre_archivo=archivo.nombreArchivo,
-            hash_sha1=archivo.hashSha1,
-            hash_sha256=archivo.hashSha256,
-            tipo_documento=archivo.tipoDocumento,
-            estado="PENDIENTE",
-            tamano=0,
-            fecha_hora_recepcion=datetime.now(),
+
+    # Insertar los archivos, todos en una sola sentencia
+    if exh_exhorto_respuesta_in.archivos:
+        fecha_hora_recepcion = datetime.now()
+        await database.execute(
+            insert(ExhExhortoRespuestaArchivo).values(
+                [
+                    {
+                        "exh_exhorto_respuesta_id": exh_exhorto_respuesta_id,
+                        "nombre_archivo": archivo.nombreArchivo,
+                        "hash_sha1": archivo.hashSha1,
+                        "hash_sha256": archivo.hashSha256,
+                        "tipo_documento": archivo.tipoDocumento,
+                        "estado": "PENDIENTE",
+                        "tamano": 0,
+                        "fecha_hora_recepcion": fecha_hora_recepcion,
+                    }
+                    for archivo in exh_exhorto_respuesta_in.archivos
+                ]
+            )
         )
-        database.add(exh_exhorto_respuesta_archivo)
 
-    # Insertar los videos
-    for video in exh_exhorto_respuesta_in.videos:
+    # Insertar los videos, todos en una sola sentencia
+    exh_exhortos_respuestas_videos = []
+    for video in exh_exhorto_respuesta_in.videos or []:
         fecha = None
         try:
             if video.fecha is not None:
                 fecha = datetime.strptime(video.fecha, "%Y-%m-%d")
         except ValueError:
             fecha = None
-        exh_exhorto_video = ExhExhortoRespuestaVideo(
-            exh_exhorto_respuesta=exh_exhorto_respuesta,
-            titulo=safe_string(video.titulo, save_enie=True),
-            descripcion=safe_string(video.descripcion, save_enie=True),
-            fecha=fecha,
-            url_acceso=video.urlAcceso,
+        exh_exhortos_respuestas_videos.append(
+            {
+                "exh_exhorto_respuesta_id": exh_exhorto_respuesta_id,
+                "titulo": safe_string(video.titulo, save_enie=True),
+                "descripcion": safe_string(video.descripcion, save_enie=True),
+                "fecha": fecha,
+                "url_acceso": video.urlAcceso,
+            }
         )
-        database.add(exh_exhorto_video)
-
-    # Terminar la transacción
-    database.commit()
-    database.refresh(exh_exhorto)
+    if exh_exhortos_respuestas_videos:
+        await database.execute(insert(ExhExhortoRespuestaVideo).values(exh_exhortos_respuestas_videos))
 
     # Cambiar fecha_hora de UTC a tiempo local
-    fecha_hora = exh_exhorto_respuesta.creado.replace(tzinfo=utc_tz).astimezone(local_tz)
+    fecha_hora = exh_exhorto_respuesta_creado.replace(tzinfo=utc_tz).astimezone(local_tz)
 
-    # Entregar
+    # Preparar el acuse
     data = ExhExhortoRespuestaOut(
         exhortoId=exh_exhorto.exhorto_origen_id,
-        respuestaOrigenId=exh_exhorto_respuesta.respuesta_origen_id,
+        respuestaOrigenId=respuesta_origen_id,
         fechaHora=fecha_hora.strftime("%Y-%m-%d %H:%M:%S"),
     )
-    return OneExhExhortoRespuestaOut(success=True, message="Respuesta recibida con éxito", errors=[], data=data)
+    resultado = OneExhExhortoRespuestaOut(success=True, message="Respuesta recibida con éxito", errors=[], data=data)
+
+    # Terminar la transacción, la respuesta, sus hijos, el estado del exhorto y el acuse se guardan juntos o nada
+    return await save_idempotent_response(database, idempotencia, resultado)
@@ -2,18 +2,27 @@
 Exh Exhortos Respuestas Archivos, routers
 """
 
-import hashlib
 from datetime import datetime
 from typing import Annotated
 
 import pytz
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
 
+from ..dependencies.archivos_contadores import ArchivoRecibido, get_archivos_pendientes, update_archivos_recibidos
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
-from ..dependencies.exceptions import MyAnyError, MyNotExistsError, MyNotValidParamError
-from ..dependencies.google_cloud_storage import upload_file_to_gcs
+from ..dependencies.database import AsyncSession, get_async_db
+from ..dependencies.exceptions import (
+    MyAnyError,
+    MyFileCorruptedError,
+    MyNotExistsError,
+    MyNotValidParamError,
+    MyOutOfRangeParamError,
+)
+from ..dependencies.file_ingestion import TAMANO_MAXIMO
 from ..dependencies.pwgen import generar_identificador
+from ..dependencies.query_detector import query_budget
+from ..dependencies.upload_spool import discard_spool_job, enqueue_spool_job, receive_upload_file
+from ..models.exh_exhortos_respuestas import ExhExhortoRespuesta
 from ..models.exh_exhortos_respuestas_archivos import ExhExhortoRespuestaArchivo
 from ..models.permisos import Permiso
 from ..schemas.exh_exhortos_respuestas_archivos import (
@@ -29,9 +38,10 @@ exh_exhortos_respuestas_archivos = APIRouter(prefix="/api/v5/exh_exhortos")
 
 
 @exh_exhortos_respuestas_archivos.post("/recibir_respuesta_archivo", response_model=OneExhExhortoRespuestaArchivoOut)
+@query_budget(5)
 async def recibir_exhorto_respuesta_archivo_request(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
     settings: Annotated[Settings, Depends(get_settings)],
     archivo: UploadFile = File(...),
     exhortoId: str = Form(...),
@@ -52,7 +62,7 @@ async def recibir_exhorto_respuesta_archivo_request(
 
     # Consultar la respuesta
     try:
-        exh_exhorto_respuesta = get_exhorto_respuesta(
+        exh_exhorto_respuesta = await get_exhorto_respuesta(
             database=database,
             exhorto_id=exhortoId,
             respuesta_origen_id=respuestaOrigenId,
@@ -60,28 +70,15 @@ async def recibir_exhorto_respuesta_archivo_request(
     except (MyNotValidParamError, MyNotExistsError) as error:
         return OneExhExhortoRespuestaArchivoOut(success=False, message=str(error), errors=[str(error)], data=None)
 
-    # Consultar los archivos de la respuesta
-    exh_exhortos_respuestas_archivos_consulta = (
-        database.query(ExhExhortoRespuestaArchivo)
-        .filter_by(exh_exhorto_respuesta_id=exh_exhorto_respuesta.id)
-        .filter_by(estatus="A")
-        .order_by(ExhExhortoRespuestaArchivo.id)
-        .all()
+    # Buscar el archivo PENDIENTE a partir del nombre del archivo, con su número en la respuesta
+    pendientes = await get_archivos_pendientes(
+        database,
+        ExhExhortoRespuestaArchivo,
+        ExhExhortoRespuestaArchivo.exh_exhorto_respuesta_id,
+        exh_exhorto_respuesta.id,
+        archivo.filename,
     )
-
-    # Buscar el archivo que se pretende subir
-    total_contador = 0
-    pendientes_contador = 0
-    recibidos_contador = 0
-    exh_exhorto_respuesta_archivo = None
-    for item in exh_exhortos_respuestas_archivos_consulta:
-        total_contador += 1
-        if item.nombre_archivo == archivo.filename and item.estado == "PENDIENTE":
-            exh_exhorto_respuesta_archivo = item
-        if item.estado == "PENDIENTE":
-            pendientes_contador += 1
-        else:
-            recibidos_contador += 1
+    exh_exhorto_respuesta_archivo, numero = pendientes.get(archivo.filename, (None, 0))
 
     # Si NO se encontró el archivo, entonces entregar un error
     if exh_exhorto_respuesta_archivo is None:
@@ -92,11 +89,8 @@ async def recibir_exhorto_respuesta_archivo_request(
             data=None,
         )
 
-    # Determinar el tamaño del archivo
-    archivo_pdf_tamanio = archivo.size
-
     # Validar que el archivo no exceda el tamaño máximo permitido de 10MB
-    if archivo_pdf_tamanio > 10 * 1024 * 1024:
+    if archivo.size is not None and archivo.size > TAMANO_MAXIMO:
         return OneExhExhortoRespuestaArchivoOut(
             success=False,
             message="El archivo excede el tamaño máximo permitido",
@@ -104,35 +98,8 @@ async def recibir_exhorto_respuesta_archivo_request(
             data=None,
         )
 
-    # Cargar el archivo en memoria
-    archivo_en_memoria = archivo.file.read()
-
-    # Validar la integridad del archivo con SHA1
-    if exh_exhorto_respuesta_archivo.hash_sha1 is not None and exh_exhorto_respuesta_archivo.hash_sha1 != "":
-        hasher_sha1 = hashlib.sha1()
-        hasher_sha1.update(archivo_en_memoria)
-        if exh_exhorto_respuesta_archivo.hash_sha1 != hasher_sha1.hexdigest():
-            return OneExhExhortoRespuestaArchivoOut(
-                success=False,
-                message="El archivo está corrupto",
-                errors=["El archivo no coincide con el hash SHA1"],
-                data=None,
-            )
-
-    # Validar la integridad del archivo con SHA256
-    if exh_exhorto_respuesta_archivo.hash_sha256 is not None and exh_exhorto_respuesta_archivo.hash_sha256 != "":
-        hasher_sha256 = hashlib.sha256()
-        hasher_sha256.update(archivo_en_memoria)
-        if exh_exhorto_respuesta_archivo.hash_sha256 != hasher_sha256.hexdigest():
-            return OneExhExhortoRespuestaArchivoOut(
-                success=False,
-                message="El archivo está corrupto",
-                errors=["El archivo no coincide con el hash SHA256"],
-                data=None,
-            )
-
     # Definir el nombre del archivo a subir a Google Storage
-    archivo_pdf_nombre = f"{respuestaOrigenId}_{str(recibidos_contador + 1).zfill(4)}.pdf"
+    archivo_pdf_nombre = f"{respuestaOrigenId}_{str(numero).zfill(4)}.pdf"
 
     # Definir la ruta para blob_name con la fecha actual
     fecha_hora_recepcion = datetime.now()
@@ -141,13 +108,30 @@ async def recibir_exhorto_respuesta_archivo_request(
     day = fecha_hora_recepcion.strftime("%d")
     blob_name = f"exh_exhortos_respuestas_archivos/{year}/{month}/{day}/{archivo_pdf_nombre}"
 
-    # Almacenar el archivo en Google Cloud Storage
+    # Almacenar el archivo en Google Cloud Storage, o en el directorio de la carga diferida, validando sus hashes
     try:
-        archivo_pdf_url = upload_file_to_gcs(
+        archivo_pdf_url, archivo_pdf_tamanio, trabajo = await receive_upload_file(
+            archivo=archivo,
+            tabla=ExhExhortoRespuestaArchivo.__tablename__,
+            registro_id=exh_exhorto_respuesta_archivo.id,
             bucket_name=settings.cloud_storage_deposito,
             blob_name=blob_name,
-            content_type="application/pdf",
-            data=archivo_en_memoria,
+            hash_sha1=exh_exhorto_respuesta_archivo.hash_sha1,
+            hash_sha256=exh_exhorto_respuesta_archivo.hash_sha256,
+        )
+    except MyFileCorruptedError as error:
+        return OneExhExhortoRespuestaArchivoOut(
+            success=False,
+            message="El archivo está corrupto",
+            errors=[str(error)],
+            data=None,
+        )
+    except MyOutOfRangeParamError:
+        return OneExhExhortoRespuestaArchivoOut(
+            success=False,
+            message="El archivo excede el tamaño máximo permitido",
+            errors=["El archivo no debe exceder los 10MB"],
+            data=None,
         )
     except MyAnyError as error:
         return OneExhExhortoRespuestaArchivoOut(
@@ -157,39 +141,37 @@ async def recibir_exhorto_respuesta_archivo_request(
             data=None,
         )
 
-    # Actualizar el archivo en la base de datos
-    exh_exhorto_respuesta_archivo.estado = "RECIBIDO"
-    exh_exhorto_respuesta_archivo.fecha_hora_recepcion = fecha_hora_recepcion
-    exh_exhorto_respuesta_archivo.tamano = archivo_pdf_tamanio
-    exh_exhorto_respuesta_archivo.url = archivo_pdf_url
-    database.add(exh_exhorto_respuesta_archivo)
-    database.commit()
-    database.refresh(exh_exhorto_respuesta_archivo)
+    # Marcar el archivo como RECIBIDO y descontarlo de los pendientes de la respuesta en una sola sentencia
+    marcados, pendientes_cantidad, _ = await update_archivos_recibidos(
+        database=database,
+        modelo=ExhExhortoRespuestaArchivo,
+        modelo_padre=ExhExhortoRespuesta,
+        padre_columna=ExhExhortoRespuestaArchivo.exh_exhorto_respuesta_id,
+        padre_id=exh_exhorto_respuesta.id,
+        archivos=[ArchivoRecibido(id=exh_exhorto_respuesta_archivo.id, tamano=archivo_pdf_tamanio, url=archivo_pdf_url)],
+        fecha_hora_recepcion=fecha_hora_recepcion,
+    )
+    if not marcados:
+        await discard_spool_job(trabajo)
+        return OneExhExhortoRespuestaArchivoOut(
+            success=False,
+            message="No se encontró el archivo",
+            errors=["Al parecer el archivo ya fue recibido"],
+            data=None,
+        )
 
     # Definir los datos del archivo para la respuesta
     archivo = ExhExhortoRespuestaArchivoDataArchivo(
         nombreArchivo=exh_exhorto_respuesta_archivo.nombre_archivo,
-        tamaño=exh_exhorto_respuesta_archivo.tamano,
-    )
-
-    # Consultar la cantidad de archivos PENDIENTES de la respuesta
-    exh_exhortos_repuestas_archivos_pendientes_cantidad = (
-        database.query(ExhExhortoRespuestaArchivo)
-        .filter_by(exh_exhorto_respuesta_id=exh_exhorto_respuesta.id)
-        .filter_by(estado="PENDIENTE")
-        .filter_by(estatus="A")
-        .order_by(ExhExhortoRespuestaArchivo.id)
-        .count()
+        tamaño=archivo_pdf_tamanio,
     )
 
     # Si YA NO HAY PENDIENTES entonces ES EL ÚLTIMO ARCHIVO
     acuse = None
-    if exh_exhortos_repuestas_archivos_pendientes_cantidad == 0:
+    if pendientes_cantidad == 0:
         # Actualizar la respuesta
         exh_exhorto_respuesta.folio_respuesta_recibida = generar_identificador()
         exh_exhorto_respuesta.estado = "ENVIADO"
-        database.add(exh_exhorto_respuesta)
-        database.commit()
         # Cambiar fecha_hora_recepcion de UTC a tiempo local
         utc_tz = pytz.utc
         local_tz = pytz.timezone(settings.tz)
@@ -201,6 +183,10 @@ async def recibir_exhorto_respuesta_archivo_request(
             fechaHoraRecepcion=fecha_hora_recepcion.strftime("%Y-%m-%d %H:%M:%S"),
         )
 
+    # Guardar los cambios y formar el archivo en la carga diferida
+    await database.commit()
+    enqueue_spool_job(trabajo)
+
     # Juntar los datos para la respuesta
     data = ExhExhortoRespuestaArchivoOut(
         archivo=archivo,
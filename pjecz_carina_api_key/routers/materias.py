@@ -4,13 +4,16 @@ Materias, routers
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import select
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
 from ..dependencies.authentications import UsuarioInDB, get_current_active_user
-from ..dependencies.database import Session, get_db
+from ..dependencies.database import AsyncSession, get_async_db
 from ..dependencies.fastapi_pagination_custom_list import CustomList
+from ..dependencies.http_cache import check_not_modified, get_cached_response, get_catalogos_version, set_cached_response
+from ..dependencies.query_detector import query_budget
 from ..dependencies.safe_string import safe_clave
 from ..models.materias import Materia
 from ..models.permisos import Permiso
@@ -22,18 +25,23 @@ materias = APIRouter(prefix="/api/v5/materias")
 @materias.get("/{clave}", response_model=OneMateriaOut)
 async def detalle_materia(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    request: Request,
+    response: Response,
+    version: Annotated[tuple, Depends(get_catalogos_version)],
     clave: str,
 ):
     """Detalle de una materia a partir de su clave"""
     if current_user.permissions.get("MATERIAS", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    check_not_modified(request, response, version)
     try:
         clave = safe_clave(clave)
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No es válida la clave")
     try:
-        materia = database.query(Materia).filter_by(clave=clave).one()
+        resultado = await database.execute(select(Materia).filter_by(clave=clave))
+        materia = resultado.scalar_one()
     except (MultipleResultsFound, NoResultFound) as error:
         return OneMateriaOut(success=False, message="No existe esa materia", errors=[str(error)])
     if materia.estatus != "A":
@@ -46,11 +54,20 @@ async def detalle_materia(
 
 
 @materias.get("", response_model=CustomList[MateriaOut])
+@query_budget(1)
 async def listado_materias(
     current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)],
-    database: Annotated[Session, Depends(get_db)],
+    database: Annotated[AsyncSession, Depends(get_async_db)],
+    request: Request,
+    response: Response,
+    version: Annotated[tuple, Depends(get_catalogos_version)],
 ):
     """Listado de materias"""
     if current_user.permissions.get("MATERIAS", 0) < Permiso.VER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-    return paginate(database.query(Materia).filter_by(en_exh_exhortos=True).filter_by(estatus="A").order_by(Materia.nombre))
+    etag = check_not_modified(request, response, version)
+    respuesta = get_cached_response(request, etag)
+    if respuesta is not None:
+        return respuesta
+    consulta = select(Materia).filter_by(en_exh_exhortos=True).filter_by(estatus="A")
+    return set_cached_response(request, etag, await paginate(database, consulta.order_by(Materia.nombre, Materia.id)))
@@ -0,0 +1,28 @@
+"""
+Métricas, routers
+"""
+
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from ..dependencies.authentications import UsuarioInDB, get_current_active_user
+from ..dependencies.database import get_pool_status
+from ..dependencies.metrics import render_metrics
+from ..dependencies.upload_spool import get_spool_status
+from ..models.permisos import Permiso
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+metricas = APIRouter(prefix="/api/v5/metricas")
+
+
+@metricas.get("", response_class=PlainTextResponse)
+async def consultar_metricas(current_user: Annotated[UsuarioInDB, Depends(get_current_active_user)]):
+    """Métricas de este worker en el formato de texto de Prometheus"""
+    if current_user.permissions.get("METRICAS", 0) < Permiso.ADMINISTRAR:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    gauges = {f"db_pool_{llave}": valor for llave, valor in get_pool_status().items()}
+    gauges.update({f"upload_spool_{llave}": valor for llave, valor in get_spool_status().items()})
+    return PlainTextResponse(render_metrics(gauges), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -48,6 +48,12 @@ class OneExhExhortoOut(OneBaseOut):
     data: ExhExhortoOut | None = None
 
 
+class OneExhExhortoLoteOut(OneBaseOut):
+    """Esquema para entregar la confirmación o los errores de cada exhorto de un lote, en el mismo orden"""
+
+    data: list[OneExhExhortoOut] | None = None
+
+
 class ExhExhortoConsultaOut(BaseModel):
     """Esquema para consultar un exhorto"""
 
@@ -46,3 +46,16 @@ class OneExhExhortoArchivoOut(OneBaseOut):
     """Esquema para responder por un archivo recibido"""
 
     data: ExhExhortoArchivoOut | None = None
+
+
+class ExhExhortoArchivosOut(BaseModel):
+    """Esquema con los archivos recibidos y el acuse si ya no hay pendientes"""
+
+    archivos: list[ExhExhortoArchivoFileDataArchivo]
+    acuse: ExhExhortoArchivoFileDataAcuse | None = None
+
+
+class OneExhExhortoArchivosOut(OneBaseOut):
+    """Esquema para responder por varios archivos recibidos"""
+
+    data: ExhExhortoArchivosOut | None = None
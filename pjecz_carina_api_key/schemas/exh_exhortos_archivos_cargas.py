@@ -0,0 +1,33 @@
+"""
+Exh Exhortos Archivos Cargas, esquemas de pydantic
+"""
+
+from pydantic import BaseModel
+
+from ..dependencies.schemas_base import OneBaseOut
+
+
+class ExhExhortoArchivoCargaIn(BaseModel):
+    """Esquema para abrir una sesión de carga reanudable de un archivo"""
+
+    exhortoOrigenId: str
+    nombreArchivo: str
+    tamaño: int | None = None
+
+
+class ExhExhortoArchivoCargaOut(BaseModel):
+    """Esquema para entregar el estado de una sesión de carga"""
+
+    sesionId: str
+    exhortoOrigenId: str
+    nombreArchivo: str
+    tamaño: int | None = None
+    desplazamiento: int
+    tamañoParteMaximo: int
+    estado: str
+
+
+class OneExhExhortoArchivoCargaOut(OneBaseOut):
+    """Esquema para entregar una sesión de carga"""
+
+    data: ExhExhortoArchivoCargaOut | None = None
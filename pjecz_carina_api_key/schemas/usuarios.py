@@ -35,6 +35,7 @@ class OneUsuarioOut(OneBaseOut):
 class UsuarioInDB(UsuarioOut):
     """Usuario en base de datos"""
 
+    id: int
     username: str
     permissions: dict
     hashed_password: str
@@ -3,8 +3,11 @@ Settings
 
 Para que la configuración no sea estática en el código,
 se utiliza la librería pydantic para cargar la configuración desde
-Google Secret Manager como primera opción, luego de un archivo .env
-que se usa en local y por último de variables de entorno.
+variables de entorno como primera opción, luego de un archivo .env
+que se usa en local y por último de Google Secret Manager.
+
+Los secretos se consultan una sola vez por proceso, todos al mismo
+tiempo con un solo cliente, y solo los que no son variables de entorno.
 
 Para desarrollo debe crear un archivo .env en la raíz del proyecto
 con las siguientes variables:
@@ -40,57 +43,175 @@ Y en el archivo app.yaml agregue las siguientes variables de entorno
 """
 
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from typing import Any
 
-from google.cloud import secretmanager
-from pydantic_settings import BaseSettings
+from pydantic.fields import FieldInfo
+from pydantic_settings import BaseSettings, PydanticBaseSettingsSource
 
 PROJECT_ID = os.getenv("PROJECT_ID", "")  # Por defecto está vacío, esto significa estamos en modo local
 SERVICE_PREFIX = os.getenv("SERVICE_PREFIX", "pjecz_carina_api_key")
 
+# Variables que se guardan como secretos en Google Cloud Secret Manager
+SECRETS = (
+    "cloud_storage_deposito",
+    "db_host",
+    "db_port",
+    "db_name",
+    "db_pass",
+    "db_user",
+    "estado_clave",
+    "origins",
+    "salt",
+)
+
+# Segundos que tomó cargar los secretos, para medir el arranque
+secrets_load_seconds = 0.0
+
 
-def get_secret(secret_id: str) -> str:
-    """Get secret from Google Cloud Secret Manager"""
+@lru_cache()
+def load_secrets(secret_ids: tuple[str, ...]) -> dict[str, str]:
+    """
+    Load secrets from Google Cloud Secret Manager, only once per process
+
+    One client is shared and the secrets are requested concurrently,
+    the client is imported here because it is slow to import and it is not needed in local mode
+    """
+    global secrets_load_seconds
+    inicio = time.perf_counter()
 
-    # If not in google cloud, return environment variable
-    if PROJECT_ID == "":
-        return os.getenv(secret_id.upper(), "")
+    from google.cloud import secretmanager
 
     # Create the secret manager client
     client = secretmanager.SecretManagerServiceClient()
 
-    # Build the resource name of the secret version
-    secret = f"{SERVICE_PREFIX}_{secret_id}"
-    name = client.secret_version_path(PROJECT_ID, secret, "latest")
+    def access_secret(secret_id: str) -> str:
+        """Access the latest version of a secret and return the decoded payload"""
+        name = client.secret_version_path(PROJECT_ID, f"{SERVICE_PREFIX}_{secret_id}", "latest")
+        response = client.access_secret_version(name=name)
+        return response.payload.data.decode("UTF-8")
+
+    # Access the secret versions concurrently
+    with ThreadPoolExecutor(max_workers=len(secret_ids)) as executor:
+        secrets = dict(zip(secret_ids, executor.map(access_secret, secret_ids)))
 
-    # Access the secret version
-    response = client.access_secret_version(name=name)
+    secrets_load_seconds = time.perf_counter() - inicio
+    return secrets
 
-    # Return the decoded payload
-    return response.payload.data.decode("UTF-8")
+
+class GoogleSecretManagerSettingsSource(PydanticBaseSettingsSource):
+    """Settings source for the secrets in Google Cloud Secret Manager"""
+
+    def get_field_value(self, field: FieldInfo, field_name: str) -> tuple[Any, str, bool]:
+        """Not used, the values are returned all at once by __call__"""
+        return None, field_name, False
+
+    def __call__(self) -> dict[str, Any]:
+        """Return the secrets that are not defined as environment variables"""
+
+        # If not in google cloud, the environment variables are used
+        if PROJECT_ID == "":
+            return {}
+
+        # Request only the missing secrets
+        secret_ids = tuple(secret_id for secret_id in SECRETS if os.getenv(secret_id.upper()) is None)
+        if len(secret_ids) == 0:
+            return {}
+        return load_secrets(secret_ids)
 
 
 class Settings(BaseSettings):
     """Settings"""
 
-    cloud_storage_deposito: str = get_secret("cloud_storage_deposito")
-    db_host: str = get_secret("db_host")
-    db_port: int = get_secret("db_port")
-    db_name: str = get_secret("db_name")
-    db_pass: str = get_secret("db_pass")
-    db_user: str = get_secret("db_user")
-    estado_clave: str = get_secret("estado_clave")
-    origins: str = get_secret("origins")
-    salt: str = get_secret("salt")
+    cloud_storage_deposito: str = ""
+    db_host: str = ""
+    db_port: int = 5432
+    db_name: str = ""
+    db_pass: str = ""
+    db_user: str = ""
+    estado_clave: str = ""
+    origins: str = ""
+    salt: str = ""
     tz: str = "America/Mexico_City"
 
-    class Config:
-        """Load configuration"""
-
-        @classmethod
-        def customise_sources(cls, init_settings, env_settings, file_secret_settings):
-            """Customise sources, first environment variables, then .env file, then google cloud secret manager"""
-            return env_settings, file_secret_settings, init_settings
+    # Pool de conexiones a la base de datos, un pool por cada worker
+    db_pool_size: int = 5
+    db_max_overflow: int = 5
+    db_pool_recycle: int = 1800  # Segundos para reciclar una conexión
+    db_pool_pre_ping: bool = True
+    db_pool_timeout: int = 30  # Segundos de espera por una conexión libre
+
+    # Caché de api_keys validadas, con cero segundos se desactiva
+    api_key_cache_ttl: int = 60  # Segundos
+    api_key_cache_max_size: int = 1024  # Cantidad de api_keys
+
+    # Caché de permisos por usuario, con cero segundos se desactiva
+    permisos_cache_ttl: int = 60  # Segundos
+    permisos_cache_max_size: int = 1024  # Cantidad de usuarios
+
+    # Hilos para las operaciones con Google Cloud Storage, también es el tamaño del pool de conexiones HTTP
+    storage_max_workers: int = 8
+
+    # Catálogos en memoria, segundos entre revisiones de su versión
+    catalogos_ttl: int = 300
+
+    # Caché de respuestas ya serializadas de los catálogos, con cero se desactiva
+    respuestas_cache_max_size: int = 256  # Cantidad de respuestas
+    respuestas_cache_gzip_min_size: int = 1024  # Bytes desde los que también se guarda comprimida
+
+    # Caché de las consultas de exhortos por folio de seguimiento, con cero segundos se desactiva
+    exh_exhortos_consultas_cache_ttl: int = 15  # Segundos
+    exh_exhortos_consultas_cache_max_size: int = 1024  # Cantidad de exhortos
+
+    # Caché de las respuestas de las recepciones para los reintentos, con cero segundos se desactiva
+    idempotencias_cache_ttl: int = 600  # Segundos
+    idempotencias_cache_max_size: int = 1024  # Cantidad de respuestas
+
+    # Recepción de exhortos en lote
+    exh_exhortos_lote_max_size: int = 100  # Cantidad de exhortos por lote
+
+    # Archivos que se suben al mismo tiempo en la recepción de varios archivos
+    exh_exhortos_archivos_paralelos: int = 4
+
+    # Carga diferida de los archivos recibidos a Google Cloud Storage, con el directorio vacío se desactiva
+    archivos_spool_dir: str = ""  # Directorio en un disco persistente o compartido
+    archivos_spool_workers: int = 2  # Cargas al mismo tiempo por cada worker
+    archivos_spool_espera: float = 2.0  # Segundos de espera del primer reintento, se duplica en cada uno
+    archivos_spool_espera_maxima: float = 300.0  # Segundos de espera máxima entre reintentos
+    archivos_spool_revision: int = 60  # Segundos entre revisiones del directorio para recuperar trabajos
+    archivos_spool_gracia: int = 600  # Segundos antes de recuperar un trabajo, más que el tiempo máximo de una petición
+
+    # Cargas reanudables de archivos
+    archivo_carga_tamano_maximo: int = 100 * 1024 * 1024  # Bytes del archivo completo
+    archivo_carga_parte_tamano_maximo: int = 8 * 1024 * 1024  # Bytes de cada parte
+    archivo_carga_ttl: int = 24 * 60 * 60  # Segundos que se guardan los hashes parciales en memoria
+    archivo_carga_vigencia: int = 24 * 60 * 60  # Segundos que una sesión puede seguir ABIERTA desde que se abrió
+    archivo_carga_vencidas_limite: int = 10  # Sesiones vencidas que se cancelan al abrir otra
+
+    # Detector de consultas N+1 y presupuestos por ruta, sólo para desarrollo y pruebas
+    consultas_detector: bool = False
+    consultas_detector_repetidas: int = 3  # Veces que se repite una sentencia para reportarla
+    consultas_detector_raise: bool = False  # Elevar MyQueryBudgetError en lugar de sólo escribir en el log
+
+    @classmethod
+    def settings_customise_sources(
+        cls,
+        settings_cls: type[BaseSettings],
+        init_settings: PydanticBaseSettingsSource,
+        env_settings: PydanticBaseSettingsSource,
+        dotenv_settings: PydanticBaseSettingsSource,
+        file_secret_settings: PydanticBaseSettingsSource,
+    ) -> tuple[PydanticBaseSettingsSource, ...]:
+        """Customise sources, first environment variables, then .env file, then google cloud secret manager"""
+        return (
+            init_settings,
+            env_settings,
+            dotenv_settings,
+            GoogleSecretManagerSettingsSource(settings_cls),
+            file_secret_settings,
+        )
 
 
 @lru_cache()
@@ -152,6 +152,36 @@ class TestsConsultarEstados(unittest.TestCase):
         self.assertEqual(data["clave"], "19")
         self.assertEqual(data["nombre"], "NUEVO LEON")
 
+    def test_get_estados_if_none_match(self):
+        """GET method for estados with If-None-Match"""
+
+        # Consultar los estados para obtener el ETag
+        try:
+            response = requests.get(
+                url=f"{config['api_base_url']}/estados",
+                headers={"X-Api-Key": config["api_key"]},
+                timeout=config["timeout"],
+            )
+        except requests.exceptions.ConnectionError as error:
+            self.fail(error)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual("ETag" in response.headers, True)
+        self.assertEqual("Cache-Control" in response.headers, True)
+        etag = response.headers["ETag"]
+
+        # Consultar de nuevo con If-None-Match, debe responder 304 sin contenido
+        try:
+            response = requests.get(
+                url=f"{config['api_base_url']}/estados",
+                headers={"X-Api-Key": config["api_key"], "If-None-Match": etag},
+                timeout=config["timeout"],
+            )
+        except requests.exceptions.ConnectionError as error:
+            self.fail(error)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
 
 if __name__ == "__main__":
     unittest.main()
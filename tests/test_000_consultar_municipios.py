@@ -44,6 +44,43 @@ class TestsConsultarMunicipios(unittest.TestCase):
             self.assertEqual("clave" in item, True)
             self.assertEqual("nombre" in item, True)
 
+    def test_get_municipios_estado_clave_with_cursor(self):
+        """GET method for municipios for estado with clave walking the pages with the cursor"""
+
+        # Consultar todos los municipios en una sola página
+        try:
+            response = requests.get(
+                url=f"{config['api_base_url']}/municipios/{config['estado_clave']}",
+                headers={"X-Api-Key": config["api_key"]},
+                timeout=config["timeout"],
+            )
+        except requests.exceptions.ConnectionError as error:
+            self.fail(error)
+        self.assertEqual(response.status_code, 200)
+        municipios = response.json()["data"]
+
+        # Consultar los municipios de 10 en 10, el cursor vacío es la primera página
+        recibidos = []
+        cursor = ""
+        while cursor is not None:
+            try:
+                response = requests.get(
+                    url=f"{config['api_base_url']}/municipios/{config['estado_clave']}",
+                    headers={"X-Api-Key": config["api_key"]},
+                    params={"size": 10, "cursor": cursor},
+                    timeout=config["timeout"],
+                )
+            except requests.exceptions.ConnectionError as error:
+                self.fail(error)
+            self.assertEqual(response.status_code, 200)
+            contenido = response.json()
+            self.assertEqual("next_page" in contenido, True)
+            recibidos.extend(contenido["data"])
+            cursor = contenido["next_page"]
+
+        # Validar que se recibieron los mismos municipios en el mismo orden
+        self.assertEqual(recibidos, municipios)
+
     def test_get_estado_clave_05_municipio_clave_30(self):
         """GET method for estado with clave 05 and municipio with clave 30"""
 
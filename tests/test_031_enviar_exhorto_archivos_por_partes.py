@@ -0,0 +1,125 @@
+"""
+Unit test - Enviar los Archivos del Exhorto por partes, con la carga reanudable
+"""
+
+import unittest
+from pathlib import Path
+
+import requests
+
+from tests import config
+from tests.database import TestExhExhorto, get_database_session
+
+TAMANO_PARTE = 256 * 1024  # Partes pequeñas para que cada archivo se envíe en varias
+
+
+class TestsEnviarExhortosArchivosPorPartes(unittest.TestCase):
+    """Tests Enviar Exhorto Archivos por partes"""
+
+    def test_post_exhorto_archivos_por_partes(self):
+        """Probar abrir una sesión, enviar las partes, consultar el desplazamiento y finalizar"""
+
+        # Cargar la sesión de la base de datos para recuperar los datos de la prueba anterior
+        session = get_database_session()
+
+        # Consultar el último exhorto
+        test_exh_exhorto = (
+            session.query(TestExhExhorto).filter_by(estado="PENDIENTE").order_by(TestExhExhorto.id.desc()).first()
+        )
+        if test_exh_exhorto is None:
+            self.fail("No se encontró un exhorto PENDIENTE en sqlite")
+
+        # Bucle para mandar los archivos por partes
+        url = f"{config['api_base_url']}/exh_exhortos/recibir_archivo/sesiones"
+        headers = {"X-Api-Key": config["api_key"]}
+        data_acuse = None
+        for test_exh_exhorto_archivo in test_exh_exhorto.test_exh_exhortos_archivos:
+            # Leer el archivo de prueba
+            archivo_nombre = test_exh_exhorto_archivo.nombre_archivo
+            archivo_ruta = Path(f"tests/{archivo_nombre}")
+            if not archivo_ruta.is_file():
+                self.fail(f"No se encontró el archivo {archivo_nombre}")
+            contenido_archivo = archivo_ruta.read_bytes()
+
+            # Abrir la sesión de carga
+            try:
+                respuesta = requests.post(
+                    url=url,
+                    headers=headers,
+                    timeout=config["timeout"],
+                    json={
+                        "exhortoOrigenId": test_exh_exhorto.exhorto_origen_id,
+                        "nombreArchivo": archivo_nombre,
+                        "tamaño": len(contenido_archivo),
+                    },
+                )
+            except requests.exceptions.ConnectionError as error:
+                self.fail(error)
+            self.assertEqual(respuesta.status_code, 200)
+            contenido = respuesta.json()
+            if contenido["success"] is False:
+                print(f"Errors: {str(contenido['errors'])}")
+                continue
+            sesion_id = contenido["data"]["sesionId"]
+            self.assertEqual(contenido["data"]["desplazamiento"], 0)
+            tamano_parte = min(TAMANO_PARTE, contenido["data"]["tamañoParteMaximo"])
+
+            # Mandar las partes, cada una comienza en el desplazamiento que entregó la anterior
+            desplazamiento = 0
+            while desplazamiento < len(contenido_archivo):
+                respuesta = requests.put(
+                    url=f"{url}/{sesion_id}",
+                    headers=headers,
+                    timeout=config["timeout"],
+                    params={"desplazamiento": desplazamiento},
+                    data=contenido_archivo[desplazamiento : desplazamiento + tamano_parte],
+                )
+                self.assertEqual(respuesta.status_code, 200)
+                contenido = respuesta.json()
+                self.assertEqual(contenido["success"], True)
+                self.assertGreater(contenido["data"]["desplazamiento"], desplazamiento)
+                desplazamiento = contenido["data"]["desplazamiento"]
+
+            # Una parte con un desplazamiento que no es el confirmado se rechaza
+            respuesta = requests.put(
+                url=f"{url}/{sesion_id}",
+                headers=headers,
+                timeout=config["timeout"],
+                params={"desplazamiento": 0},
+                data=b"%PDF",
+            )
+            self.assertEqual(respuesta.json()["success"], False)
+
+            # Consultar la sesión, el desplazamiento es el tamaño del archivo
+            respuesta = requests.get(url=f"{url}/{sesion_id}", headers=headers, timeout=config["timeout"])
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(respuesta.json()["data"]["desplazamiento"], len(contenido_archivo))
+
+            # Finalizar
+            respuesta = requests.post(url=f"{url}/{sesion_id}/finalizar", headers=headers, timeout=config["timeout"])
+            self.assertEqual(respuesta.status_code, 200)
+            contenido = respuesta.json()
+            self.assertEqual(contenido["success"], True)
+            self.assertEqual(contenido["data"]["archivo"]["nombreArchivo"], archivo_nombre)
+            self.assertEqual(contenido["data"]["archivo"]["tamaño"], len(contenido_archivo))
+            data_acuse = contenido["data"]["acuse"]
+
+            # Actualizar el estado del archivo a RECIBIDO
+            test_exh_exhorto_archivo.estado = "RECIBIDO"
+
+        # Validar el último acuse
+        self.assertEqual(type(data_acuse), dict)
+        self.assertEqual(data_acuse["exhortoOrigenId"], test_exh_exhorto.exhorto_origen_id)
+        self.assertNotEqual(data_acuse["folioSeguimiento"], "")
+
+        # Guardar el folio de seguimiento y cambiar estado en sqlite
+        test_exh_exhorto.folio_seguimiento = data_acuse["folioSeguimiento"]
+        test_exh_exhorto.estado = "RECIBIDO"
+        session.commit()
+
+        # Cerrar la sesión sqlite
+        session.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Unit test - TTL Cache
+"""
+
+import time
+import unittest
+
+from pjecz_carina_api_key.dependencies.ttl_cache import TTLCache
+
+
+class TestsTTLCache(unittest.TestCase):
+    """Tests TTL Cache"""
+
+    def test_expira(self):
+        """Un valor deja de entregarse al vencer su tiempo de vida"""
+        cache = TTLCache(ttl=0.05, max_size=10)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_desaloja_el_menos_usado(self):
+        """Al llenarse se desecha el valor usado hace más tiempo"""
+        cache = TTLCache(ttl=60, max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_invalidar(self):
+        """Quitar valores por clave y por condición"""
+        cache = TTLCache(ttl=60, max_size=10)
+        for numero in range(5):
+            cache.set(numero, numero * 10)
+        self.assertEqual(cache.pop(0), 0)
+        self.assertEqual(cache.pop_where(lambda _, valor: valor >= 30), 2)
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_desactivado(self):
+        """Con tiempo de vida cero no se guarda nada"""
+        cache = TTLCache(ttl=0, max_size=10)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Unit test - HTTP Cache
+"""
+
+import gzip
+import unittest
+
+from starlette.requests import Request
+
+from pjecz_carina_api_key.dependencies.http_cache import accepts_gzip, build_cached_response, etag_matches, get_etag
+
+
+def crear_request(query: str = "", headers: dict[str, str] | None = None) -> Request:
+    """Crear un Request de Starlette para las pruebas"""
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/v5/estados",
+            "query_string": query.encode(),
+            "headers": [(llave.lower().encode(), valor.encode()) for llave, valor in (headers or {}).items()],
+        }
+    )
+
+
+class TestsHTTPCache(unittest.TestCase):
+    """Tests HTTP Cache"""
+
+    def test_etag(self):
+        """El ETag cambia con la versión y con los parámetros"""
+        etag = get_etag((1, 2), crear_request())
+        self.assertEqual(etag, get_etag((1, 2), crear_request()))
+        self.assertNotEqual(etag, get_etag((1, 3), crear_request()))
+        self.assertNotEqual(etag, get_etag((1, 2), crear_request("size=10")))
+
+    def test_etag_matches(self):
+        """If-None-Match con uno o varios ETag, débiles o asterisco"""
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"x", W/"abc"', '"abc"'))
+        self.assertTrue(etag_matches("*", '"abc"'))
+        self.assertFalse(etag_matches('"x"', '"abc"'))
+        self.assertFalse(etag_matches(None, '"abc"'))
+
+    def test_accepts_gzip(self):
+        """Accept-Encoding con gzip, sin gzip y con gzip rechazado"""
+        self.assertTrue(accepts_gzip(crear_request(headers={"Accept-Encoding": "gzip, deflate, br"})))
+        self.assertFalse(accepts_gzip(crear_request(headers={"Accept-Encoding": "identity"})))
+        self.assertFalse(accepts_gzip(crear_request(headers={"Accept-Encoding": "gzip;q=0, br"})))
+
+    def test_build_cached_response(self):
+        """Se entrega la copia comprimida solo si el cliente acepta gzip"""
+        contenido = b'{"success":true}'
+        comprimido = gzip.compress(contenido)
+        respuesta = build_cached_response(crear_request(headers={"Accept-Encoding": "gzip"}), '"abc"', contenido, comprimido)
+        self.assertEqual(respuesta.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(respuesta.body), contenido)
+        respuesta = build_cached_response(crear_request(), '"abc"', contenido, comprimido)
+        self.assertNotIn("Content-Encoding", respuesta.headers)
+        self.assertEqual(respuesta.body, contenido)
+        self.assertEqual(respuesta.headers["ETag"], '"abc"')
+
+
+if __name__ == "__main__":
+    unittest.main()
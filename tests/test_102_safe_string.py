@@ -0,0 +1,138 @@
+"""
+Unit test - Safe String
+
+Se compara contra la implementación anterior, con textos generados por hypothesis
+"""
+
+import re
+import unittest
+
+from hypothesis import given
+from hypothesis import strategies as st
+from unidecode import unidecode
+
+from pjecz_carina_api_key.dependencies.safe_string import (
+    safe_clave,
+    safe_curp,
+    safe_rfc,
+    safe_string,
+    safe_telefono,
+    transliterate,
+    transliterate_save_enie,
+)
+
+# Letras, acentos, ñ, espacios de distintos tipos, signos y caracteres de otros alfabetos
+CARACTERES = "aAzZ09 .()/-_,;:ñÑáéíóúüÁÉÍÓÚÜçÇßøØłŁæÆœŒĳﬁ\t\n\r  ​　ЖжΩ中文한글ا€™°ªº\U0001f600"
+textos = st.text(alphabet=st.sampled_from(CARACTERES), max_size=80) | st.text(max_size=40)
+
+
+def safe_string_anterior(input_str, max_len=250, do_unidecode=True, save_enie=False, to_uppercase=True) -> str:
+    """Implementación anterior de safe_string"""
+    if not isinstance(input_str, str):
+        return ""
+    if do_unidecode:
+        if save_enie:
+            new_string = ""
+            for char in input_str:
+                if char == "ñ":
+                    new_string += "ñ"
+                elif char == "Ñ":
+                    new_string += "Ñ"
+                else:
+                    new_string += unidecode(char)
+        else:
+            new_string = re.sub(r"[^a-zA-Z0-9.()/-]+", " ", unidecode(input_str))
+    else:
+        if save_enie is False:
+            new_string = re.sub(r"[^a-záéíóúüA-ZÁÉÍÓÚÜ0-9.()/-]+", " ", input_str)
+        else:
+            new_string = re.sub(r"[^a-záéíóúüñA-ZÁÉÍÓÚÜÑ0-9.()/-]+", " ", input_str)
+    final = re.sub(r"\s+", " ", new_string).strip()
+    if to_uppercase:
+        final = final.upper()
+    if max_len == 0:
+        return final
+    return (final[:max_len] + "...") if len(final) > max_len else final
+
+
+def safe_clave_anterior(input_str, max_len=16, only_digits=False, separator="-") -> str:
+    """Implementación anterior de safe_clave"""
+    stripped = input_str.strip()
+    if stripped == "":
+        return ""
+    if only_digits:
+        clean_string = re.sub(r"[^0-9]+", separator, stripped)
+    else:
+        clean_string = re.sub(r"[^a-zA-Z0-9]+", separator, unidecode(stripped))
+    final = re.sub(r"\s+", "", clean_string).upper()
+    return final[:max_len]
+
+
+def safe_alfanumerico_anterior(input_str) -> str:
+    """Implementación anterior de la limpieza de safe_curp y safe_rfc"""
+    clean_string = re.sub(r"[^a-zA-Z0-9]+", " ", unidecode(input_str.strip()))
+    return re.sub(r"\s+", "", clean_string).upper()
+
+
+def safe_telefono_anterior(input_str) -> str:
+    """Implementación anterior de safe_telefono"""
+    if input_str.strip() == "":
+        return ""
+    only_digits = re.sub(r"[^0-9]", "", input_str.strip())
+    return only_digits if len(only_digits) == 10 else ""
+
+
+class TestsSafeString(unittest.TestCase):
+    """Tests Safe String"""
+
+    def test_transliterate_latin(self):
+        """La tabla de los caracteres latinos da lo mismo que unidecode"""
+        for codigo in range(0x0300):
+            caracter = chr(codigo)
+            self.assertEqual(transliterate(caracter), unidecode(caracter))
+            if caracter not in "ñÑ":
+                self.assertEqual(transliterate_save_enie(caracter), unidecode(caracter))
+
+    def test_nombres(self):
+        """Nombres con ñ y acentos"""
+        self.assertEqual(safe_string("  María  José Muñoz ", save_enie=True), "MARIA JOSE MUÑOZ")
+        self.assertEqual(safe_string("Núñez, Ibáñez"), "NUNEZ IBANEZ")
+        self.assertEqual(safe_string("Peña 中文", do_unidecode=False, save_enie=True), "PEÑA")
+
+    @given(
+        textos,
+        st.sampled_from([0, 5, 250]),
+        st.booleans(),
+        st.booleans(),
+        st.booleans(),
+    )
+    def test_safe_string(self, texto, max_len, do_unidecode, save_enie, to_uppercase):
+        """safe_string da lo mismo que la implementación anterior"""
+        self.assertEqual(
+            safe_string(texto, max_len, do_unidecode, save_enie, to_uppercase),
+            safe_string_anterior(texto, max_len, do_unidecode, save_enie, to_uppercase),
+        )
+
+    @given(textos, st.booleans(), st.sampled_from(["-", "", " ", "_"]))
+    def test_safe_clave(self, texto, only_digits, separator):
+        """safe_clave da lo mismo que la implementación anterior"""
+        self.assertEqual(
+            safe_clave(texto, only_digits=only_digits, separator=separator),
+            safe_clave_anterior(texto, only_digits=only_digits, separator=separator),
+        )
+
+    @given(textos)
+    def test_safe_curp_rfc(self, texto):
+        """safe_curp y safe_rfc dan lo mismo que la implementación anterior"""
+        anterior = safe_alfanumerico_anterior(texto)
+        self.assertEqual(safe_curp(texto, search_fragment=True), anterior)
+        self.assertEqual(safe_rfc(texto, search_fragment=True), anterior)
+
+    @given(st.text(alphabet=st.sampled_from("0123456789 ()-+\t٣"), max_size=20))
+    def test_safe_telefono(self, texto):
+        """safe_telefono da lo mismo que la implementación anterior"""
+        self.assertEqual(safe_telefono(texto), safe_telefono_anterior(texto))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Unit test - Metrics
+"""
+
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from pjecz_carina_api_key.dependencies.metrics import (
+    REGISTRO,
+    Counter,
+    Histogram,
+    MetricsMiddleware,
+    http_requests_total,
+    observe_storage,
+    render_metrics,
+    storage_operation_duration_seconds,
+)
+
+
+class TestsMetrics(unittest.TestCase):
+    """Tests Metrics"""
+
+    def tearDown(self):
+        """Quitar del registro las métricas creadas en las pruebas"""
+        REGISTRO[:] = [metrica for metrica in REGISTRO if not metrica.nombre.startswith("prueba_")]
+
+    def test_counter(self):
+        """El contador suma por etiquetas y escapa sus valores"""
+        contador = Counter("prueba_total", "Prueba", ("ruta",))
+        contador.inc(("/a",))
+        contador.inc(("/a",), 2)
+        contador.inc(('/"b"',))
+        lineas = list(contador.collect())
+        self.assertEqual(lineas[1], "# TYPE prueba_total counter")
+        self.assertTrue(lineas[2].startswith('prueba_total{ruta="/a",worker="'))
+        self.assertTrue(lineas[2].endswith("} 3"))
+        self.assertIn('ruta="/\\"b\\""', lineas[3])
+
+    def test_histogram(self):
+        """Las cubetas del histograma son acumulativas"""
+        histograma = Histogram("prueba_segundos", "Prueba", (0.1, 1.0))
+        for valor in (0.05, 0.5, 0.5, 5.0):
+            histograma.observe(valor)
+        lineas = [linea.split("{")[0] + " " + linea.split(" ")[-1] for linea in histograma.collect() if linea[0] != "#"]
+        self.assertEqual(
+            lineas,
+            [
+                "prueba_segundos_bucket 1",
+                "prueba_segundos_bucket 3",
+                "prueba_segundos_bucket 4",
+                "prueba_segundos_sum 6.05",
+                "prueba_segundos_count 4",
+            ],
+        )
+        self.assertIn('le="+Inf"', list(histograma.collect())[4])
+
+    def test_observe_storage(self):
+        """Se miden las funciones y los generadores, con su resultado"""
+
+        @observe_storage
+        def prueba_funcion():
+            raise ValueError("Falla")
+
+        @observe_storage
+        def prueba_generador():
+            yield from (1, 2)
+
+        with self.assertRaises(ValueError):
+            prueba_funcion()
+        self.assertEqual(list(prueba_generador()), [1, 2])
+        texto = "\n".join(storage_operation_duration_seconds.collect())
+        self.assertIn('_count{operation="prueba_funcion",result="error"', texto)
+        self.assertIn('_count{operation="prueba_generador",result="ok"', texto)
+
+    def test_middleware(self):
+        """El middleware usa la plantilla de la ruta y el código de estado"""
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/prueba/{clave}")
+        async def prueba(clave: str):
+            return {"clave": clave}
+
+        with TestClient(app) as client:
+            client.get("/prueba/uno")
+            client.get("/prueba/dos")
+            client.get("/no/existe")
+        texto = "\n".join(http_requests_total.collect())
+        self.assertRegex(texto, r'route="/prueba/\{clave\}",method="GET",status="200",worker="\d+"\} 2')
+        self.assertRegex(texto, r'route="sin ruta",method="GET",status="404",worker="\d+"\} [1-9]')
+        self.assertRegex(render_metrics({"prueba_gauge": 1}), r'# TYPE prueba_gauge gauge\nprueba_gauge\{worker="\d+"\} 1\n$')
+
+
+if __name__ == "__main__":
+    unittest.main()
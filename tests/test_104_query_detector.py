@@ -0,0 +1,104 @@
+"""
+Unit test - Query Detector
+
+Usa una base de datos SQLite en memoria con sus propios modelos
+"""
+
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import ForeignKey, create_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column, relationship
+from sqlalchemy.pool import StaticPool
+
+from pjecz_carina_api_key.dependencies.exceptions import MyQueryBudgetError
+from pjecz_carina_api_key.dependencies.query_detector import QueryDetectorMiddleware, query_budget, register_query_detector
+from pjecz_carina_api_key.settings import get_settings
+
+
+class Base(DeclarativeBase):
+    """Base de los modelos de prueba"""
+
+
+class Padre(Base):
+    """Padre"""
+
+    __tablename__ = "padres"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    nombre: Mapped[str]
+
+
+class Hijo(Base):
+    """Hijo, su padre se carga de forma perezosa"""
+
+    __tablename__ = "hijos"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    padre_id: Mapped[int] = mapped_column(ForeignKey("padres.id"))
+    padre: Mapped[Padre] = relationship()
+
+
+class TestsQueryDetector(unittest.TestCase):
+    """Tests Query Detector"""
+
+    def setUp(self):
+        """Crear la base de datos y la app con el detector activo y que eleve la excepción"""
+        settings = get_settings()
+        self.anteriores = (settings.consultas_detector, settings.consultas_detector_raise)
+        settings.consultas_detector = True
+        settings.consultas_detector_raise = True
+
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(engine)
+        register_query_detector(engine)
+        with Session(engine) as database:
+            padres = [Padre(nombre=f"PADRE {numero}") for numero in range(5)]
+            database.add_all(padres + [Hijo(padre=padre) for padre in padres])
+            database.commit()
+
+        self.app = FastAPI()
+        self.app.add_middleware(QueryDetectorMiddleware)
+
+        @self.app.get("/hijos")
+        async def listado_hijos():
+            with Session(engine) as database:
+                return [hijo.padre.nombre for hijo in database.query(Hijo).order_by(Hijo.id)]
+
+        @self.app.get("/padres")
+        @query_budget(0)
+        async def listado_padres():
+            with Session(engine) as database:
+                return [padre.nombre for padre in database.query(Padre)]
+
+        @self.app.get("/padre")
+        @query_budget(1)
+        async def detalle_padre():
+            with Session(engine) as database:
+                return database.get(Padre, 1).nombre
+
+    def tearDown(self):
+        """Restaurar la configuración"""
+        settings = get_settings()
+        settings.consultas_detector, settings.consultas_detector_raise = self.anteriores
+
+    def test_n_plus_one(self):
+        """Las cargas perezosas repetidas se reportan con la relación y el lugar del código"""
+        with TestClient(self.app) as client:
+            with self.assertRaises(MyQueryBudgetError) as contexto:
+                client.get("/hijos")
+        mensaje = str(contexto.exception)
+        self.assertIn("se repitió 5 veces por la relación Hijo.padre", mensaje)
+        self.assertIn("tests/test_104_query_detector.py", mensaje)
+        self.assertIn("listado_hijos", mensaje)
+
+    def test_query_budget(self):
+        """Las rutas que exceden su presupuesto se reportan, las que no responden normal"""
+        with TestClient(self.app) as client:
+            with self.assertRaises(MyQueryBudgetError) as contexto:
+                client.get("/padres")
+            self.assertIn("ejecutó 1 sentencias SQL y su presupuesto es 0", str(contexto.exception))
+            self.assertEqual(client.get("/padre").json(), "PADRE 0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Unit test - Idempotency
+"""
+
+import json
+import unittest
+
+from pjecz_carina_api_key.dependencies.idempotency import (
+    REPLAYED_HEADER,
+    build_replayed_response,
+    get_idempotencia,
+    get_replayed_content,
+)
+from pjecz_carina_api_key.schemas.exh_exhortos_actualizaciones import ExhExhortoActualizacionIn
+
+
+class TestsIdempotency(unittest.TestCase):
+    """Tests Idempotency"""
+
+    def setUp(self):
+        """Preparar una actualización"""
+        self.peticion = ExhExhortoActualizacionIn(
+            exhortoId="EXH-1",
+            actualizacionOrigenId="ACT-1",
+            tipoActualizacion="AreaTurnado",
+            fechaHora="2024-01-01 10:00:00",
+            descripcion="Descripción",
+        )
+
+    def test_clave(self):
+        """La clave es siempre la llave natural, el encabezado se guarda aparte"""
+        natural = get_idempotencia(1, "actualizar", None, self.peticion, "EXH-1", " ACT-1 ")
+        self.assertEqual(natural.clave, "EXH-1|ACT-1")
+        self.assertEqual(natural.cache_key, (1, "actualizar", "EXH-1|ACT-1"))
+        self.assertIsNone(natural.idempotency_key)
+        encabezado = get_idempotencia(1, "actualizar", " abc-123 ", self.peticion, "EXH-1", "ACT-1")
+        self.assertEqual(encabezado.clave, "EXH-1|ACT-1")
+        self.assertEqual(encabezado.idempotency_key, "abc-123")
+        self.assertEqual(natural.peticion_hash, encabezado.peticion_hash)
+        self.assertIsNone(get_idempotencia(1, "actualizar", "   ", self.peticion, "EXH-1", "ACT-1").idempotency_key)
+
+    def test_reintento(self):
+        """Un reintento con los mismos datos entrega lo guardado, con otros datos entrega una falla"""
+        idempotencia = get_idempotencia(1, "actualizar", None, self.peticion, "EXH-1", "ACT-1")
+        contenido = b'{"success":true,"message":"Actualizaci\xc3\xb3n recibida con \xc3\xa9xito"}'
+        self.assertEqual(get_replayed_content(idempotencia, idempotencia.peticion_hash, None, contenido), contenido)
+        respuesta = build_replayed_response(contenido)
+        self.assertEqual(respuesta.body, contenido)
+        self.assertEqual(respuesta.headers[REPLAYED_HEADER], "true")
+        cambiada = self.peticion.model_copy(update={"descripcion": "Otra"})
+        otra = get_idempotencia(1, "actualizar", None, cambiada, "EXH-1", "ACT-1")
+        self.assertNotEqual(otra.peticion_hash, idempotencia.peticion_hash)
+        self.assertFalse(json.loads(get_replayed_content(otra, idempotencia.peticion_hash, None, contenido))["success"])
+
+    def test_otro_encabezado(self):
+        """Con otro encabezado Idempotency-Key falla, sin encabezado en alguna de las dos se entrega lo guardado"""
+        contenido = b'{"success":true}'
+        con_encabezado = get_idempotencia(1, "actualizar", "abc-123", self.peticion, "EXH-1", "ACT-1")
+        self.assertEqual(get_replayed_content(con_encabezado, con_encabezado.peticion_hash, "abc-123", contenido), contenido)
+        self.assertEqual(get_replayed_content(con_encabezado, con_encabezado.peticion_hash, None, contenido), contenido)
+        self.assertFalse(
+            json.loads(get_replayed_content(con_encabezado, con_encabezado.peticion_hash, "xyz-789", contenido))["success"]
+        )
+        sin_encabezado = get_idempotencia(1, "actualizar", None, self.peticion, "EXH-1", "ACT-1")
+        self.assertEqual(get_replayed_content(sin_encabezado, sin_encabezado.peticion_hash, "xyz-789", contenido), contenido)
+
+
+if __name__ == "__main__":
+    unittest.main()
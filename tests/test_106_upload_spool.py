@@ -0,0 +1,148 @@
+"""
+Unit test - Upload Spool
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pjecz_carina_api_key.models.exh_exhortos_archivos  # noqa: F401, para que exista la tabla en los metadatos
+from pjecz_carina_api_key.dependencies import upload_spool
+from pjecz_carina_api_key.dependencies.exceptions import MyFileCorruptedError, MyOutOfRangeParamError
+from pjecz_carina_api_key.dependencies.upload_spool import (
+    HUERFANOS_SEGUNDOS,
+    SpoolState,
+    get_retry_delay,
+    lock_spool_job,
+    process_spool_job,
+    read_spool_jobs,
+    remove_spool_job,
+    spool_file,
+)
+from pjecz_carina_api_key.settings import Settings, get_settings
+
+CONTENIDO = b"%PDF-1.4\n" + b"0123456789" * 200_000
+
+
+class TestsUploadSpool(unittest.TestCase):
+    """Tests Upload Spool"""
+
+    def setUp(self):
+        """Crear el directorio de la carga diferida"""
+        self.temporal = tempfile.TemporaryDirectory()
+        self.directorio = Path(self.temporal.name)
+
+    def tearDown(self):
+        """Borrar el directorio"""
+        self.temporal.cleanup()
+
+    def spool(self, contenido: bytes = CONTENIDO, hash_sha256: str | None = None, tamano_maximo: int = 10 * 1024 * 1024):
+        """Escribir un archivo en el directorio"""
+        return spool_file(
+            archivo=io.BytesIO(contenido),
+            directorio=self.directorio,
+            tabla="exh_exhortos_archivos",
+            registro_id=1,
+            bucket_name="deposito",
+            blob_name="exh_exhortos_archivos/2024/01/01/ABC_0001.pdf",
+            hash_sha1=hashlib.sha1(CONTENIDO).hexdigest(),
+            hash_sha256=hash_sha256,
+            tamano_maximo=tamano_maximo,
+        )
+
+    def test_spool_and_recover(self):
+        """El archivo y su JSON quedan en el directorio y se recuperan como trabajos"""
+        trabajo = self.spool()
+        self.assertEqual(trabajo.tamano, len(CONTENIDO))
+        self.assertEqual((self.directorio / f"{trabajo.nombre}.pdf").read_bytes(), CONTENIDO)
+        self.assertEqual(read_spool_jobs(self.directorio), [trabajo])
+        remove_spool_job(self.directorio, trabajo)
+        self.assertEqual(list(self.directorio.iterdir()), [])
+
+    def test_rejected_files_are_not_spooled(self):
+        """Los archivos corruptos o muy grandes no dejan nada en el directorio"""
+        with self.assertRaises(MyFileCorruptedError):
+            self.spool(CONTENIDO + b"x")
+        with self.assertRaises(MyFileCorruptedError):
+            self.spool(hash_sha256="0" * 64)
+        with self.assertRaises(MyOutOfRangeParamError):
+            self.spool(tamano_maximo=1024)
+        self.assertEqual(list(self.directorio.iterdir()), [])
+
+    def test_orphans(self):
+        """Los archivos sin JSON se borran hasta que son viejos"""
+        huerfano = self.directorio / "abc.pdf"
+        huerfano.write_bytes(b"%PDF")
+        self.assertEqual(read_spool_jobs(self.directorio), [])
+        self.assertTrue(huerfano.exists())
+        read_spool_jobs(self.directorio, ahora=time.time() + HUERFANOS_SEGUNDOS + 1)
+        self.assertFalse(huerfano.exists())
+
+    def test_lock(self):
+        """Un trabajo bloqueado o terminado no se puede volver a bloquear"""
+        trabajo = self.spool()
+        descriptor = lock_spool_job(self.directorio, trabajo)
+        self.assertIsNotNone(descriptor)
+        self.assertIsNone(lock_spool_job(self.directorio, trabajo))
+        remove_spool_job(self.directorio, trabajo)
+        os.close(descriptor)
+        self.assertIsNone(lock_spool_job(self.directorio, trabajo))
+
+    def test_retry_delay(self):
+        """La espera se duplica en cada intento hasta la máxima"""
+        settings = Settings(archivos_spool_espera=2.0, archivos_spool_espera_maxima=10.0)
+        self.assertEqual([get_retry_delay(settings, intentos) for intentos in range(1, 6)], [2.0, 4.0, 8.0, 10.0, 10.0])
+
+    def test_grace_period(self):
+        """La revisión no recupera los trabajos más recientes que la gracia, la petición puede no haber terminado"""
+        trabajo = self.spool()
+        self.assertEqual(read_spool_jobs(self.directorio, gracia=600), [])
+        self.assertEqual(read_spool_jobs(self.directorio, ahora=trabajo.creado + 600, gracia=600), [trabajo])
+
+    def test_uncommitted_reception(self):
+        """Si la recepción aún no se confirma el trabajo se conserva, al confirmarse termina, si nunca se confirma se borra"""
+        trabajo = self.spool()
+        spool = SpoolState(directorio=self.directorio, cola=asyncio.Queue())
+        filas = []  # Filas que actualiza cada UPDATE, 0 mientras el registro sigue PENDIENTE
+
+        class Sesion:
+            """Sesión que entrega la cantidad de filas actualizadas"""
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                return False
+
+            async def execute(self, _sentencia):
+                return mock.Mock(rowcount=filas.pop(0))
+
+            async def commit(self):
+                pass
+
+        def procesar(rowcount: int) -> str:
+            filas.append(rowcount)
+            return asyncio.run(process_spool_job(spool, trabajo))
+
+        with (
+            mock.patch.object(upload_spool, "upload_spooled_file", return_value="https://deposito/ABC_0001.pdf"),
+            mock.patch.object(upload_spool, "get_async_session_local", return_value=Sesion),
+        ):
+            self.assertEqual(procesar(0), "esperando")
+            self.assertEqual(read_spool_jobs(self.directorio), [trabajo])
+            self.assertEqual(procesar(1), "ok")
+            self.assertEqual(list(self.directorio.iterdir()), [])
+            trabajo = self.spool()
+            trabajo.creado -= get_settings().archivos_spool_gracia
+            self.assertEqual(procesar(0), "descartado")
+            self.assertEqual(list(self.directorio.iterdir()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
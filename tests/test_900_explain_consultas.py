@@ -0,0 +1,109 @@
+"""
+Unit test - Explain Consultas
+
+Revisa con EXPLAIN que las consultas frecuentes usen índices y no recorran las tablas completas.
+
+Necesita una base de datos PostgreSQL con las migraciones aplicadas, se omite si no están
+definidas las variables de entorno DB_HOST, DB_NAME, DB_USER y DB_PASS.
+
+Se desactiva enable_seqscan para que el planeador use un índice aunque las tablas tengan
+pocos registros, si aún así elige Seq Scan es porque no hay un índice que sirva.
+"""
+
+import os
+import unittest
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql
+
+import pjecz_carina_api_key.main  # noqa: F401, para que se configuren todos los modelos
+from pjecz_carina_api_key.dependencies.archivos_contadores import select_archivos_pendientes
+from pjecz_carina_api_key.models.exh_exhortos import ExhExhorto
+from pjecz_carina_api_key.models.exh_exhortos_archivos import ExhExhortoArchivo
+from pjecz_carina_api_key.models.exh_exhortos_archivos_cargas import ExhExhortoArchivoCarga
+from pjecz_carina_api_key.models.exh_exhortos_partes import ExhExhortoParte
+from pjecz_carina_api_key.models.exh_exhortos_promociones import ExhExhortoPromocion
+from pjecz_carina_api_key.models.exh_exhortos_promociones_archivos import ExhExhortoPromocionArchivo
+from pjecz_carina_api_key.models.exh_exhortos_respuestas import ExhExhortoRespuesta
+from pjecz_carina_api_key.models.exh_exhortos_respuestas_archivos import ExhExhortoRespuestaArchivo
+from pjecz_carina_api_key.models.exh_idempotencias import ExhIdempotencia
+
+load_dotenv()
+DB_VARIABLES = ("DB_HOST", "DB_NAME", "DB_USER", "DB_PASS")
+
+# Consultas de las rutas, con valores de ejemplo
+CONSULTAS = {
+    "exhorto por exhorto_origen_id": select(ExhExhorto).filter_by(exhorto_origen_id="ABC123").filter_by(estatus="A"),
+    "exhorto por folio_seguimiento": select(ExhExhorto).filter_by(folio_seguimiento="ABC123").filter_by(estatus="A"),
+    "partes de los exhortos": select(ExhExhortoParte).where(ExhExhortoParte.exh_exhorto_id.in_([1, 2, 3])),
+    "archivos de un exhorto": select(ExhExhortoArchivo).filter_by(exh_exhorto_id=1).filter_by(estatus="A"),
+    "archivos pendientes de un exhorto": select_archivos_pendientes(
+        ExhExhortoArchivo, ExhExhortoArchivo.exh_exhorto_id, 1, "archivo.pdf"
+    ),
+    "respuesta por respuesta_origen_id": select(ExhExhortoRespuesta)
+    .join(ExhExhorto)
+    .filter(ExhExhorto.exhorto_origen_id == "ABC123")
+    .filter(ExhExhortoRespuesta.respuesta_origen_id == "DEF456")
+    .filter(ExhExhortoRespuesta.estatus == "A"),
+    "archivos pendientes de una respuesta": select_archivos_pendientes(
+        ExhExhortoRespuestaArchivo, ExhExhortoRespuestaArchivo.exh_exhorto_respuesta_id, 1, "archivo.pdf"
+    ),
+    "promoción por folio_origen_promocion": select(ExhExhortoPromocion)
+    .join(ExhExhorto)
+    .filter(ExhExhorto.folio_seguimiento == "ABC123")
+    .filter(ExhExhortoPromocion.folio_origen_promocion == "DEF456")
+    .filter(ExhExhortoPromocion.estatus == "A"),
+    "archivos pendientes de una promoción": select_archivos_pendientes(
+        ExhExhortoPromocionArchivo, ExhExhortoPromocionArchivo.exh_exhorto_promocion_id, 1, "archivo.pdf"
+    ),
+    "sesiones de carga vencidas": select(ExhExhortoArchivoCarga.id)
+    .where(ExhExhortoArchivoCarga.estado == "ABIERTA")
+    .where(ExhExhortoArchivoCarga.creado < text("localtimestamp - interval '1 day'"))
+    .order_by(ExhExhortoArchivoCarga.creado)
+    .limit(10),
+    "respuesta guardada para un reintento": select(ExhIdempotencia.peticion_hash, ExhIdempotencia.respuesta)
+    .filter_by(usuario_id=1)
+    .filter_by(ruta="recibir")
+    .filter_by(clave="ABC123"),
+}
+
+
+def get_seq_scans(plan: dict) -> list[str]:
+    """Entregar las tablas que se recorren completas en el plan y en sus subplanes"""
+    tablas = []
+    if plan.get("Node Type") == "Seq Scan":
+        tablas.append(plan["Relation Name"])
+    for subplan in plan.get("Plans", []):
+        tablas.extend(get_seq_scans(subplan))
+    return tablas
+
+
+@unittest.skipIf(any(os.getenv(variable, "") == "" for variable in DB_VARIABLES), "Faltan las variables DB_*")
+class TestsExplainConsultas(unittest.TestCase):
+    """Tests Explain Consultas"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine(
+            f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}"
+            f":{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME')}"
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+
+    def test_consultas_usan_indices(self):
+        """Ninguna consulta frecuente debe recorrer una tabla completa"""
+        with self.engine.begin() as conn:
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for nombre, consulta in CONSULTAS.items():
+                with self.subTest(consulta=nombre):
+                    sql = consulta.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+                    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()[0]["Plan"]
+                    self.assertEqual(get_seq_scans(plan), [], f"Seq Scan en {nombre}")
+
+
+if __name__ == "__main__":
+    unittest.main()